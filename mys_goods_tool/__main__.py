@@ -1,27 +1,33 @@
 from argparse import ArgumentParser
-from typing import Optional
+from importlib import import_module
+from typing import Optional, TYPE_CHECKING
 
-from textual.app import App
+from mys_goods_tool.import_profile import ImportTimer, format_report
 
-import mys_goods_tool.user_data
-from mys_goods_tool.exchange_mode import exchange_mode_simple
-from mys_goods_tool.user_data import load_config
+if TYPE_CHECKING:
+    from textual.app import App
 
 USAGE = """
 Mys_Goods_Tool
 使用说明：
-%(prog)s [-m <运行模式>] [-c <用户数据文件路径>]
+%(prog)s [-m <运行模式>] [-c <用户数据文件路径>] [--import-time]
 选项：
     -h, --help 显示此帮助信息
     -m, --mode <参数> 指定运行模式
         guide TUI指引模式，包含登陆绑定、管理兑换计划和开始兑换等功能（默认）
         exchange-simple 兑换模式，无TUI界面，仅输出日志文本
+        coordinator 多节点协调服务器，监听偏好设置 coordination_backend 中的 tcp:// 地址
     -c, --conf <参数> 指定用户数据文件路径
+    --import-time 只导入所选运行模式需要的模块并输出各模块的导入耗时，不运行程序（用于排查启动缓慢）
 例如：
     %(prog)s -m exchange-simple -c ./workplace/user_data.json
         通过该命令运行本程序，将读取 ./workplace/user_data.json 用户数据文件，并直接进入无TUI界面的兑换模式，等待到达兑换时间并执行兑换。
     %(prog)s
         通过该命令运行本程序或直接双击打开程序，将读取程序目录下的用户数据文件user_data.json，并提供登录绑定、管理兑换计划等功能。
+    %(prog)s -m coordinator
+        在多台主机上使用同一份兑换计划时，在其中一台主机上运行协调服务器，其他主机的兑换模式将共同分配兑换请求的发送时刻，并在任一主机兑换成功后停止兑换。
+    %(prog)s -m exchange-simple --import-time
+        输出无TUI界面的兑换模式启动时各模块的导入耗时。
         """.strip()
 
 
@@ -32,30 +38,52 @@ class ArgumentParserWithHelp(ArgumentParser):
 
 
 arg_parser = ArgumentParserWithHelp(description="Mys_Goods_Tool", usage=USAGE)
-arg_parser.add_argument("-m", "--mode", dest="mode", choices=["guide", "exchange-simple"],
+arg_parser.add_argument("-m", "--mode", dest="mode", choices=["guide", "exchange-simple", "coordinator"],
                         default="guide")
 arg_parser.add_argument("-c", "--conf", type=str, dest="conf", default=None)
+arg_parser.add_argument("--import-time", action="store_true", dest="import_time", default=False)
+
+MODE_MODULES = {
+    "guide": "mys_goods_tool.tui",
+    "exchange-simple": "mys_goods_tool.exchange_mode",
+    "coordinator": "mys_goods_tool.coordination"
+}
+"""各运行模式需要导入的模块（无TUI界面的模式不会导入 Textual）"""
 
 TEXTUAL_DEBUG = False
 
 
-def main(textual_app: Optional[App] = None):
+def main(textual_app: Optional["App"] = None):
     arg = arg_parser.parse_args()
 
+    timer = ImportTimer()
+    if arg.import_time:
+        timer.install()
+    # 用户数据文件在首次使用时才读取，因此只需在此之前指定路径
+    from mys_goods_tool.user_data import context
     if arg.conf is not None:
-        mys_goods_tool.user_data.CONFIG_PATH = arg.conf
-        mys_goods_tool.user_data.config, mys_goods_tool.user_data.different_device_and_salt = load_config()
+        context.config_path = arg.conf
+    if arg.import_time:
+        import_module(MODE_MODULES[arg.mode])
+        timer.uninstall()
+        print(format_report(timer.records))
+        return
+
     if arg.mode == "guide":
         if textual_app is None:
             from mys_goods_tool.tui import TuiApp
             textual_app = TuiApp()
         textual_app.run()
     elif arg.mode == "exchange-simple":
+        from mys_goods_tool.exchange_mode import exchange_mode_simple
         exchange_mode_simple()
+    elif arg.mode == "coordinator":
+        from mys_goods_tool.coordination import serve
+        serve()
 
 
 if __name__ == "__main__":
-    app: Optional[App] = None
+    app: Optional["App"] = None
     if TEXTUAL_DEBUG:
         from mys_goods_tool.tui import TuiApp
 
@@ -0,0 +1,165 @@
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from mys_goods_tool import api
+from mys_goods_tool.data_model import BaseApiStatus, GameRecord, Address
+from mys_goods_tool.user_data import config as conf, UserAccount
+
+_T = TypeVar("_T")
+
+
+class AccountDataCache:
+    """
+    按米游社账号（bbs_uid）缓存账号数据（游戏账号、收货地址、米游币数量）
+
+    - 只缓存获取成功的数据，有效时间为 `preference.account_cache_ttl`
+    - 同一事件循环中同时获取同一账号的同一种数据时，共用一个正在进行的请求
+    - 登录或刷新 Cookies 后需要调用 `invalidate` 使该账号的缓存失效，失效前发出的请求的结果不会再写入缓存
+
+    >>> cache = AccountDataCache(ttl=60)
+    >>> from mys_goods_tool.user_data import BBSCookies
+    >>> account = UserAccount(cookies=BBSCookies(stuid="1"))
+    >>> calls = []
+    >>> async def fetch(_: UserAccount):
+    ...     calls.append(1)
+    ...     await asyncio.sleep(0)
+    ...     return BaseApiStatus(success=True), len(calls)
+    >>> async def main():
+    ...     coalesced = await asyncio.gather(*[cache.get("points", account, fetch) for _ in range(3)])
+    ...     cached = await cache.get("points", account, fetch)
+    ...     cache.invalidate(account.bbs_uid)
+    ...     refreshed = await cache.get("points", account, fetch)
+    ...     return [x[1] for x in coalesced], cached[1], refreshed[1]
+    >>> asyncio.run(main())
+    ([1, 1, 1], 1, 2)
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        """
+        :param ttl: 缓存有效时间（单位：秒），为空则使用 `preference.account_cache_ttl`
+        """
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+        """(bbs_uid, 数据类型) -> (获取时间, 数据)"""
+        self._in_flight: Dict[Tuple[str, str], asyncio.Task] = {}
+        """(bbs_uid, 数据类型) -> 正在进行的请求"""
+        self._generations: Dict[str, int] = {}
+        """bbs_uid -> 缓存失效次数"""
+
+    @property
+    def ttl(self) -> float:
+        """
+        缓存有效时间（单位：秒）
+        """
+        return conf.preference.account_cache_ttl if self._ttl is None else self._ttl
+
+    async def get(self,
+                  kind: str,
+                  account: UserAccount,
+                  fetch: Callable[[UserAccount], Awaitable[Tuple[BaseApiStatus, _T]]],
+                  force: bool = False) -> Tuple[BaseApiStatus, _T]:
+        """
+        获取账号数据，缓存有效时直接返回缓存的数据
+
+        :param kind: 数据类型
+        :param account: 用户账号
+        :param fetch: 获取数据的API函数
+        :param force: 是否忽略缓存的数据（仍会共用正在进行的请求）
+        """
+        key = account.bbs_uid, kind
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            cached = self._values.get(key)
+            if not force and cached is not None and time.time() - cached[0] <= self.ttl:
+                return BaseApiStatus(success=True), cached[1]
+            task = self._in_flight.get(key)
+            # 不同事件循环（如预检任务所在的线程）中的请求无法共用
+            if task is None or task.get_loop() is not loop:
+                generation = self._generations.get(account.bbs_uid, 0)
+                task = loop.create_task(self._fetch(key, account, fetch, generation))
+                self._in_flight[key] = task
+        return await asyncio.shield(task)
+
+    async def _fetch(self,
+                     key: Tuple[str, str],
+                     account: UserAccount,
+                     fetch: Callable[[UserAccount], Awaitable[Tuple[BaseApiStatus, _T]]],
+                     generation: int) -> Tuple[BaseApiStatus, _T]:
+        """
+        发出请求，获取成功时写入缓存
+
+        :param key: (bbs_uid, 数据类型)
+        :param account: 用户账号
+        :param fetch: 获取数据的API函数
+        :param generation: 发出请求时该账号的缓存失效次数
+        """
+        try:
+            status, data = await fetch(account)
+        finally:
+            with self._lock:
+                if self._in_flight.get(key) is asyncio.current_task():
+                    self._in_flight.pop(key)
+        with self._lock:
+            if status and self._generations.get(account.bbs_uid, 0) == generation:
+                self._values[key] = time.time(), data
+        return status, data
+
+    def invalidate(self, bbs_uid: Optional[str] = None):
+        """
+        使账号的缓存失效
+
+        :param bbs_uid: 米游社UID，为空则使所有账号的缓存失效
+        """
+        with self._lock:
+            if bbs_uid is None:
+                uids = set(self._generations) | {key[0] for key in [*self._values, *self._in_flight]}
+            else:
+                uids = {bbs_uid}
+            for key in list(self._values):
+                if key[0] in uids:
+                    self._values.pop(key)
+            for key in list(self._in_flight):
+                if key[0] in uids:
+                    self._in_flight.pop(key)
+            for uid in uids:
+                self._generations[uid] = self._generations.get(uid, 0) + 1
+
+
+account_cache = AccountDataCache()
+"""账号数据缓存"""
+
+
+async def get_game_record(account: UserAccount, force: bool = False) -> Tuple[
+    BaseApiStatus, Optional[List[GameRecord]]]:
+    """
+    获取用户绑定的游戏账户信息（使用账号数据缓存）
+
+    :param account: 用户账户数据
+    :param force: 是否忽略缓存的数据
+    """
+    status, record_list = await account_cache.get("game_record", account, api.get_game_record, force)
+    return status, None if record_list is None else list(record_list)
+
+
+async def get_address(account: UserAccount, force: bool = False) -> Tuple[BaseApiStatus, Optional[List[Address]]]:
+    """
+    获取用户的地址数据（使用账号数据缓存）
+
+    :param account: 用户账户数据
+    :param force: 是否忽略缓存的数据
+    """
+    status, address_list = await account_cache.get("address", account, api.get_address, force)
+    return status, None if address_list is None else list(address_list)
+
+
+async def get_user_myb(account: UserAccount, force: bool = False) -> Tuple[BaseApiStatus, Optional[int]]:
+    """
+    获取用户当前米游币数量（使用账号数据缓存）
+
+    :param account: 用户账户数据
+    :param force: 是否忽略缓存的数据
+    """
+    return await account_cache.get("myb", account, api.get_user_myb, force)
@@ -1,5 +1,8 @@
+import asyncio
+import math
+import threading
 import time
-from typing import List, Optional, Tuple, Dict, Any, Union, Type
+from typing import List, Optional, Tuple, Dict, Any, Union, Type, NamedTuple, Literal, Callable
 from urllib.parse import urlencode
 
 import httpx
@@ -7,12 +10,15 @@ import tenacity
 from pydantic import ValidationError, BaseModel
 from requests.utils import dict_from_cookiejar
 
+from mys_goods_tool.connection import RequestTrace, http_clients
 from mys_goods_tool.data_model import GameRecord, GameInfo, Good, Address, BaseApiStatus, MmtData, GeetestResult, \
     GetCookieStatus, \
     CreateMobileCaptchaStatus, GetGoodDetailStatus, ExchangeStatus, GeetestResultV4, GetFpStatus
-from mys_goods_tool.user_data import config as conf, UserAccount, BBSCookies, ExchangePlan, ExchangeResult
+from mys_goods_tool.json_backend import loads, dumps
+from mys_goods_tool.user_data import config as conf, UserAccount, BBSCookies, ExchangePlan, ExchangeResult, \
+    DeviceConfig
 from mys_goods_tool.utils import generate_device_id, logger, generate_ds, Subscribe, \
-    NtpTime, get_async_retry, generate_seed_id, generate_fp_locally
+    NtpTime, get_async_retry, generate_seed_id, generate_fp_locally, exchange_logger, RawText
 
 URL_LOGIN_TICKET_BY_CAPTCHA = "https://webapi.account.mihoyo.com/Api/login_by_mobilecaptcha"
 URL_LOGIN_TICKET_BY_PASSWORD = "https://webapi.account.mihoyo.com/Api/login_by_password"
@@ -38,203 +44,274 @@ URL_CREATE_MOBILE_CAPTCHA = "https://webapi.account.mihoyo.com/Api/create_mobile
 URL_GET_USER_INFO = "https://bbs-api.miyoushe.com/user/api/getUserFullInfo?uid={uid}"
 URL_GET_DEVICE_FP = "https://public-data-api.mihoyo.com/device-fp/api/getFp"
 
-HEADERS_WEBAPI = {
-    "Host": "webapi.account.mihoyo.com",
-    "Connection": "keep-alive",
-    "sec-ch-ua": conf.device_config.UA,
-    "DNT": "1",
-    "x-rpc-device_model": conf.device_config.X_RPC_DEVICE_MODEL_PC,
-    "sec-ch-ua-mobile": "?0",
-    "User-Agent": conf.device_config.USER_AGENT_PC,
-    "x-rpc-device_id": None,
-    "Accept": "application/json, text/plain, */*",
-    "x-rpc-device_name": conf.device_config.X_RPC_DEVICE_NAME_PC,
-    "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-    "x-rpc-client_type": "4",
-    "sec-ch-ua-platform": conf.device_config.UA_PLATFORM,
-    "Origin": "https://user.mihoyo.com",
-    "Sec-Fetch-Site": "same-site",
-    "Sec-Fetch-Mode": "cors",
-    "Sec-Fetch-Dest": "empty",
-    "Referer": "https://user.mihoyo.com/",
-    "Accept-Encoding": "gzip, deflate, br",
-    "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6"
-}
-HEADERS_PASSPORT_API = {
-    "Host": "passport-api.mihoyo.com",
-    "Content-Type": "application/json",
-    "Accept": "*/*",
-    # "x-rpc-device_fp": "",
-    "x-rpc-client_type": "1",
-    "x-rpc-device_id": None,
-    # "x-rpc-app_id": "bll8iq97cem8",
-    "Accept-Language": "zh-CN,zh-Hans;q=0.9",
-    "x-rpc-game_biz": "bbs_cn",
-    "Accept-Encoding": "gzip, deflate, br",
-    "x-rpc-device_model": conf.device_config.X_RPC_DEVICE_MODEL_MOBILE,
-    "User-Agent": conf.device_config.USER_AGENT_OTHER,
-    "x-rpc-device_name": conf.device_config.X_RPC_DEVICE_NAME_MOBILE,
-    "x-rpc-app_version": conf.device_config.X_RPC_APP_VERSION,
-    # 抓包时 "2.47.1"
-
-    "x-rpc-sdk_version": "1.6.1",
-    "Connection": "keep-alive",
-    "x-rpc-sys_version": conf.device_config.X_RPC_SYS_VERSION
-}
-HEADERS_API_TAKUMI_PC = {
-    "Host": "api-takumi.mihoyo.com",
-    "Content-Type": "application/json;charset=utf-8",
-    "Origin": "https://bbs.mihoyo.com",
-    "Accept-Encoding": "gzip, deflate, br",
-    "Connection": "keep-alive",
-    "Accept": "application/json, text/plain, */*",
-    "User-Agent": conf.device_config.USER_AGENT_PC,
-    "Referer": "https://bbs.mihoyo.com/",
-    "Accept-Language": "zh-CN,zh-Hans;q=0.9"
-}
-HEADERS_ACTION_TICKET = {
-    "Host": "api-takumi.mihoyo.com",
-    "x-rpc-device_model": conf.device_config.X_RPC_DEVICE_MODEL_MOBILE,
-    "User-Agent": conf.device_config.USER_AGENT_OTHER,
-    "Referer": "https://webstatic.mihoyo.com/",
-    "x-rpc-device_name": conf.device_config.X_RPC_DEVICE_NAME_MOBILE,
-    "Origin": "https://webstatic.mihoyo.com",
-    "Content-Length": "66",
-    "Connection": "keep-alive",
-    "x-rpc-channel": conf.device_config.X_RPC_CHANNEL,
-    "x-rpc-app_version": conf.device_config.X_RPC_APP_VERSION,
-    "Accept-Language": "zh-CN,zh-Hans;q=0.9",
-    "DS": None,
-    "x-rpc-device_id": None,
-    "x-rpc-client_type": "5",
-    "Accept": "application/json, text/plain, */*",
-    "Content-Type": "application/json;charset=utf-8",
-    "Accept-Encoding": "gzip, deflate, br",
-    "x-rpc-sys_version": conf.device_config.X_RPC_SYS_VERSION,
-    "x-rpc-platform": conf.device_config.X_RPC_PLATFORM
-}
-HEADERS_GAME_RECORD = {
-    "Host": "api-takumi-record.mihoyo.com",
-    "Origin": "https://webstatic.mihoyo.com",
-    "Connection": "keep-alive",
-    "Accept": "application/json, text/plain, */*",
-    "User-Agent": conf.device_config.USER_AGENT_MOBILE,
-    "Accept-Language": "zh-CN,zh-Hans;q=0.9",
-    "Referer": "https://webstatic.mihoyo.com/",
-    "Accept-Encoding": "gzip, deflate, br"
-}
-HEADERS_GAME_LIST = {
-    "Host": "bbs-api.mihoyo.com",
-    "DS": None,
-    "Accept": "*/*",
-    "x-rpc-device_id": generate_device_id(),
-    "x-rpc-client_type": "1",
-    "x-rpc-channel": conf.device_config.X_RPC_CHANNEL,
-    "Accept-Language": "zh-CN,zh-Hans;q=0.9",
-    "Accept-Encoding": "gzip, deflate, br",
-    "x-rpc-sys_version": conf.device_config.X_RPC_SYS_VERSION,
-    "Referer": "https://app.mihoyo.com",
-    "x-rpc-device_name": conf.device_config.X_RPC_DEVICE_NAME_MOBILE,
-    "x-rpc-app_version": conf.device_config.X_RPC_APP_VERSION,
-    "User-Agent": conf.device_config.USER_AGENT_OTHER,
-    "Connection": "keep-alive",
-    "x-rpc-device_model": conf.device_config.X_RPC_DEVICE_MODEL_MOBILE
-}
-HEADERS_MYB = {
-    "Host": "api-takumi.mihoyo.com",
-    "Origin": "https://webstatic.mihoyo.com",
-    "Connection": "keep-alive",
-    "Accept": "application/json, text/plain, */*",
-    "User-Agent": conf.device_config.USER_AGENT_MOBILE,
-    "Accept-Language": "zh-CN,zh-Hans;q=0.9",
-    "Referer": "https://webstatic.mihoyo.com/",
-    "Accept-Encoding": "gzip, deflate, br"
-}
-HEADERS_DEVICE = {
-    "DS": None,
-    "x-rpc-client_type": "2",
-    "x-rpc-app_version": conf.device_config.X_RPC_APP_VERSION,
-    "x-rpc-sys_version": conf.device_config.X_RPC_SYS_VERSION_ANDROID,
-    "x-rpc-channel": conf.device_config.X_RPC_CHANNEL_ANDROID,
-    "x-rpc-device_id": None,
-    "x-rpc-device_name": conf.device_config.X_RPC_DEVICE_NAME_ANDROID,
-    "x-rpc-device_model": conf.device_config.X_RPC_DEVICE_MODEL_ANDROID,
-    "Referer": "https://app.mihoyo.com",
-    "Content-Type": "application/json; charset=UTF-8",
-    "Host": "bbs-api.mihoyo.com",
-    "Connection": "Keep-Alive",
-    "Accept-Encoding": "gzip",
-    "User-Agent": conf.device_config.USER_AGENT_ANDROID_OTHER
-}
-HEADERS_GOOD_LIST = {
-    "Host":
-        "api-takumi.mihoyo.com",
-    "Accept":
-        "application/json, text/plain, */*",
-    "Origin":
-        "https://user.mihoyo.com",
-    "Connection":
-        "keep-alive",
-    "x-rpc-device_id": generate_device_id(),
-    "x-rpc-client_type":
-        "5",
-    "User-Agent":
-        conf.device_config.USER_AGENT_MOBILE,
-    "Referer":
-        "https://user.mihoyo.com/",
-    "Accept-Language":
-        "zh-CN,zh-Hans;q=0.9",
-    "Accept-Encoding":
-        "gzip, deflate, br"
-}
-HEADERS_EXCHANGE = {
-    "Accept":
-        "application/json, text/plain, */*",
-    "Accept-Encoding":
-        "gzip, deflate, br",
-    "Accept-Language":
-        "zh-CN,zh-Hans;q=0.9",
-    "Connection":
-        "keep-alive",
-    "Content-Type":
-        "application/json;charset=utf-8",
-    "Host":
-        "api-takumi.miyoushe.com",
-    "Origin":
-        "https://webstatic.miyoushe.com",
-    "Referer":
-        "https://webstatic.miyoushe.com/",
-    "User-Agent":
-        conf.device_config.USER_AGENT_MOBILE,
-    "x-rpc-app_version":
-        conf.device_config.X_RPC_APP_VERSION,
-    "x-rpc-channel":
-        "appstore",
-    "x-rpc-client_type":
-        "1",
-    "x-rpc-verify_key":
-        "bll8iq97cem8",
-    "x-rpc-device_fp": None,
-    "x-rpc-device_id": None,
-    "x-rpc-device_model":
-        conf.device_config.X_RPC_DEVICE_MODEL_MOBILE,
-    "x-rpc-device_name":
-        conf.device_config.X_RPC_DEVICE_NAME_MOBILE,
-    "x-rpc-sys_version":
-        conf.device_config.X_RPC_SYS_VERSION
-}
-HEADERS_ADDRESS = {
-    "Host": "api-takumi.mihoyo.com",
-    "Accept": "application/json, text/plain, */*",
-    "Origin": "https://user.mihoyo.com",
-    "Connection": "keep-alive",
-    "x-rpc-device_id": None,
-    "x-rpc-client_type": "5",
-    "User-Agent": conf.device_config.USER_AGENT_MOBILE,
-    "Referer": "https://user.mihoyo.com/",
-    "Accept-Language": "zh-CN,zh-Hans;q=0.9",
-    "Accept-Encoding": "gzip, deflate, br"
-}
+GOOD_LIST_PAGE_SIZE = 20
+"""商品信息列表每页的商品数（与 URL_GOOD_LIST 中的 page_size 一致）"""
+GOOD_LIST_CONCURRENCY = 5
+"""获取商品信息列表时的最大并发请求数"""
+
+
+def _build_headers(device_config: DeviceConfig) -> Dict[str, Dict[str, Any]]:
+    """
+    根据设备信息生成所有请求头模板
+
+    :param device_config: 设备信息
+    """
+    return {
+        "WEBAPI": {
+            "Host": "webapi.account.mihoyo.com",
+            "Connection": "keep-alive",
+            "sec-ch-ua": device_config.UA,
+            "DNT": "1",
+            "x-rpc-device_model": device_config.X_RPC_DEVICE_MODEL_PC,
+            "sec-ch-ua-mobile": "?0",
+            "User-Agent": device_config.USER_AGENT_PC,
+            "x-rpc-device_id": None,
+            "Accept": "application/json, text/plain, */*",
+            "x-rpc-device_name": device_config.X_RPC_DEVICE_NAME_PC,
+            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+            "x-rpc-client_type": "4",
+            "sec-ch-ua-platform": device_config.UA_PLATFORM,
+            "Origin": "https://user.mihoyo.com",
+            "Sec-Fetch-Site": "same-site",
+            "Sec-Fetch-Mode": "cors",
+            "Sec-Fetch-Dest": "empty",
+            "Referer": "https://user.mihoyo.com/",
+            "Accept-Encoding": "gzip, deflate, br",
+            "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6"
+        },
+        "PASSPORT_API": {
+            "Host": "passport-api.mihoyo.com",
+            "Content-Type": "application/json",
+            "Accept": "*/*",
+            # "x-rpc-device_fp": "",
+            "x-rpc-client_type": "1",
+            "x-rpc-device_id": None,
+            # "x-rpc-app_id": "bll8iq97cem8",
+            "Accept-Language": "zh-CN,zh-Hans;q=0.9",
+            "x-rpc-game_biz": "bbs_cn",
+            "Accept-Encoding": "gzip, deflate, br",
+            "x-rpc-device_model": device_config.X_RPC_DEVICE_MODEL_MOBILE,
+            "User-Agent": device_config.USER_AGENT_OTHER,
+            "x-rpc-device_name": device_config.X_RPC_DEVICE_NAME_MOBILE,
+            "x-rpc-app_version": device_config.X_RPC_APP_VERSION,
+            # 抓包时 "2.47.1"
+
+            "x-rpc-sdk_version": "1.6.1",
+            "Connection": "keep-alive",
+            "x-rpc-sys_version": device_config.X_RPC_SYS_VERSION
+        },
+        "API_TAKUMI_PC": {
+            "Host": "api-takumi.mihoyo.com",
+            "Content-Type": "application/json;charset=utf-8",
+            "Origin": "https://bbs.mihoyo.com",
+            "Accept-Encoding": "gzip, deflate, br",
+            "Connection": "keep-alive",
+            "Accept": "application/json, text/plain, */*",
+            "User-Agent": device_config.USER_AGENT_PC,
+            "Referer": "https://bbs.mihoyo.com/",
+            "Accept-Language": "zh-CN,zh-Hans;q=0.9"
+        },
+        "ACTION_TICKET": {
+            "Host": "api-takumi.mihoyo.com",
+            "x-rpc-device_model": device_config.X_RPC_DEVICE_MODEL_MOBILE,
+            "User-Agent": device_config.USER_AGENT_OTHER,
+            "Referer": "https://webstatic.mihoyo.com/",
+            "x-rpc-device_name": device_config.X_RPC_DEVICE_NAME_MOBILE,
+            "Origin": "https://webstatic.mihoyo.com",
+            "Content-Length": "66",
+            "Connection": "keep-alive",
+            "x-rpc-channel": device_config.X_RPC_CHANNEL,
+            "x-rpc-app_version": device_config.X_RPC_APP_VERSION,
+            "Accept-Language": "zh-CN,zh-Hans;q=0.9",
+            "DS": None,
+            "x-rpc-device_id": None,
+            "x-rpc-client_type": "5",
+            "Accept": "application/json, text/plain, */*",
+            "Content-Type": "application/json;charset=utf-8",
+            "Accept-Encoding": "gzip, deflate, br",
+            "x-rpc-sys_version": device_config.X_RPC_SYS_VERSION,
+            "x-rpc-platform": device_config.X_RPC_PLATFORM
+        },
+        "GAME_RECORD": {
+            "Host": "api-takumi-record.mihoyo.com",
+            "Origin": "https://webstatic.mihoyo.com",
+            "Connection": "keep-alive",
+            "Accept": "application/json, text/plain, */*",
+            "User-Agent": device_config.USER_AGENT_MOBILE,
+            "Accept-Language": "zh-CN,zh-Hans;q=0.9",
+            "Referer": "https://webstatic.mihoyo.com/",
+            "Accept-Encoding": "gzip, deflate, br"
+        },
+        "GAME_LIST": {
+            "Host": "bbs-api.mihoyo.com",
+            "DS": None,
+            "Accept": "*/*",
+            "x-rpc-device_id": generate_device_id(),
+            "x-rpc-client_type": "1",
+            "x-rpc-channel": device_config.X_RPC_CHANNEL,
+            "Accept-Language": "zh-CN,zh-Hans;q=0.9",
+            "Accept-Encoding": "gzip, deflate, br",
+            "x-rpc-sys_version": device_config.X_RPC_SYS_VERSION,
+            "Referer": "https://app.mihoyo.com",
+            "x-rpc-device_name": device_config.X_RPC_DEVICE_NAME_MOBILE,
+            "x-rpc-app_version": device_config.X_RPC_APP_VERSION,
+            "User-Agent": device_config.USER_AGENT_OTHER,
+            "Connection": "keep-alive",
+            "x-rpc-device_model": device_config.X_RPC_DEVICE_MODEL_MOBILE
+        },
+        "MYB": {
+            "Host": "api-takumi.mihoyo.com",
+            "Origin": "https://webstatic.mihoyo.com",
+            "Connection": "keep-alive",
+            "Accept": "application/json, text/plain, */*",
+            "User-Agent": device_config.USER_AGENT_MOBILE,
+            "Accept-Language": "zh-CN,zh-Hans;q=0.9",
+            "Referer": "https://webstatic.mihoyo.com/",
+            "Accept-Encoding": "gzip, deflate, br"
+        },
+        "DEVICE": {
+            "DS": None,
+            "x-rpc-client_type": "2",
+            "x-rpc-app_version": device_config.X_RPC_APP_VERSION,
+            "x-rpc-sys_version": device_config.X_RPC_SYS_VERSION_ANDROID,
+            "x-rpc-channel": device_config.X_RPC_CHANNEL_ANDROID,
+            "x-rpc-device_id": None,
+            "x-rpc-device_name": device_config.X_RPC_DEVICE_NAME_ANDROID,
+            "x-rpc-device_model": device_config.X_RPC_DEVICE_MODEL_ANDROID,
+            "Referer": "https://app.mihoyo.com",
+            "Content-Type": "application/json; charset=UTF-8",
+            "Host": "bbs-api.mihoyo.com",
+            "Connection": "Keep-Alive",
+            "Accept-Encoding": "gzip",
+            "User-Agent": device_config.USER_AGENT_ANDROID_OTHER
+        },
+        "GOOD_LIST": {
+            "Host":
+                "api-takumi.mihoyo.com",
+            "Accept":
+                "application/json, text/plain, */*",
+            "Origin":
+                "https://user.mihoyo.com",
+            "Connection":
+                "keep-alive",
+            "x-rpc-device_id": generate_device_id(),
+            "x-rpc-client_type":
+                "5",
+            "User-Agent":
+                device_config.USER_AGENT_MOBILE,
+            "Referer":
+                "https://user.mihoyo.com/",
+            "Accept-Language":
+                "zh-CN,zh-Hans;q=0.9",
+            "Accept-Encoding":
+                "gzip, deflate, br"
+        },
+        "EXCHANGE": {
+            "Accept":
+                "application/json, text/plain, */*",
+            "Accept-Encoding":
+                "gzip, deflate, br",
+            "Accept-Language":
+                "zh-CN,zh-Hans;q=0.9",
+            "Connection":
+                "keep-alive",
+            "Content-Type":
+                "application/json;charset=utf-8",
+            "Host":
+                "api-takumi.miyoushe.com",
+            "Origin":
+                "https://webstatic.miyoushe.com",
+            "Referer":
+                "https://webstatic.miyoushe.com/",
+            "User-Agent":
+                device_config.USER_AGENT_MOBILE,
+            "x-rpc-app_version":
+                device_config.X_RPC_APP_VERSION,
+            "x-rpc-channel":
+                "appstore",
+            "x-rpc-client_type":
+                "1",
+            "x-rpc-verify_key":
+                "bll8iq97cem8",
+            "x-rpc-device_fp": None,
+            "x-rpc-device_id": None,
+            "x-rpc-device_model":
+                device_config.X_RPC_DEVICE_MODEL_MOBILE,
+            "x-rpc-device_name":
+                device_config.X_RPC_DEVICE_NAME_MOBILE,
+            "x-rpc-sys_version":
+                device_config.X_RPC_SYS_VERSION
+        },
+        "ADDRESS": {
+            "Host": "api-takumi.mihoyo.com",
+            "Accept": "application/json, text/plain, */*",
+            "Origin": "https://user.mihoyo.com",
+            "Connection": "keep-alive",
+            "x-rpc-device_id": None,
+            "x-rpc-client_type": "5",
+            "User-Agent": device_config.USER_AGENT_MOBILE,
+            "Referer": "https://user.mihoyo.com/",
+            "Accept-Language": "zh-CN,zh-Hans;q=0.9",
+            "Accept-Encoding": "gzip, deflate, br"
+        }
+    }
+
+
+class HeaderTemplates:
+    """
+    请求头模板
+
+    首次使用时才根据设备信息 device_config 生成，设备信息被替换或修改后自动重新生成。
+    模板为共享的字典，需要修改时应先复制
+
+    >>> from mys_goods_tool.user_data import DeviceConfig
+    >>> device_config = DeviceConfig()
+    >>> templates = HeaderTemplates(lambda: device_config)
+    >>> templates["EXCHANGE"]["User-Agent"] == device_config.USER_AGENT_MOBILE
+    True
+    >>> device_config.USER_AGENT_MOBILE = "Test"
+    >>> templates["EXCHANGE"]["User-Agent"]
+    'Test'
+    """
+
+    def __init__(self, device_config: Callable[[], DeviceConfig] = lambda: conf.device_config):
+        """
+        :param device_config: 获取当前设备信息的函数
+        """
+        self._device_config = device_config
+        self._snapshot: Optional[Tuple[Any, ...]] = None
+        self._templates: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> Dict[str, Any]:
+        """
+        获取请求头模板
+
+        :param name: 模板名称（如 EXCHANGE）
+        """
+        device_config = self._device_config()
+        snapshot = tuple(device_config.__dict__.values())
+        if snapshot != self._snapshot:
+            with self._lock:
+                if snapshot != self._snapshot:
+                    self._templates = _build_headers(device_config)
+                    self._snapshot = snapshot
+        return self._templates[name]
+
+
+header_templates = HeaderTemplates()
+"""请求头模板（使用用户数据中的设备信息）"""
+
+
+def __getattr__(name: str):
+    # 兼容原有的 HEADERS_* 常量
+    if name.startswith("HEADERS_"):
+        try:
+            return header_templates[name[len("HEADERS_"):]]
+        except KeyError:
+            pass
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 IncorrectReturn = (KeyError, TypeError, AttributeError, IndexError, ValidationError)
 """米游社API返回数据无效会触发的异常组合"""
@@ -256,6 +333,36 @@ def is_incorrect_return(exception: Exception, *addition_exceptions: Type[Excepti
     return isinstance(exception, exceptions) or isinstance(exception.__cause__, exceptions)
 
 
+ExchangeOutcome = Literal["success", "retryable", "too_early", "plan_terminal", "account_terminal"]
+"""
+兑换请求结果的分类
+
+- success: 兑换成功
+- retryable: 暂时失败，可以继续尝试
+- too_early: 服务器认为兑换尚未开始，应尽快再次尝试
+- plan_terminal: 该兑换计划不可能再兑换成功（如库存不足、已达兑换上限）
+- account_terminal: 该账号下所有兑换计划都不可能再兑换成功（如米游币不足、登录失效）
+"""
+
+# TODO: 待补充状态码，目前只收录了已确认的状态码，其余情况由 EXCHANGE_OUTCOME_MESSAGES 按返回消息判断
+EXCHANGE_OUTCOME_RETCODES: Dict[int, ExchangeOutcome] = {
+    -2101: "too_early",
+    -2103: "plan_terminal",
+}
+"""兑换API返回的状态码与结果分类的对应关系，优先于返回消息使用"""
+
+EXCHANGE_OUTCOME_MESSAGES: Tuple[Tuple[str, ExchangeOutcome], ...] = (
+    ("米游币不足", "account_terminal"),
+    ("库存不足", "plan_terminal"),
+    ("已兑完", "plan_terminal"),
+    ("已售罄", "plan_terminal"),
+    ("兑换上限", "plan_terminal"),
+    ("已下架", "plan_terminal"),
+    ("未开始", "too_early"),
+)
+"""兑换API返回消息中的关键词与结果分类的对应关系（按顺序匹配），仅在状态码未收录时使用，未匹配的失败结果视为可重试"""
+
+
 class ApiResultHandler(BaseModel):
     """
     API返回的数据处理器
@@ -308,6 +415,40 @@ class ApiResultHandler(BaseModel):
         """
         return self.retcode in [-100, 10001] or self.message in ["登录失效，请重新登录"]
 
+    @property
+    def exchange_outcome(self) -> ExchangeOutcome:
+        """
+        兑换API返回结果的分类
+
+        先按状态码（EXCHANGE_OUTCOME_RETCODES）分类，状态码未收录时才按返回消息中的关键词（EXCHANGE_OUTCOME_MESSAGES）分类，
+        避免服务器修改提示文本后把不可能成功的结果当作可重试，或者反过来
+
+        >>> ApiResultHandler({"retcode": 0, "message": "OK", "data": {}}).exchange_outcome
+        'success'
+        >>> ApiResultHandler({"retcode": -2103, "message": "商品库存不足", "data": None}).exchange_outcome
+        'plan_terminal'
+        >>> ApiResultHandler({"retcode": -2101, "message": "兑换活动尚未开始", "data": None}).exchange_outcome
+        'too_early'
+        >>> ApiResultHandler({"retcode": -1, "message": "系统繁忙，请稍后再试", "data": None}).exchange_outcome
+        'retryable'
+        >>> ApiResultHandler({"retcode": -2103, "message": "手慢了，下次再来吧", "data": None}).exchange_outcome
+        'plan_terminal'
+        >>> ApiResultHandler({"retcode": -2101, "message": "库存不足", "data": None}).exchange_outcome
+        'too_early'
+        >>> ApiResultHandler({"retcode": -9999, "message": "米游币不足", "data": None}).exchange_outcome
+        'account_terminal'
+        """
+        if self.success:
+            return "success"
+        if self.login_expired:
+            return "account_terminal"
+        if self.retcode in EXCHANGE_OUTCOME_RETCODES:
+            return EXCHANGE_OUTCOME_RETCODES[self.retcode]
+        for keyword, outcome in EXCHANGE_OUTCOME_MESSAGES:
+            if self.message and keyword in self.message:
+                return outcome
+        return "retryable"
+
     @property
     def invalid_ds(self):
         """
@@ -328,10 +469,10 @@ async def get_game_record(account: UserAccount, retry: bool = True) -> Tuple[Bas
     try:
         async for attempt in get_async_retry(retry):
             with attempt:
-                async with httpx.AsyncClient() as client:
-                    res = await client.get(URL_GAME_RECORD.format(account.bbs_uid), headers=HEADERS_GAME_RECORD,
+                async with http_clients.use() as client:
+                    res = await client.get(URL_GAME_RECORD.format(account.bbs_uid), headers=header_templates["GAME_RECORD"],
                                            cookies=account.cookies.dict(), timeout=conf.preference.timeout)
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 if api_result.login_expired:
                     logger.info(
                         f"获取用户游戏数据(GameRecord) - 用户 {account.bbs_uid} 登录失效")
@@ -355,14 +496,14 @@ async def get_game_list(retry: bool = True) -> Tuple[BaseApiStatus, Optional[Lis
 
     :param retry: 是否允许重试
     """
-    headers = HEADERS_GAME_LIST.copy()
+    headers = header_templates["GAME_LIST"].copy()
     try:
         async for attempt in get_async_retry(retry):
             with attempt:
                 headers["DS"] = generate_ds()
-                async with httpx.AsyncClient() as client:
+                async with http_clients.use() as client:
                     res = await client.get(URL_GAME_LIST, headers=headers, timeout=conf.preference.timeout)
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 return BaseApiStatus(success=True), list(
                     map(GameInfo.parse_obj, api_result.data["list"]))
     except tenacity.RetryError as e:
@@ -385,11 +526,11 @@ async def get_user_myb(account: UserAccount, retry: bool = True) -> Tuple[BaseAp
     try:
         async for attempt in get_async_retry(retry):
             with attempt:
-                async with httpx.AsyncClient() as client:
-                    res = await client.get(URL_MYB, headers=HEADERS_MYB,
+                async with http_clients.use() as client:
+                    res = await client.get(URL_MYB, headers=header_templates["MYB"],
                                            cookies=account.cookies.dict(v2_stoken=True, cookie_type=True),
                                            timeout=conf.preference.timeout)
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 if api_result.login_expired:
                     logger.info(
                         f"获取用户米游币 - 用户 {account.bbs_uid} 登录失效")
@@ -421,23 +562,23 @@ async def device_login(account: UserAccount, retry: bool = True):
         "platform": "Android",
         "registration_id": "1a0018970a5c00e814d"
     }
-    headers = HEADERS_DEVICE.copy()
+    headers = header_templates["DEVICE"].copy()
     headers["x-rpc-device_id"] = account.device_id_android
     try:
         async for attempt in get_async_retry(retry):
             with attempt:
                 headers["DS"] = generate_ds(data)
-                async with httpx.AsyncClient() as client:
+                async with http_clients.use() as client:
                     res = await client.post(URL_DEVICE_LOGIN, headers=headers, json=data,
                                             cookies=account.cookies.dict(v2_stoken=True, cookie_type=True),
                                             timeout=conf.preference.timeout)
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 if api_result.login_expired:
                     logger.info(
                         f"设备登录(device_login) - 用户 {account.bbs_uid} 登录失效")
                     logger.debug(f"网络请求返回: {res.text}")
                     return BaseApiStatus(login_expired=True)
-                if res.json()["message"] != "OK":
+                if api_result.content["message"] != "OK":
                     raise ValueError
                 else:
                     return BaseApiStatus(success=True)
@@ -466,14 +607,14 @@ async def device_save(account: UserAccount, retry: bool = True):
         "platform": "Android",
         "registration_id": "1a0018970a5c00e814d"
     }
-    headers = HEADERS_DEVICE.copy()
+    headers = header_templates["DEVICE"].copy()
     headers["x-rpc-device_id"] = account.device_id_android
     try:
         subscribe = Subscribe()
         async for attempt in get_async_retry(retry):
             with attempt:
                 headers["DS"] = generate_ds(data)
-                async with httpx.AsyncClient() as client:
+                async with http_clients.use() as client:
                     res = await client.post(
                         URL_DEVICE_SAVE,
                         headers=headers,
@@ -481,13 +622,13 @@ async def device_save(account: UserAccount, retry: bool = True):
                         cookies=account.cookies.dict(v2_stoken=True, cookie_type=True),
                         timeout=conf.preference.timeout
                     )
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 if api_result.login_expired:
                     logger.info(
                         f"设备保存(device_save) - 用户 {account.bbs_uid} 登录失效")
                     logger.debug(f"网络请求返回: {res.text}")
                     return BaseApiStatus(login_expired=True)
-                if res.json()["message"] != "OK":
+                if api_result.content["message"] != "OK":
                     raise ValueError
                 else:
                     return BaseApiStatus(success=True)
@@ -513,9 +654,9 @@ async def get_good_detail(good: Union[Good, str], retry: bool = True) -> Tuple[G
     try:
         async for attempt in get_async_retry(retry):
             with attempt:
-                async with httpx.AsyncClient() as client:
+                async with http_clients.use() as client:
                     res = await client.get(URL_CHECK_GOOD.format(good_id), timeout=conf.preference.timeout)
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 # TODO 2023/4/13: 待改成对象方法判断
                 if api_result.message == '商品不存在' or api_result.message == '商品已下架':
                     return GetGoodDetailStatus(good_not_existed=True), None
@@ -543,12 +684,12 @@ async def get_good_games(retry: bool = True) -> Tuple[BaseApiStatus, Optional[Li
     try:
         async for attempt in get_async_retry(retry):
             with attempt:
-                async with httpx.AsyncClient() as client:
+                async with http_clients.use() as client:
                     res = await client.get(URL_GOOD_LIST.format(page=1,
                                                                 game=""),
-                                           headers=HEADERS_GOOD_LIST,
+                                           headers=header_templates["GOOD_LIST"],
                                            timeout=conf.preference.timeout)
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 return BaseApiStatus(success=True), list(map(lambda x: (x["name"], x["key"]), api_result.data["games"]))
     except tenacity.RetryError as e:
         if is_incorrect_return(e):
@@ -560,37 +701,76 @@ async def get_good_games(retry: bool = True) -> Tuple[BaseApiStatus, Optional[Li
             return BaseApiStatus(network_error=True), None
 
 
+async def _get_good_list_page(client: httpx.AsyncClient, game: str, page: int, retry: bool = True) -> Tuple[
+    List[Good], Optional[int]]:
+    """
+    获取商品信息列表中的一页，失败时只重试该页
+
+    :param client: 共用的 httpx.AsyncClient
+    :param game: 游戏简称
+    :param page: 页码（从 1 开始）
+    :param retry: 是否允许重试
+    :return: (该页的商品信息列表, 商品总数)，API没有返回商品总数时为 None
+    :raise tenacity.RetryError: 重试次数用尽
+    """
+    res = None
+    try:
+        async for attempt in get_async_retry(retry):
+            with attempt:
+                res = await client.get(URL_GOOD_LIST.format(page=page,
+                                                            game=game), headers=header_templates["GOOD_LIST"],
+                                       timeout=conf.preference.timeout)
+                api_result = ApiResultHandler(loads(res.content))
+                return list(map(Good.parse_obj, api_result.data["list"])), api_result.data.get("total")
+    except tenacity.RetryError:
+        if res is not None:
+            logger.debug(f"网络请求返回: {res.text}")
+        raise
+
+
 async def get_good_list(game: str = "", retry: bool = True) -> Tuple[
     BaseApiStatus, Optional[List[Good]]]:
     """
     获取商品信息列表
 
+    先读取第一页得到商品总数，再在同一个连接池上并发获取剩余页（并发数不超过 GOOD_LIST_CONCURRENCY）。
+    如果API没有返回商品总数，则逐页读取直到遇到空页。
+
     :param game: 游戏简称（默认为空，即获取所有游戏的商品）
     :param retry: 是否允许重试
     :return: 商品信息列表
     """
-    good_list = []
-    page = 1
-
     try:
-        async for attempt in get_async_retry(retry):
-            with attempt:
-                async with httpx.AsyncClient() as client:
-                    res = await client.get(URL_GOOD_LIST.format(page=page,
-                                                                game=game), headers=HEADERS_GOOD_LIST,
-                                           timeout=conf.preference.timeout)
-                api_result = ApiResultHandler(res.json())
-                goods = map(Good.parse_obj, api_result.data["list"])
+        async with http_clients.use() as client:
+            goods, total = await _get_good_list_page(client, game, 1, retry)
+            good_list = goods
+
+            if total is not None:
+                semaphore = asyncio.Semaphore(GOOD_LIST_CONCURRENCY)
+
+                async def get_page(page: int):
+                    async with semaphore:
+                        return await _get_good_list_page(client, game, page, retry)
+
+                page_count = math.ceil(total / GOOD_LIST_PAGE_SIZE)
+                tasks = [asyncio.ensure_future(get_page(page)) for page in range(2, page_count + 1)]
+                try:
+                    for goods, _ in await asyncio.gather(*tasks):
+                        good_list += goods
+                finally:
+                    # 某一页失败时取消其余请求
+                    for task in tasks:
+                        task.cancel()
+            else:
+                page = 1
                 # 判断是否已经读完所有商品
-                if not goods:
-                    break
-                else:
+                while goods:
+                    page += 1
+                    goods, _ = await _get_good_list_page(client, game, page, retry)
                     good_list += goods
-                page += 1
     except tenacity.RetryError as e:
         if is_incorrect_return(e):
             logger.exception(f"米游币商品兑换 - 获取商品列表: 服务器没有正确返回")
-            logger.debug(f"网络请求返回: {res.text}")
             return BaseApiStatus(incorrect_return=True), None
         else:
             logger.exception(f"米游币商品兑换 - 获取商品列表: 网络请求失败")
@@ -606,19 +786,19 @@ async def get_address(account: UserAccount, retry: bool = True) -> Tuple[BaseApi
     :param account: 用户账户数据
     :param retry: 是否允许重试
     """
-    headers = HEADERS_ADDRESS.copy()
+    headers = header_templates["ADDRESS"].copy()
     headers["x-rpc-device_id"] = account.device_id_ios
     try:
         async for attempt in get_async_retry(retry):
             with attempt:
-                async with httpx.AsyncClient() as client:
+                async with http_clients.use() as client:
                     res = await client.get(
                         URL_ADDRESS.format(round(NtpTime.time() * 1000)),
                         headers=headers,
                         cookies=account.cookies.dict(v2_stoken=True, cookie_type=True),
                         timeout=conf.preference.timeout
                     )
-                    api_result = ApiResultHandler(res.json())
+                    api_result = ApiResultHandler(loads(res.content))
                     if api_result.login_expired:
                         logger.info(
                             f"获取地址数据 - 用户 {account.bbs_uid} 登录失效")
@@ -646,7 +826,7 @@ async def check_registrable(phone_number: int, keep_client: bool = False, retry:
     :param retry: 是否允许重试
     :return: (API返回状态, 用户是否可以注册, 设备ID, httpx.AsyncClient连接对象)
     """
-    headers = HEADERS_WEBAPI.copy()
+    headers = header_templates["WEBAPI"].copy()
     device_id = generate_device_id()
     headers["x-rpc-device_id"] = device_id
 
@@ -665,11 +845,11 @@ async def check_registrable(phone_number: int, keep_client: bool = False, retry:
             with attempt:
                 if keep_client:
                     client = httpx.AsyncClient()
+                    res = await request()
                 else:
-                    async with httpx.AsyncClient() as client:
+                    async with http_clients.use() as client:
                         res = await request()
-                res = await request()
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 return BaseApiStatus(success=True), bool(api_result.data["is_registable"]), device_id, client
     except tenacity.RetryError as e:
         if keep_client:
@@ -697,7 +877,7 @@ async def create_mmt(client: Optional[httpx.AsyncClient] = None,
     :param retry: 是否允许重试
     :return: (API返回状态, 人机验证任务数据, 设备ID, httpx.AsyncClient连接对象)
     """
-    headers = HEADERS_WEBAPI.copy()
+    headers = header_templates["WEBAPI"].copy()
     headers["x-rpc-device_id"] = device_id or generate_device_id()
     if use_v4:
         headers.setdefault("x-rpc-source", "accountWebsite")
@@ -718,9 +898,9 @@ async def create_mmt(client: Optional[httpx.AsyncClient] = None,
                 if client:
                     res = await request()
                 else:
-                    async with httpx.AsyncClient() as client:
+                    async with http_clients.use() as client:
                         res = await request()
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 return BaseApiStatus(success=True), MmtData.parse_obj(api_result.data["mmt_data"]), device_id, client
     except tenacity.RetryError as e:
         if client:
@@ -753,7 +933,7 @@ async def create_mobile_captcha(phone_number: int,
     :param device_id: 设备ID
     :param retry: 是否允许重试
     """
-    headers = HEADERS_WEBAPI.copy()
+    headers = header_templates["WEBAPI"].copy()
     headers["x-rpc-device_id"] = device_id or generate_device_id()
     if use_v4 and isinstance(geetest_result, GeetestResultV4):
         geetest_v4_data = geetest_result.dict(skip_defaults=True)
@@ -790,9 +970,9 @@ async def create_mobile_captcha(phone_number: int,
                 if client and not client.is_closed:
                     res = await request()
                 else:
-                    async with httpx.AsyncClient() as client:
+                    async with http_clients.use() as client:
                         res = await request()
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 if api_result.success:
                     return CreateMobileCaptchaStatus(success=True), client
                 elif api_result.wrong_captcha:
@@ -830,7 +1010,7 @@ async def get_login_ticket_by_captcha(phone_number: str,
     >>> assert asyncio.new_event_loop().run_until_complete(coroutine)[0].incorrect_captcha is True
     """
 
-    headers = HEADERS_WEBAPI.copy()
+    headers = header_templates["WEBAPI"].copy()
     headers["x-rpc-device_id"] = device_id or generate_device_id()
     params = {
         "mobile": phone_number,
@@ -857,9 +1037,9 @@ async def get_login_ticket_by_captcha(phone_number: str,
                 if client is not None:
                     res = await request()
                 else:
-                    async with httpx.AsyncClient() as client:
+                    async with http_clients.use() as client:
                         res = await request()
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 if api_result.success:
                     cookies = BBSCookies.parse_obj(dict_from_cookiejar(
                         res.cookies.jar))
@@ -900,12 +1080,12 @@ async def get_multi_token_by_login_ticket(cookies: BBSCookies, retry: bool = Tru
     try:
         async for attempt in get_async_retry(retry):
             with attempt:
-                async with httpx.AsyncClient() as client:
+                async with http_clients.use() as client:
                     res = await client.get(
                         URL_MULTI_TOKEN_BY_LOGIN_TICKET.format(cookies.login_ticket, cookies.bbs_uid),
-                        headers=HEADERS_API_TAKUMI_PC,
+                        headers=header_templates["API_TAKUMI_PC"],
                         timeout=conf.preference.timeout)
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 if api_result.login_expired:
                     logger.warning(f"通过 login_ticket 获取 stoken: 登录失效")
                     return GetCookieStatus(login_expired=True), None
@@ -941,9 +1121,9 @@ async def get_cookie_token_by_captcha(phone_number: str, captcha: int, retry: bo
     try:
         async for attempt in get_async_retry(retry):
             with attempt:
-                async with httpx.AsyncClient() as client:
+                async with http_clients.use() as client:
                     res = await client.post(URL_COOKIE_TOKEN_BY_CAPTCHA,
-                                            headers=HEADERS_API_TAKUMI_PC,
+                                            headers=header_templates["API_TAKUMI_PC"],
                                             json={
                                                 "is_bh2": False,
                                                 "mobile": phone_number,
@@ -953,7 +1133,7 @@ async def get_cookie_token_by_captcha(phone_number: str, captcha: int, retry: bo
                                             },
                                             timeout=conf.preference.timeout
                                             )
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 if api_result.wrong_captcha:
                     logger.info(f"登录米哈游账号 - 验证码错误")
                     return GetCookieStatus(incorrect_captcha=True), None
@@ -991,7 +1171,7 @@ async def get_login_ticket_by_password(account: str,
     :param device_id: 设备ID
     :param retry: 是否允许重试
     """
-    headers = HEADERS_WEBAPI.copy()
+    headers = header_templates["WEBAPI"].copy()
     headers["x-rpc-device_id"] = device_id or generate_device_id()
     params = {
         "account": account,
@@ -1008,7 +1188,7 @@ async def get_login_ticket_by_password(account: str,
     try:
         async for attempt in get_async_retry(retry):
             with attempt:
-                async with httpx.AsyncClient() as client:
+                async with http_clients.use() as client:
                     res = await client.post(
                         URL_LOGIN_TICKET_BY_PASSWORD,
                         content=encoded_params,
@@ -1016,7 +1196,7 @@ async def get_login_ticket_by_password(account: str,
                         timeout=conf.preference.timeout
                     )
                 cookies = BBSCookies.parse_obj(dict_from_cookiejar(res.cookies.jar))
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 if api_result.success:
                     return GetCookieStatus(success=True), cookies
                 elif api_result.wrong_captcha:
@@ -1045,21 +1225,21 @@ async def get_cookie_token_by_stoken(cookies: BBSCookies, device_id: str = None,
     >>> coroutine = get_cookie_token_by_stoken(BBSCookies())
     >>> assert asyncio.new_event_loop().run_until_complete(coroutine)[0].success is False
     """
-    headers = HEADERS_PASSPORT_API.copy()
+    headers = header_templates["PASSPORT_API"].copy()
     headers["x-rpc-device_id"] = device_id or generate_device_id()
     if not cookies.stoken_v2:
         return GetCookieStatus(missing_stoken_v2=True), None
     try:
         async for attempt in get_async_retry(retry):
             with attempt:
-                async with httpx.AsyncClient() as client:
+                async with http_clients.use() as client:
                     res = await client.get(
                         URL_COOKIE_TOKEN_BY_STOKEN,
                         cookies=cookies.dict(v2_stoken=True, cookie_type=True),
                         headers=headers,
                         timeout=conf.preference.timeout
                     )
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 if api_result.success:
                     cookies.cookie_token = api_result.data["cookie_token"]
                     if not cookies.bbs_uid:
@@ -1094,7 +1274,7 @@ async def get_stoken_v2_by_v1(cookies: BBSCookies, device_id: str = None, retry:
     >>> coroutine = get_stoken_v2_by_v1(BBSCookies())
     >>> assert asyncio.new_event_loop().run_until_complete(coroutine)[0].success is False
     """
-    headers = HEADERS_PASSPORT_API.copy()
+    headers = header_templates["PASSPORT_API"].copy()
     headers["x-rpc-device_id"] = device_id or generate_device_id()
     headers.setdefault("x-rpc-aigis", "")
     headers.setdefault("x-rpc-app_id", "bll8iq97cem8")
@@ -1104,7 +1284,7 @@ async def get_stoken_v2_by_v1(cookies: BBSCookies, device_id: str = None, retry:
     try:
         async for attempt in get_async_retry(retry):
             with attempt:
-                async with httpx.AsyncClient() as client:
+                async with http_clients.use() as client:
                     headers.setdefault("DS", generate_ds(salt=conf.salt_config.SALT_PROD))
                     res = await client.post(
                         URL_STOKEN_V2_BY_V1,
@@ -1112,7 +1292,7 @@ async def get_stoken_v2_by_v1(cookies: BBSCookies, device_id: str = None, retry:
                         headers=headers,
                         timeout=conf.preference.timeout
                     )
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 if api_result.success:
                     cookies.stoken_v2 = api_result.data["token"]["token"]
                     cookies.mid = api_result.data["user_info"]["mid"]
@@ -1148,7 +1328,7 @@ async def get_ltoken_by_stoken(cookies: BBSCookies, device_id: str = None, retry
     >>> coroutine = get_ltoken_by_stoken(BBSCookies())
     >>> assert asyncio.new_event_loop().run_until_complete(coroutine)[0].success is False
     """
-    headers = HEADERS_PASSPORT_API.copy()
+    headers = header_templates["PASSPORT_API"].copy()
     headers["x-rpc-device_id"] = device_id or generate_device_id()
     if not cookies.stoken_v2:
         return GetCookieStatus(missing_stoken_v2=True), None
@@ -1157,14 +1337,14 @@ async def get_ltoken_by_stoken(cookies: BBSCookies, device_id: str = None, retry
     try:
         async for attempt in get_async_retry(retry):
             with attempt:
-                async with httpx.AsyncClient() as client:
+                async with http_clients.use() as client:
                     res = await client.get(
                         URL_LTOKEN_BY_STOKEN,
                         cookies=cookies.dict(v2_stoken=True, cookie_type=True),
                         headers=headers,
                         timeout=conf.preference.timeout
                     )
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 if api_result.success:
                     cookies.ltoken = api_result.data["ltoken"]
                     return GetCookieStatus(success=True), cookies
@@ -1215,13 +1395,13 @@ async def get_device_fp(device_id: str, retry: bool = True) -> Tuple[GetFpStatus
     try:
         async for attempt in get_async_retry(retry):
             with attempt:
-                async with httpx.AsyncClient() as client:
+                async with http_clients.use() as client:
                     res = await client.post(
                         URL_GET_DEVICE_FP,
                         json=content,
                         timeout=conf.preference.timeout
                     )
-                api_result = ApiResultHandler(res.json())
+                api_result = ApiResultHandler(loads(res.content))
                 if api_result.data["code"] == 403 or api_result.data["msg"] == "传入的参数有误":
                     logger.error("传入的参数有误")
                     return GetFpStatus(invalid_arguments=True), None
@@ -1242,15 +1422,41 @@ async def get_device_fp(device_id: str, retry: bool = True) -> Tuple[GetFpStatus
             return GetFpStatus(network_error=True), None
 
 
-async def good_exchange(plan: ExchangePlan) -> Tuple[ExchangeStatus, Optional[ExchangeResult]]:
+class PreparedExchange(NamedTuple):
     """
-    执行米游币商品兑换
+    预先构建好的兑换请求，构建后不再修改，可被多个线程/协程同时使用
+    """
+    url: str
+    """兑换API地址"""
+    headers: Tuple[Tuple[str, str], ...]
+    """请求 Headers（包含 Cookie）"""
+    body: bytes
+    """序列化后的 JSON 请求体"""
+
+
+def prepare_exchange(plan: ExchangePlan, url: Optional[str] = None) -> PreparedExchange:
+    """
+    将兑换计划构建为兑换请求，应在兑换开始前调用
 
     :param plan: 兑换计划
+    :param url: 兑换API地址，默认为 URL_EXCHANGE
+
+    >>> from mys_goods_tool.data_model import Good
+    >>> good = Good(type=1, account_exchange_num=0, account_cycle_limit=1, account_cycle_type="forever",
+    ...             goods_id="123", price=1, icon="")
+    >>> account = UserAccount(cookies=BBSCookies(stuid="1", stoken="2", cookie_token="3"), device_fp="abc")
+    >>> prepared = prepare_exchange(ExchangePlan(good=good, account=account))
+    >>> headers = dict(prepared.headers)
+    >>> assert headers["x-rpc-device_id"] == account.device_id_ios and headers["x-rpc-device_fp"] == "abc"
+    >>> assert "cookie_token=3" in headers["Cookie"]
+    >>> assert loads(prepared.body)["goods_id"] == "123"
+    >>> assert header_templates["EXCHANGE"]["x-rpc-device_id"] is None
     """
-    headers = HEADERS_EXCHANGE
+    headers = header_templates["EXCHANGE"].copy()
     headers["x-rpc-device_id"] = plan.account.device_id_ios
     headers["x-rpc-device_fp"] = plan.account.device_fp or generate_fp_locally()
+    # 直接设置 Cookie 请求头，避免共用连接池时混入 Client 中其他账号的 Cookies
+    headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in plan.account.cookies.dict(cookie_type=True).items())
     content = {
         "app_id": 1,
         "point_sn": "myb",
@@ -1265,35 +1471,59 @@ async def good_exchange(plan: ExchangePlan) -> Tuple[ExchangeStatus, Optional[Ex
         content.setdefault("region", plan.game_record.region)
         # 例: hk4e_cn
         content.setdefault("game_biz", plan.good.game_biz)
+    return PreparedExchange(url=url or URL_EXCHANGE,
+                            headers=tuple(headers.items()),
+                            body=dumps(content).encode())
+
+
+async def good_exchange(plan: ExchangePlan,
+                        client: Optional[httpx.AsyncClient] = None,
+                        prepared: Optional[PreparedExchange] = None) -> Tuple[
+    ExchangeStatus, Optional[ExchangeResult]]:
+    """
+    执行米游币商品兑换
+
+    :param plan: 兑换计划
+    :param client: 可复用的 httpx.AsyncClient（如兑换引擎共用的连接池），为空则使用应用共用的连接池
+    :param prepared: 预先构建好的兑换请求，为空则临时构建
+    """
+    prepared = prepared or prepare_exchange(plan)
     start_time = 0
+    trace = RequestTrace()
     try:
         start_time = time.time()
-        async with httpx.AsyncClient() as client:
+        if client is not None:
             res = await client.post(
-                URL_EXCHANGE, headers=headers, json=content,
-                cookies=plan.account.cookies.dict(cookie_type=True),
-                timeout=conf.preference.timeout)
-        api_result = ApiResultHandler(res.json())
+                prepared.url, headers=prepared.headers, content=prepared.body,
+                timeout=conf.preference.timeout,
+                extensions={"trace": trace.async_callback})
+        else:
+            async with http_clients.use() as client:
+                res = await client.post(
+                    prepared.url, headers=prepared.headers, content=prepared.body,
+                    timeout=conf.preference.timeout,
+                    extensions={"trace": trace.async_callback})
+        api_result = ApiResultHandler(loads(res.content))
         if api_result.login_expired:
-            logger.info(
-                f"米游币商品兑换: 用户 {plan.account.bbs_uid} 登录失效 - 请求发送时间: {start_time}")
-            logger.debug(f"网络请求返回: {res.text}")
+            exchange_logger.info("米游币商品兑换: 用户 {} 登录失效 - 请求发送时间: {} - {.text}",
+                                 plan.account.bbs_uid, start_time, trace)
+            exchange_logger.debug("网络请求返回: {}", RawText(res.content))
             return ExchangeStatus(login_expired=True), None
         if api_result.success:
-            logger.info(
-                f"米游币商品兑换: 用户 {plan.account.bbs_uid} 商品 {plan.good.goods_id} 兑换成功！可以自行确认 - 请求发送时间: {start_time}")
-            logger.debug(f"网络请求返回: {res.text}")
-            return ExchangeStatus(success=True), ExchangeResult(result=True, return_data=res.json(), plan=plan)
+            exchange_logger.info("米游币商品兑换: 用户 {} 商品 {} 兑换成功！可以自行确认 - 请求发送时间: {} - {.text}",
+                                 plan.account.bbs_uid, plan.good.goods_id, start_time, trace)
+            exchange_logger.debug("网络请求返回: {}", RawText(res.content))
+            return ExchangeStatus(success=True), ExchangeResult(result=True, return_data=api_result.content, plan=plan)
         else:
-            logger.info(
-                f"米游币商品兑换: 用户 {plan.account.bbs_uid} 商品 {plan.good.goods_id} 兑换失败，可以自行确认 - 请求发送时间: {start_time}")
-            logger.debug(f"网络请求返回: {res.text}")
-            return ExchangeStatus(success=True), ExchangeResult(result=False, return_data=res.json(), plan=plan)
+            exchange_logger.info("米游币商品兑换: 用户 {} 商品 {} 兑换失败，可以自行确认 - 请求发送时间: {} - {.text}",
+                                 plan.account.bbs_uid, plan.good.goods_id, start_time, trace)
+            exchange_logger.debug("网络请求返回: {}", RawText(res.content))
+            return ExchangeStatus(success=True), ExchangeResult(result=False, return_data=api_result.content, plan=plan)
     except Exception as e:
         if is_incorrect_return(e):
-            logger.error(
-                f"米游币商品兑换: 用户 {plan.account.bbs_uid} 商品 {plan.good.goods_id} 服务器没有正确返回 - 请求发送时间: {start_time}")
-            logger.debug(f"网络请求返回: {res.text}")
+            exchange_logger.error("米游币商品兑换: 用户 {} 商品 {} 服务器没有正确返回 - 请求发送时间: {}",
+                                  plan.account.bbs_uid, plan.good.goods_id, start_time)
+            exchange_logger.debug("网络请求返回: {}", RawText(res.content))
             return ExchangeStatus(incorrect_return=True), None
         else:
             logger.exception(
@@ -1301,58 +1531,54 @@ async def good_exchange(plan: ExchangePlan) -> Tuple[ExchangeStatus, Optional[Ex
             return ExchangeStatus(network_error=True), None
 
 
-def good_exchange_sync(plan: ExchangePlan) -> Tuple[ExchangeStatus, Optional[ExchangeResult]]:
+def good_exchange_sync(plan: ExchangePlan,
+                       client: Optional[httpx.Client] = None,
+                       prepared: Optional[PreparedExchange] = None) -> Tuple[
+    ExchangeStatus, Optional[ExchangeResult]]:
     """
     执行米游币商品兑换
 
     :param plan: 兑换计划
+    :param client: 可复用的 httpx.Client（如已预热连接的连接池），为空则临时创建
+    :param prepared: 预先构建好的兑换请求，为空则临时构建
     """
-    headers = HEADERS_EXCHANGE
-    headers["x-rpc-device_id"] = plan.account.device_id_ios
-    headers["x-rpc-device_fp"] = plan.account.device_fp or generate_fp_locally()
-    content = {
-        "app_id": 1,
-        "point_sn": "myb",
-        "goods_id": plan.good.goods_id,
-        "exchange_num": 1
-    }
-    if plan.address is not None:
-        content.setdefault("address_id", plan.address.id)
-    if plan.game_record is not None:
-        content.setdefault("uid", plan.game_record.game_role_id)
-        # 例: cn_gf01
-        content.setdefault("region", plan.game_record.region)
-        # 例: hk4e_cn
-        content.setdefault("game_biz", plan.good.game_biz)
+    prepared = prepared or prepare_exchange(plan)
     start_time = 0
+    trace = RequestTrace()
     try:
         start_time = time.time()
-        with httpx.Client() as client:
+        if client is not None:
             res = client.post(
-                URL_EXCHANGE, headers=headers, json=content,
-                cookies=plan.account.cookies.dict(cookie_type=True),
-                timeout=conf.preference.timeout)
-        api_result = ApiResultHandler(res.json())
+                prepared.url, headers=prepared.headers, content=prepared.body,
+                timeout=conf.preference.timeout,
+                extensions={"trace": trace})
+        else:
+            with httpx.Client() as client:
+                res = client.post(
+                    prepared.url, headers=prepared.headers, content=prepared.body,
+                    timeout=conf.preference.timeout,
+                    extensions={"trace": trace})
+        api_result = ApiResultHandler(loads(res.content))
         if api_result.login_expired:
-            logger.info(
-                f"米游币商品兑换: 用户 {plan.account.bbs_uid} 登录失效 - 请求发送时间: {start_time}")
-            logger.debug(f"网络请求返回: {res.text}")
+            exchange_logger.info("米游币商品兑换: 用户 {} 登录失效 - 请求发送时间: {} - {.text}",
+                                 plan.account.bbs_uid, start_time, trace)
+            exchange_logger.debug("网络请求返回: {}", RawText(res.content))
             return ExchangeStatus(login_expired=True), None
         if api_result.success:
-            logger.info(
-                f"米游币商品兑换: 用户 {plan.account.bbs_uid} 商品 {plan.good.goods_id} 兑换成功！可以自行确认 - 请求发送时间: {start_time}")
-            logger.debug(f"网络请求返回: {res.text}")
-            return ExchangeStatus(success=True), ExchangeResult(result=True, return_data=res.json(), plan=plan)
+            exchange_logger.info("米游币商品兑换: 用户 {} 商品 {} 兑换成功！可以自行确认 - 请求发送时间: {} - {.text}",
+                                 plan.account.bbs_uid, plan.good.goods_id, start_time, trace)
+            exchange_logger.debug("网络请求返回: {}", RawText(res.content))
+            return ExchangeStatus(success=True), ExchangeResult(result=True, return_data=api_result.content, plan=plan)
         else:
-            logger.info(
-                f"米游币商品兑换: 用户 {plan.account.bbs_uid} 商品 {plan.good.goods_id} 兑换失败，可以自行确认 - 请求发送时间: {start_time}")
-            logger.debug(f"网络请求返回: {res.text}")
-            return ExchangeStatus(success=True), ExchangeResult(result=False, return_data=res.json(), plan=plan)
+            exchange_logger.info("米游币商品兑换: 用户 {} 商品 {} 兑换失败，可以自行确认 - 请求发送时间: {} - {.text}",
+                                 plan.account.bbs_uid, plan.good.goods_id, start_time, trace)
+            exchange_logger.debug("网络请求返回: {}", RawText(res.content))
+            return ExchangeStatus(success=True), ExchangeResult(result=False, return_data=api_result.content, plan=plan)
     except Exception as e:
         if is_incorrect_return(e):
-            logger.error(
-                f"米游币商品兑换: 用户 {plan.account.bbs_uid} 商品 {plan.good.goods_id} 服务器没有正确返回 - 请求发送时间: {start_time}")
-            logger.debug(f"网络请求返回: {res.text}")
+            exchange_logger.error("米游币商品兑换: 用户 {} 商品 {} 服务器没有正确返回 - 请求发送时间: {}",
+                                  plan.account.bbs_uid, plan.good.goods_id, start_time)
+            exchange_logger.debug("网络请求返回: {}", RawText(res.content))
             return ExchangeStatus(incorrect_return=True), None
         else:
             logger.exception(
@@ -0,0 +1,145 @@
+import threading
+from typing import Optional, Dict
+
+from mys_goods_tool.api import ApiResultHandler, ExchangeOutcome
+from mys_goods_tool.data_model import ExchangeStatus
+from mys_goods_tool.user_data import ExchangePlan, ExchangeResult, UserAccount
+
+
+class CancelToken:
+    """
+    取消令牌，可以有一个上级令牌，上级令牌被取消时该令牌也视为被取消
+
+    >>> account = CancelToken()
+    >>> plan = CancelToken(account)
+    >>> plan.cancelled
+    False
+    >>> account.cancel("登录失效")
+    >>> plan.cancelled, plan.reason
+    (True, '登录失效')
+    >>> plan.cancel("兑换成功"); plan.reason
+    '兑换成功'
+    """
+
+    def __init__(self, parent: Optional["CancelToken"] = None):
+        """
+        :param parent: 上级令牌
+        """
+        self.parent = parent
+        """上级令牌"""
+        self._reason: Optional[str] = None
+        self._event = threading.Event()
+
+    def cancel(self, reason: str):
+        """
+        取消，只保留第一次取消的原因
+
+        :param reason: 取消原因
+        """
+        if not self._event.is_set():
+            self._reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        是否已被取消（包括上级令牌被取消）
+        """
+        return self._event.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    @property
+    def reason(self) -> Optional[str]:
+        """
+        取消原因，未被取消时为 None
+        """
+        if self._event.is_set():
+            return self._reason
+        return self.parent.reason if self.parent is not None else None
+
+
+class ExchangeCancellation:
+    """
+    兑换任务的取消令牌管理器
+
+    每个兑换计划一个令牌，其上级为该兑换计划所属账号的令牌。
+    兑换线程/协程在每次尝试前检查令牌，兑换成功时取消该兑换计划的其他线程，
+    服务器返回不可能再兑换成功的结果时（见 ExchangeOutcome），取消该兑换计划或该账号下所有兑换计划的线程
+
+    >>> from mys_goods_tool.data_model import Good
+    >>> from mys_goods_tool.user_data import BBSCookies
+    >>> account = UserAccount(cookies=BBSCookies(stuid="1", stoken="2", cookie_token="3"))
+    >>> plans = [ExchangePlan(good=Good(type=1, account_exchange_num=0, account_cycle_limit=1,
+    ...                                 account_cycle_type="forever", goods_id=str(i), price=1, icon=""),
+    ...                       account=account) for i in range(2)]
+    >>> tokens = ExchangeCancellation()
+    >>> tokens.settle(plans[0], ExchangeStatus(success=True), ExchangeResult(result=True, return_data={}, plan=plans[0]))
+    'success'
+    >>> tokens.plan(plans[0]).reason, tokens.plan(plans[1]).cancelled
+    ('其他线程已兑换成功', False)
+    >>> tokens.settle(plans[1], ExchangeStatus(success=True),
+    ...               ExchangeResult(result=False, return_data={"retcode": -1, "message": "米游币不足"}, plan=plans[1]))
+    'account_terminal'
+    >>> tokens.plan(plans[1]).reason
+    '服务器返回 米游币不足'
+    """
+
+    def __init__(self):
+        self._accounts: Dict[str, CancelToken] = {}
+        self._plans: Dict[str, CancelToken] = {}
+        self._lock = threading.Lock()
+
+    def account(self, account: UserAccount) -> CancelToken:
+        """
+        获取账号的取消令牌
+
+        :param account: 用户账号
+        """
+        with self._lock:
+            return self._accounts.setdefault(account.bbs_uid, CancelToken())
+
+    def plan(self, plan: ExchangePlan) -> CancelToken:
+        """
+        获取兑换计划的取消令牌
+
+        :param plan: 兑换计划
+        """
+        account_token = self.account(plan.account)
+        with self._lock:
+            return self._plans.setdefault(plan.plan_id, CancelToken(account_token))
+
+    def settle(self, plan: ExchangePlan, status: ExchangeStatus, result: Optional[ExchangeResult]) -> ExchangeOutcome:
+        """
+        对一次兑换尝试的结果进行分类，并取消相关的兑换任务
+
+        :param plan: 兑换计划
+        :param status: 兑换请求状态
+        :param result: 兑换结果
+        :return: 兑换结果的分类
+        """
+        if status.login_expired:
+            self.account(plan.account).cancel("账号登录失效")
+            return "account_terminal"
+        elif not status:
+            return "retryable"
+        elif result.result:
+            self.plan(plan).cancel("其他线程已兑换成功")
+            return "success"
+        api_result = ApiResultHandler(result.return_data)
+        outcome = api_result.exchange_outcome
+        if outcome == "plan_terminal":
+            self.plan(plan).cancel(f"服务器返回 {api_result.message}")
+        elif outcome == "account_terminal":
+            self.account(plan.account).cancel(f"服务器返回 {api_result.message}")
+        return outcome
+
+    def reset(self):
+        """
+        清除所有令牌（重新进入兑换模式时调用）
+        """
+        with self._lock:
+            self._accounts.clear()
+            self._plans.clear()
+
+
+exchange_tokens = ExchangeCancellation()
+"""兑换任务共用的取消令牌管理器"""
@@ -0,0 +1,298 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from pydantic import BaseModel, ValidationError
+
+from mys_goods_tool import json_backend
+from mys_goods_tool.api import get_good_detail
+from mys_goods_tool.data_model import Good
+from mys_goods_tool.user_data import config as conf
+from mys_goods_tool.utils import logger
+
+CATALOGUE_CACHE_VERSION = 1
+"""商品目录缓存文件的格式版本，版本不一致时丢弃原缓存"""
+GOOD_DETAIL_CONCURRENCY = 8
+"""批量获取商品详细信息时的最大并发请求数"""
+
+
+class CachedPartitions(BaseModel):
+    """
+    缓存的商品分区列表
+    """
+    fetched_at: float
+    """获取时间（时间戳）"""
+    partitions: List[Tuple[str, str]]
+    """(商品分区全名, 字母简称) 的列表"""
+
+
+class CachedGoodList(BaseModel):
+    """
+    缓存的某个分区的商品信息列表
+    """
+    fetched_at: float
+    """获取时间（时间戳）"""
+    goods: List[Good]
+    """商品信息列表"""
+
+
+class CachedGoodDetail(BaseModel):
+    """
+    缓存的商品详细信息
+    """
+    fetched_at: float
+    """获取时间（时间戳）"""
+    good: Good
+    """商品数据"""
+
+
+class CatalogueData(BaseModel):
+    """
+    商品目录缓存文件的内容
+    """
+    version: int = CATALOGUE_CACHE_VERSION
+    """格式版本"""
+    partitions: Optional[CachedPartitions]
+    """商品分区列表"""
+    good_lists: Dict[str, CachedGoodList] = {}
+    """分区简称 -> 商品信息列表"""
+    details: Dict[str, CachedGoodDetail] = {}
+    """商品ID -> 商品详细信息"""
+
+    class Config:
+        json_loads = json_backend.loads
+        json_dumps = json_backend.dumps
+
+
+class GoodsDiff(NamedTuple):
+    """
+    两次获取的商品信息列表之间的差异
+    """
+    added: List[Good]
+    """新增的商品"""
+    changed: List[Good]
+    """数据有变化的商品（新数据）"""
+    removed: List[str]
+    """被移除的商品的ID"""
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+
+def diff_goods(old: List[Good], new: List[Good]) -> GoodsDiff:
+    """
+    按商品ID比较两次获取的商品信息列表
+
+    :param old: 原商品信息列表
+    :param new: 新商品信息列表
+
+    >>> def good(goods_id: str, price: int):
+    ...     return Good(type=1, account_exchange_num=0, account_cycle_limit=1, account_cycle_type="month",
+    ...                 goods_id=goods_id, price=price, icon="")
+    >>> diff = diff_goods([good("1", 100), good("2", 200)], [good("2", 300), good("3", 100)])
+    >>> [x.goods_id for x in diff.added], [x.price for x in diff.changed], diff.removed
+    (['3'], [300], ['1'])
+    >>> bool(diff_goods([good("1", 100)], [good("1", 100)]))
+    False
+    """
+    old_dict = {good.goods_id: good for good in old}
+    new_dict = {good.goods_id: good for good in new}
+    added = [good for goods_id, good in new_dict.items() if goods_id not in old_dict]
+    changed = [good for goods_id, good in new_dict.items()
+               if goods_id in old_dict and good != old_dict[goods_id]]
+    removed = [goods_id for goods_id in old_dict if goods_id not in new_dict]
+    return GoodsDiff(added, changed, removed)
+
+
+class CatalogueCache:
+    """
+    本地商品目录缓存（商品分区列表、各分区的商品信息列表、商品详细信息）
+
+    界面先使用缓存数据显示，再在后台重新获取（stale-while-revalidate）；
+    获取时间距今不超过 `preference.catalogue_cache_max_age` 的数据视为新鲜数据，无需重新获取。
+    `preference.catalogue_cache_path` 为空时不使用缓存。
+    """
+
+    def __init__(self, path: Union[str, Path, None] = None):
+        """
+        :param path: 缓存文件路径，为空则使用 `preference.catalogue_cache_path`
+        """
+        self._path = path
+        self._data: Optional[CatalogueData] = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Optional[Path]:
+        """
+        缓存文件路径，为空说明不使用缓存
+        """
+        path = conf.preference.catalogue_cache_path if self._path is None else self._path
+        return None if path is None else Path(path)
+
+    @property
+    def data(self) -> CatalogueData:
+        """
+        缓存数据（第一次使用时读取缓存文件）
+        """
+        if self._data is None:
+            self._data = self._load()
+        return self._data
+
+    def _load(self) -> CatalogueData:
+        """
+        读取缓存文件，文件不存在、损坏或版本不一致时返回空的缓存数据
+        """
+        path = self.path
+        if path is None or not path.is_file():
+            return CatalogueData()
+        try:
+            data = CatalogueData.parse_file(path)
+        except (ValidationError, ValueError, OSError):
+            logger.warning(f"读取商品目录缓存文件 {path} 失败，将重新获取商品数据")
+            return CatalogueData()
+        if data.version != CATALOGUE_CACHE_VERSION:
+            return CatalogueData()
+        return data
+
+    @staticmethod
+    def is_fresh(entry: Union[CachedPartitions, CachedGoodList, CachedGoodDetail, None]) -> bool:
+        """
+        缓存数据是否仍然新鲜（无需重新获取）
+
+        :param entry: 缓存数据
+        """
+        return entry is not None and time.time() - entry.fetched_at <= conf.preference.catalogue_cache_max_age
+
+    @property
+    def partitions(self) -> Optional[CachedPartitions]:
+        """
+        缓存的商品分区列表
+        """
+        return self.data.partitions if self.path is not None else None
+
+    def good_list(self, game: str) -> Optional[CachedGoodList]:
+        """
+        获取缓存的商品信息列表
+
+        :param game: 分区简称
+        """
+        return self.data.good_lists.get(game) if self.path is not None else None
+
+    def detail(self, goods_id: str) -> Optional[CachedGoodDetail]:
+        """
+        获取缓存的商品详细信息
+
+        :param goods_id: 商品ID
+        """
+        return self.data.details.get(goods_id) if self.path is not None else None
+
+    def put_partitions(self, partitions: List[Tuple[str, str]], save: bool = True):
+        """
+        缓存商品分区列表并写入缓存文件
+
+        :param partitions: (商品分区全名, 字母简称) 的列表
+        :param save: 是否立即写入缓存文件（批量缓存时可在最后统一写入）
+        """
+        self.data.partitions = CachedPartitions(fetched_at=time.time(), partitions=partitions)
+        if save:
+            self.save()
+
+    def put_good_list(self, game: str, goods: List[Good], save: bool = True):
+        """
+        缓存商品信息列表并写入缓存文件
+
+        :param game: 分区简称
+        :param goods: 商品信息列表
+        :param save: 是否立即写入缓存文件（批量缓存时可在最后统一写入）
+        """
+        self.data.good_lists[game] = CachedGoodList(fetched_at=time.time(), goods=goods)
+        if save:
+            self.save()
+
+    def put_detail(self, good: Good, save: bool = True):
+        """
+        缓存商品详细信息并写入缓存文件
+
+        :param good: 商品数据
+        :param save: 是否立即写入缓存文件（批量缓存时可在最后统一写入）
+        """
+        self.data.details[good.goods_id] = CachedGoodDetail(fetched_at=time.time(), good=good.copy())
+        if save:
+            self.save()
+
+    def save(self):
+        """
+        写入缓存文件（先写入临时文件再替换原文件）
+        """
+        if self.path is not None:
+            self._write(self.data.json())
+
+    async def save_async(self):
+        """
+        写入缓存文件，在事件循环中序列化（避免与修改缓存数据的协程同时进行），在其他线程中写入文件
+        """
+        if self.path is not None:
+            await asyncio.to_thread(self._write, self.data.json())
+
+    def _write(self, str_data: str):
+        """
+        将序列化后的缓存数据写入缓存文件
+
+        :param str_data: 序列化后的缓存数据
+        """
+        path = self.path.absolute()
+        with self._lock:
+            try:
+                os.makedirs(path.parent, exist_ok=True)
+                fd, temp_path = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+                try:
+                    with os.fdopen(fd, "w", encoding="utf-8") as f:
+                        f.write(str_data)
+                    os.replace(temp_path, path)
+                except BaseException:
+                    os.unlink(temp_path)
+                    raise
+            except OSError:
+                logger.exception(f"写入商品目录缓存文件 {path} 失败")
+
+
+catalogue_cache = CatalogueCache()
+"""商品目录缓存"""
+
+
+async def resolve_good_times(goods: Iterable[Good], concurrency: int = GOOD_DETAIL_CONCURRENCY) -> int:
+    """
+    批量获取兑换时间未知（`Good.time` 为 0）的限时商品的详细信息，并合并到商品数据中
+
+    先使用缓存的商品详细信息，缓存不存在或已过期时再并发获取（并发数不超过 concurrency），获取到的详细信息会写入缓存
+
+    :param goods: 商品数据
+    :param concurrency: 最大并发请求数
+    :return: 兑换时间变为已知的商品数
+    """
+    goods = list(filter(lambda x: x.time_limited and x.time == 0, goods))
+    pending: List[Good] = []
+    for good in goods:
+        cached_detail = catalogue_cache.detail(good.goods_id)
+        if cached_detail is not None:
+            good.update(cached_detail.good)
+        if not catalogue_cache.is_fresh(cached_detail):
+            pending.append(good)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve(good: Good):
+        async with semaphore:
+            status, _ = await get_good_detail(good)
+        if status:
+            catalogue_cache.put_detail(good, save=False)
+        return status
+
+    results = await asyncio.gather(*map(resolve, pending))
+    if any(results):
+        await catalogue_cache.save_async()
+    return len(list(filter(lambda x: x.time != 0, goods)))
@@ -0,0 +1,386 @@
+import asyncio
+import importlib.util
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Optional, Dict, Any, List, NamedTuple, AsyncIterator
+
+import httpx
+
+from mys_goods_tool.timing import ExchangeTrigger
+from mys_goods_tool.user_data import config as conf
+from mys_goods_tool.utils import logger
+
+KEEPALIVE_EXPIRY = 60
+"""预热连接的保活时间（单位：秒），需要覆盖从预热到兑换结束的整个时段"""
+
+HOST_MAX_CONNECTIONS = 10
+"""共用连接池中每个主机的最大连接数"""
+
+
+class RequestTrace:
+    """
+    记录单次请求中建立连接、TLS握手所花费的时间，以及从发出请求到收到响应头的时间
+
+    通过 httpx 的 ``trace`` 扩展传入，复用已有连接时不会触发对应事件，耗时即为 0
+
+    >>> trace = RequestTrace()
+    >>> trace("connection.connect_tcp.started", {})
+    >>> trace("connection.connect_tcp.complete", {})
+    >>> assert trace.connect_time >= 0 and trace.tls_time == 0
+    >>> assert trace.new_connection is True
+    >>> assert RequestTrace().new_connection is False
+    >>> trace("http11.send_request_headers.started", {})
+    >>> trace("http11.receive_response_headers.complete", {})
+    >>> assert trace.response_time >= 0
+    >>> assert RequestTrace().response_time is None
+    """
+
+    def __init__(self):
+        self._started: Dict[str, float] = {}
+        self.connect_time: float = 0
+        """建立TCP连接耗时（单位：秒）"""
+        self.tls_time: float = 0
+        """TLS握手耗时（单位：秒）"""
+        self.response_time: Optional[float] = None
+        """从开始发送请求到收到响应头的时间（单位：秒），即不含建立连接的应用层往返延迟"""
+
+    def __call__(self, event_name: str, info: Dict[str, Any]):
+        """
+        httpx 同步请求所用的 trace 回调
+        """
+        stage, _, state = event_name.rpartition(".")
+        if state == "started":
+            self._started[stage] = time.perf_counter()
+        elif state == "complete":
+            if stage.endswith("receive_response_headers"):
+                request_stage = stage.replace("receive_response_headers", "send_request_headers")
+                if request_stage in self._started:
+                    self.response_time = time.perf_counter() - self._started[request_stage]
+            elif stage.endswith("connect_tcp") and stage in self._started:
+                self.connect_time = time.perf_counter() - self._started[stage]
+            elif stage.endswith("start_tls") and stage in self._started:
+                self.tls_time = time.perf_counter() - self._started[stage]
+
+    async def async_callback(self, event_name: str, info: Dict[str, Any]):
+        """
+        httpx 异步请求所用的 trace 回调
+        """
+        self(event_name, info)
+
+    @property
+    def new_connection(self):
+        """
+        本次请求是否新建了连接
+        """
+        return self.connect_time > 0 or self.tls_time > 0
+
+    @property
+    def text(self):
+        """
+        连接耗时文本
+        """
+        if not self.new_connection:
+            return "复用已有连接"
+        return f"建立连接 {round(self.connect_time * 1000, 2)} ms, TLS握手 {round(self.tls_time * 1000, 2)} ms"
+
+
+class ExchangeConnectionManager:
+    """
+    兑换请求连接管理器
+
+    在兑换开始前预先建立并完成TLS握手的长连接，所有兑换线程共用同一个连接池
+    """
+
+    def __init__(self, url: str):
+        """
+        :param url: 需要预热连接的URL（一般为商品兑换API）
+        """
+        self.url = url
+        """需要预热连接的URL"""
+        self._client: Optional[httpx.Client] = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> httpx.Client:
+        """
+        获取共用的 httpx.Client，如果还未创建则进行创建
+        """
+        with self._lock:
+            if self._client is None or self._client.is_closed:
+                self._client = httpx.Client(
+                    limits=httpx.Limits(max_connections=None,
+                                        max_keepalive_connections=None,
+                                        keepalive_expiry=KEEPALIVE_EXPIRY),
+                    timeout=conf.preference.timeout
+                )
+            return self._client
+
+    def _open_connection(self, _=None) -> RequestTrace:
+        """
+        发送一次 OPTIONS 请求以建立连接
+        """
+        trace = RequestTrace()
+        self.client.options(self.url, extensions={"trace": trace})
+        return trace
+
+    def warm_up(self, count: int) -> List[RequestTrace]:
+        """
+        并发发送请求，以建立指定数量的长连接并完成TLS握手
+
+        :param count: 需要建立的连接数（一般为同一时刻的兑换线程总数）
+        :return: 每个预热请求的连接耗时记录
+        """
+        traces = []
+        count = max(count, 1)
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            futures = [executor.submit(self._open_connection) for _ in range(count)]
+            for future in futures:
+                try:
+                    traces.append(future.result())
+                except httpx.HTTPError:
+                    logger.exception(f"预热兑换连接 - 建立连接失败")
+        for trace in traces:
+            if trace.response_time is not None:
+                ExchangeTrigger.estimator.add(trace.response_time)
+        new_connections = list(filter(lambda x: x.new_connection, traces))
+        if new_connections:
+            average_tls = sum(map(lambda x: x.tls_time, new_connections)) / len(new_connections)
+            logger.info(f"预热兑换连接 - 已新建 {len(new_connections)} 个连接，"
+                        f"平均TLS握手耗时 {round(average_tls * 1000, 2)} ms")
+        else:
+            logger.info(f"预热兑换连接 - 已有 {len(traces)} 个可复用的连接")
+        return traces
+
+    def measure_rtt(self) -> Optional[float]:
+        """
+        通过兑换请求所用的连接池发送一次 OPTIONS 请求，测量应用层往返延迟，并记录到 ExchangeTrigger.estimator
+
+        :return: 往返延迟（单位：秒），请求失败时为 None
+        """
+        try:
+            trace = self._open_connection()
+        except httpx.HTTPError:
+            logger.exception(f"测量兑换API往返延迟 - 请求失败")
+            return None
+        if trace.response_time is not None:
+            ExchangeTrigger.estimator.add(trace.response_time)
+        return trace.response_time
+
+    def close(self):
+        """
+        关闭连接池
+        """
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+class PoolStats(NamedTuple):
+    """
+    单个主机的连接池统计数据
+    """
+    host: str
+    """主机（包含端口）"""
+    requests: int
+    """请求总数"""
+    new_connections: int
+    """新建连接数"""
+    connections: int
+    """当前连接数"""
+    idle: int
+    """当前空闲连接数"""
+
+    @property
+    def hits(self):
+        """
+        复用已有连接的请求数
+        """
+        return self.requests - self.new_connections
+
+    @property
+    def text(self):
+        """
+        统计数据文本
+        """
+        return f"{self.host} - 请求 {self.requests} 次，复用连接 {self.hits} 次，" \
+               f"新建连接 {self.new_connections} 个，当前连接 {self.connections} 个（空闲 {self.idle} 个）"
+
+
+class _HostPoolTransport(httpx.AsyncBaseTransport):
+    """
+    按主机划分连接池的传输层，每个主机拥有独立的连接数限制，并统计连接复用情况
+    """
+
+    def __init__(self, limits: httpx.Limits, http2: bool = False):
+        """
+        :param limits: 每个主机的连接数限制
+        :param http2: 是否启用 HTTP/2
+        """
+        self._limits = limits
+        self._http2 = http2
+        self._transports: Dict[str, httpx.AsyncHTTPTransport] = {}
+        self.requests: Counter = Counter()
+        """每个主机的请求数"""
+        self.new_connections: Counter = Counter()
+        """每个主机的新建连接数"""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.netloc.decode("ascii")
+        transport = self._transports.get(host)
+        if transport is None:
+            transport = self._transports[host] = httpx.AsyncHTTPTransport(limits=self._limits, http2=self._http2)
+        self.requests[host] += 1
+
+        trace = request.extensions.get("trace")
+
+        async def count_connection(event_name: str, info: Dict[str, Any]):
+            if event_name == "connection.connect_tcp.started":
+                self.new_connections[host] += 1
+            if trace is not None:
+                await trace(event_name, info)
+
+        request.extensions["trace"] = count_connection
+        return await transport.handle_async_request(request)
+
+    def stats(self) -> List[PoolStats]:
+        """
+        获取每个主机的连接池统计数据
+        """
+        stats = []
+        for host, transport in self._transports.items():
+            # httpx 没有公开底层的 httpcore 连接池
+            connections = getattr(getattr(transport, "_pool", None), "connections", [])
+            stats.append(PoolStats(host=host,
+                                   requests=self.requests[host],
+                                   new_connections=self.new_connections[host],
+                                   connections=len(connections),
+                                   idle=len(list(filter(lambda x: x.is_idle(), connections)))))
+        return stats
+
+    async def aclose(self) -> None:
+        for transport in self._transports.values():
+            await transport.aclose()
+        self._transports.clear()
+
+
+class _SharedAsyncClient(httpx.AsyncClient):
+    """
+    由 HttpClientRegistry 管理生命周期的 httpx.AsyncClient，调用 aclose 不会关闭连接池
+    """
+
+    async def aclose(self) -> None:
+        pass
+
+    async def _aclose(self) -> None:
+        """
+        关闭连接池（仅供 HttpClientRegistry 使用）
+        """
+        await super().aclose()
+
+
+class HttpClientRegistry:
+    """
+    应用共用的 httpx.AsyncClient 注册表
+
+    每个事件循环拥有一个共用的 httpx.AsyncClient（连接无法跨事件循环复用），其中每个主机使用独立的连接池。
+    共用连接池不保存服务器返回的 Cookies，以免不同账户之间的 Cookies 互相影响；
+    其生命周期由注册表管理，调用方对其调用 aclose 不会关闭连接池。
+    """
+
+    def __init__(self):
+        self._clients: Dict[asyncio.AbstractEventLoop, _SharedAsyncClient] = {}
+        self._transports: Dict[asyncio.AbstractEventLoop, _HostPoolTransport] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _http2_available() -> bool:
+        """
+        判断是否可以启用 HTTP/2
+        """
+        if not conf.preference.enable_http2:
+            return False
+        if importlib.util.find_spec("h2") is None:
+            logger.warning("未安装 h2，无法启用 HTTP/2，可通过 pip install httpx[http2] 安装")
+            return False
+        return True
+
+    def _create(self, loop: asyncio.AbstractEventLoop) -> _SharedAsyncClient:
+        """
+        为指定事件循环创建共用的 httpx.AsyncClient
+        """
+        transport = _HostPoolTransport(
+            limits=httpx.Limits(max_connections=HOST_MAX_CONNECTIONS,
+                                max_keepalive_connections=HOST_MAX_CONNECTIONS,
+                                keepalive_expiry=KEEPALIVE_EXPIRY),
+            http2=self._http2_available()
+        )
+        client = _SharedAsyncClient(
+            transport=transport,
+            cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+            timeout=conf.preference.timeout
+        )
+        self._clients[loop] = client
+        self._transports[loop] = transport
+        return client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        获取当前事件循环共用的 httpx.AsyncClient，如果还未创建（或已被关闭）则进行创建
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            # 清理已经结束的事件循环所对应的连接池
+            for closed_loop in list(filter(lambda x: x.is_closed(), self._clients)):
+                self._clients.pop(closed_loop)
+                self._transports.pop(closed_loop)
+            client = self._clients.get(loop)
+            if client is None or client.is_closed:
+                client = self._create(loop)
+            return client
+
+    @asynccontextmanager
+    async def use(self) -> AsyncIterator[httpx.AsyncClient]:
+        """
+        以上下文管理器的形式获取共用的 httpx.AsyncClient，退出时不会关闭连接池
+
+        >>> import asyncio
+        >>> async def test():
+        ...     async with http_clients.use() as client_1, http_clients.use() as client_2:
+        ...         assert client_1 is client_2
+        ...     assert not client_1.is_closed
+        ...     await http_clients.aclose()
+        ...     assert client_1.is_closed
+        >>> asyncio.run(test())
+        """
+        yield self.client
+
+    def stats(self) -> List[PoolStats]:
+        """
+        获取当前事件循环共用连接池中每个主机的统计数据
+        """
+        transport = self._transports.get(asyncio.get_running_loop())
+        return transport.stats() if transport else []
+
+    async def aclose(self):
+        """
+        关闭当前事件循环共用的 httpx.AsyncClient
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.pop(loop, None)
+            transport = self._transports.pop(loop, None)
+        if client is not None:
+            if transport is not None:
+                for stats in transport.stats():
+                    logger.debug(f"共用连接池统计 - {stats.text}")
+            await client._aclose()
+
+
+http_clients = HttpClientRegistry()
+"""应用共用的 httpx.AsyncClient 注册表"""
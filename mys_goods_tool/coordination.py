@@ -0,0 +1,566 @@
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional, List, Set, Dict, Iterable, Tuple, Any
+from urllib.parse import urlparse
+
+from mys_goods_tool.data_model import ExchangeStatus
+from mys_goods_tool.timing import BurstPlanner
+from mys_goods_tool.user_data import config as conf, ExchangePlan, ExchangeResult
+from mys_goods_tool.utils import logger, LOG_FORMAT
+
+HEARTBEAT_INTERVAL = 1
+"""节点发送心跳的间隔（单位：秒）"""
+
+MEMBER_TIMEOUT = 5
+"""超过该时间（单位：秒）没有心跳的节点不再参与分配发送时刻"""
+
+POLL_INTERVAL = 0.05
+"""查询其他节点兑换结果的间隔（单位：秒）"""
+
+LEDGER_ERRORS = (OSError, sqlite3.Error, ValueError)
+"""访问账本时可能出现的错误（无法连接、数据库错误、协调服务器返回了无法识别的数据）"""
+
+
+class ExchangeLedger(ABC):
+    """
+    多节点兑换计划账本
+
+    记录参与每个兑换计划的节点，以及兑换计划是否已经由某个节点兑换成功
+    """
+
+    def __init__(self, node_id: str):
+        """
+        :param node_id: 本节点ID
+        """
+        self.node_id = node_id
+        """本节点ID"""
+
+    @abstractmethod
+    def join(self, plan_ids: Iterable[str]):
+        """
+        加入兑换计划（同时作为心跳，需要定期调用）
+
+        :param plan_ids: 本节点参与的兑换计划ID
+        """
+
+    @abstractmethod
+    def members(self, plan_id: str) -> List[str]:
+        """
+        获取仍然在线的、参与兑换计划的节点ID（已排序）
+
+        :param plan_id: 兑换计划ID
+        """
+
+    @abstractmethod
+    def mark_success(self, plan_id: str):
+        """
+        标记兑换计划已兑换成功
+
+        :param plan_id: 兑换计划ID
+        """
+
+    @abstractmethod
+    def finished(self, plan_ids: Iterable[str]) -> Set[str]:
+        """
+        查询已经兑换成功的兑换计划
+
+        :param plan_ids: 需要查询的兑换计划ID
+        :return: 其中已兑换成功的兑换计划ID
+        """
+
+    def close(self):
+        """
+        释放账本所用的资源
+        """
+
+
+class MemoryLedger(ExchangeLedger):
+    """
+    保存在内存中的账本，用于TCP协调服务器，也可用于单个进程
+
+    >>> ledger = MemoryLedger("node-a")
+    >>> ledger.join(["plan"])
+    >>> ledger.node_id = "node-b"
+    >>> ledger.join(["plan"])
+    >>> ledger.members("plan")
+    ['node-a', 'node-b']
+    >>> ledger.mark_success("plan")
+    >>> ledger.finished(["plan", "other"])
+    {'plan'}
+    """
+
+    def __init__(self, node_id: str = ""):
+        super().__init__(node_id)
+        self._members: Dict[str, Dict[str, float]] = {}
+        self._finished: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def join(self, plan_ids: Iterable[str], node_id: Optional[str] = None):
+        now = time.time()
+        with self._lock:
+            for plan_id in plan_ids:
+                self._members.setdefault(plan_id, {})[node_id or self.node_id] = now
+
+    def members(self, plan_id: str) -> List[str]:
+        deadline = time.time() - MEMBER_TIMEOUT
+        with self._lock:
+            return sorted(node for node, seen in self._members.get(plan_id, {}).items() if seen >= deadline)
+
+    def mark_success(self, plan_id: str):
+        with self._lock:
+            self._finished.add(plan_id)
+
+    def finished(self, plan_ids: Iterable[str]) -> Set[str]:
+        with self._lock:
+            return set(plan_ids) & self._finished
+
+
+class SqliteLedger(ExchangeLedger):
+    """
+    基于 SQLite 文件的账本，用于同一台主机上的多个进程
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "ledger.db")
+    >>> ledger_a, ledger_b = SqliteLedger(path, "node-a"), SqliteLedger(path, "node-b")
+    >>> ledger_a.join(["plan"]); ledger_b.join(["plan"])
+    >>> ledger_b.members("plan")
+    ['node-a', 'node-b']
+    >>> ledger_a.mark_success("plan")
+    >>> ledger_b.finished(["plan"])
+    {'plan'}
+    >>> ledger_a.close(); ledger_b.close()
+    """
+
+    def __init__(self, path: str, node_id: str):
+        """
+        :param path: SQLite 数据库文件路径
+        :param node_id: 本节点ID
+        """
+        super().__init__(node_id)
+        self._connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS members "
+                                     "(plan_id TEXT, node_id TEXT, seen REAL, PRIMARY KEY (plan_id, node_id))")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS finished (plan_id TEXT PRIMARY KEY, node_id TEXT)")
+
+    def join(self, plan_ids: Iterable[str]):
+        now = time.time()
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO members VALUES (?, ?, ?)",
+                                         [(plan_id, self.node_id, now) for plan_id in plan_ids])
+
+    def members(self, plan_id: str) -> List[str]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT node_id FROM members WHERE plan_id = ? AND seen >= ? ORDER BY node_id",
+                (plan_id, time.time() - MEMBER_TIMEOUT)).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_success(self, plan_id: str):
+        with self._lock:
+            self._connection.execute("INSERT OR IGNORE INTO finished VALUES (?, ?)", (plan_id, self.node_id))
+
+    def finished(self, plan_ids: Iterable[str]) -> Set[str]:
+        plan_ids = list(plan_ids)
+        if not plan_ids:
+            return set()
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT plan_id FROM finished WHERE plan_id IN ({', '.join('?' * len(plan_ids))})",
+                plan_ids).fetchall()
+        return {row[0] for row in rows}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class TcpLedger(ExchangeLedger):
+    """
+    通过TCP协调服务器（LedgerServer）共享的账本，用于多台主机
+
+    每个请求、响应为一行 JSON
+
+    >>> server = LedgerServer(("127.0.0.1", 0))
+    >>> threading.Thread(target=server.serve_forever, daemon=True).start()
+    >>> ledger_a = TcpLedger(server.server_address, "node-a")
+    >>> ledger_b = TcpLedger(server.server_address, "node-b")
+    >>> ledger_a.join(["plan"]); ledger_b.join(["plan"])
+    >>> ledger_a.members("plan")
+    ['node-a', 'node-b']
+    >>> ledger_b.mark_success("plan")
+    >>> ledger_a.finished(["plan"])
+    {'plan'}
+    >>> ledger_a.close(); ledger_b.close(); server.shutdown(); server.server_close()
+    """
+
+    def __init__(self, address: Tuple[str, int], node_id: str):
+        """
+        :param address: 协调服务器地址
+        :param node_id: 本节点ID
+        """
+        super().__init__(node_id)
+        self.address = address
+        """协调服务器地址"""
+        self._socket: Optional[socket.socket] = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _request(self, op: str, **kwargs) -> Any:
+        """
+        向协调服务器发送请求，连接断开时重新连接一次
+
+        :param op: 操作名称
+        :return: 服务器返回的结果
+        """
+        line = json.dumps({"op": op, "node": self.node_id, **kwargs}).encode() + b"\n"
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._socket is None:
+                        self._socket = socket.create_connection(self.address, timeout=conf.preference.timeout)
+                        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                        self._file = self._socket.makefile("rb")
+                    self._socket.sendall(line)
+                    response = self._file.readline()
+                    if not response:
+                        raise ConnectionError("协调服务器关闭了连接")
+                except OSError:
+                    self._disconnect()
+                    if attempt:
+                        raise
+                    continue
+                try:
+                    return json.loads(response)["result"]
+                except (ValueError, KeyError, TypeError) as e:
+                    # 之后的响应可能无法与请求对应，需要重新连接
+                    self._disconnect()
+                    raise ValueError(f"协调服务器返回了无法识别的数据 {response!r}") from e
+
+    def _disconnect(self):
+        if self._socket is not None:
+            self._file.close()
+            self._socket.close()
+        self._socket, self._file = None, None
+
+    def join(self, plan_ids: Iterable[str]):
+        self._request("join", plans=list(plan_ids))
+
+    def members(self, plan_id: str) -> List[str]:
+        return self._request("members", plan=plan_id)
+
+    def mark_success(self, plan_id: str):
+        self._request("success", plan=plan_id)
+
+    def finished(self, plan_ids: Iterable[str]) -> Set[str]:
+        return set(self._request("finished", plans=list(plan_ids)))
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+
+class LedgerServer(socketserver.ThreadingTCPServer):
+    """
+    TCP协调服务器，在内存中保存账本，供 TcpLedger 连接
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            ledger: MemoryLedger = self.server.ledger
+            for line in self.rfile:
+                try:
+                    request = json.loads(line)
+                    op = request["op"]
+                    if op == "join":
+                        result = ledger.join(request["plans"], node_id=request["node"])
+                    elif op == "members":
+                        result = ledger.members(request["plan"])
+                    elif op == "success":
+                        logger.info(f"协调服务器 - 节点 {request['node']} 已兑换成功 - 兑换计划 {request['plan']}")
+                        result = ledger.mark_success(request["plan"])
+                    elif op == "finished":
+                        result = list(ledger.finished(request["plans"]))
+                    else:
+                        raise KeyError(op)
+                except (ValueError, KeyError, TypeError):
+                    logger.exception(f"协调服务器 - 无法处理来自 {self.client_address} 的请求")
+                    break
+                self.wfile.write(json.dumps({"result": result}).encode() + b"\n")
+
+    def __init__(self, address: Tuple[str, int]):
+        """
+        :param address: 监听地址
+        """
+        self.ledger = MemoryLedger()
+        """账本"""
+        super().__init__(address, self.Handler)
+
+
+def parse_backend(backend: str) -> Tuple[str, Any]:
+    """
+    解析账本后端地址
+
+    :param backend: ``sqlite:///<数据库文件路径>`` 或 ``tcp://<主机>:<端口>``
+    :return: (后端类型, 数据库文件路径或服务器地址)
+
+    >>> parse_backend("sqlite:///tmp/ledger.db")
+    ('sqlite', '/tmp/ledger.db')
+    >>> parse_backend("sqlite://./ledger.db")
+    ('sqlite', './ledger.db')
+    >>> parse_backend("tcp://127.0.0.1:9000")
+    ('tcp', ('127.0.0.1', 9000))
+    """
+    result = urlparse(backend)
+    if result.scheme == "sqlite":
+        return "sqlite", backend[len("sqlite://"):]
+    elif result.scheme == "tcp" and result.hostname and result.port:
+        return "tcp", (result.hostname, result.port)
+    raise ValueError(f"无法识别的账本后端地址 {backend}")
+
+
+def create_ledger(backend: str, node_id: Optional[str] = None) -> ExchangeLedger:
+    """
+    根据账本后端地址创建账本
+
+    :param backend: 账本后端地址，见 parse_backend
+    :param node_id: 本节点ID，默认为 <主机名>-<进程ID>
+    """
+    node_id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+    kind, target = parse_backend(backend)
+    if kind == "sqlite":
+        return SqliteLedger(target, node_id)
+    else:
+        return TcpLedger(target, node_id)
+
+
+class ExchangeCoordinator:
+    """
+    多节点兑换协调器
+
+    在后台线程中定期发送心跳、查询其他节点的兑换结果，兑换线程只需检查本地缓存，不会因协调而延迟发送兑换请求
+    """
+
+    def __init__(self, ledger: ExchangeLedger):
+        """
+        :param ledger: 多节点兑换计划账本
+        """
+        self.ledger = ledger
+        """多节点兑换计划账本"""
+        self._plan_ids: Set[str] = set()
+        self._finished: Set[str] = set()
+        self._members: Dict[str, List[str]] = {}
+        self._slots: Dict[str, Tuple[int, int]] = {}
+        self._burst_slots: Dict[str, Tuple[int, int]] = {}
+        """兑换计划ID -> 开始兑换时确定的本节点位置"""
+        self._slots_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, plans: Iterable[ExchangePlan]):
+        """
+        加入兑换计划并启动后台线程
+
+        :param plans: 本节点参与的兑换计划
+        """
+        self._plan_ids = set(map(lambda x: x.plan_id, plans))
+        self._burst_slots.clear()
+        try:
+            self._heartbeat()
+        except LEDGER_ERRORS:
+            # 无法访问账本时先按单节点兑换，后台线程会继续尝试发送心跳
+            logger.exception("多节点协调 - 无法访问账本，暂时按单节点进行兑换")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="exchange-coordinator", daemon=True)
+        self._thread.start()
+        logger.info(f"多节点协调 - 节点 {self.ledger.node_id} 已加入 {len(self._plan_ids)} 个兑换计划")
+
+    def _heartbeat(self):
+        """
+        发送心跳，并更新参与各兑换计划的节点以及本节点在各兑换计划中的位置
+        """
+        self.ledger.join(self._plan_ids)
+        self._members = {plan_id: self.ledger.members(plan_id) for plan_id in self._plan_ids}
+        slots = {}
+        for plan_id, members in self._members.items():
+            if self.ledger.node_id in members:
+                slots[plan_id] = members.index(self.ledger.node_id), len(members)
+        # 整体替换，保证同一时刻读取到的位置来自同一次心跳
+        self._slots = slots
+
+    def _run(self):
+        last_heartbeat = time.time()
+        while not self._stop.wait(POLL_INTERVAL):
+            try:
+                if time.time() - last_heartbeat >= HEARTBEAT_INTERVAL:
+                    self._heartbeat()
+                    last_heartbeat = time.time()
+                finished = self.ledger.finished(self._plan_ids - self._finished)
+                if finished:
+                    logger.info(f"多节点协调 - 其他节点已兑换成功 - 兑换计划 {', '.join(finished)}")
+                    self._finished |= finished
+            except LEDGER_ERRORS:
+                # 出错后继续尝试，不能让后台线程退出
+                logger.exception("多节点协调 - 无法访问账本")
+
+    def stop(self):
+        """
+        停止后台线程并关闭账本
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.ledger.close()
+
+    def slot(self, plan: ExchangePlan) -> Tuple[int, int]:
+        """
+        获取本节点在兑换计划中的位置
+
+        位置随每次心跳根据最新的节点列表重新计算，但每个兑换计划只在第一次读取（开始兑换）时确定一次，
+        之后本节点所有线程/协程读取到的都是同一个位置，不会因为各自读取的时刻不同而重复或遗漏发送时刻
+
+        :param plan: 兑换计划
+        :return: (本节点序号, 节点总数)，账本中没有本节点（如无法访问账本）时视为只有本节点
+        """
+        with self._slots_lock:
+            if plan.plan_id not in self._burst_slots:
+                self._burst_slots[plan.plan_id] = self._slots.get(plan.plan_id, (0, 1))
+            return self._burst_slots[plan.plan_id]
+
+    def is_finished(self, plan: ExchangePlan) -> bool:
+        """
+        兑换计划是否已经兑换成功（由任意节点）
+
+        :param plan: 兑换计划
+        """
+        return plan.plan_id in self._finished
+
+    def report_success(self, plan: ExchangePlan):
+        """
+        通知其他节点本节点已兑换成功
+
+        :param plan: 兑换计划
+        """
+        self._finished.add(plan.plan_id)
+        try:
+            self.ledger.mark_success(plan.plan_id)
+        except LEDGER_ERRORS:
+            logger.exception("多节点协调 - 无法通知其他节点兑换成功")
+
+
+coordinator: Optional[ExchangeCoordinator] = None
+"""多节点兑换协调器（仅在偏好设置中设置了 coordination_backend 时使用）"""
+
+
+def start_coordinator(plans: Iterable[ExchangePlan]) -> Optional[ExchangeCoordinator]:
+    """
+    根据偏好设置启动多节点兑换协调器
+
+    :param plans: 本节点参与的兑换计划
+    :return: 未设置 coordination_backend 时为 None
+    """
+    global coordinator
+    stop_coordinator()
+    if conf.preference.coordination_backend:
+        try:
+            ledger = create_ledger(conf.preference.coordination_backend, conf.preference.coordination_node_id)
+        except LEDGER_ERRORS:
+            logger.exception("多节点协调 - 无法创建账本，将按单节点进行兑换")
+            return None
+        coordinator = ExchangeCoordinator(ledger)
+        coordinator.start(plans)
+    return coordinator
+
+
+def stop_coordinator():
+    """
+    停止多节点兑换协调器
+    """
+    global coordinator
+    if coordinator is not None:
+        coordinator.stop()
+        coordinator = None
+
+
+def plan_offsets(plan: ExchangePlan, worker_id: int) -> List[float]:
+    """
+    获取本节点某个线程/协程的发送时刻规划
+
+    启用多节点协调时，所有节点的所有线程轮流分摊与单个节点相同的一条发送时刻序列，
+    因此请求总数不会随节点数增加（各节点需使用相同的兑换线程数）
+
+    :param plan: 兑换计划
+    :param worker_id: 线程/协程编号（从 1 开始）
+    :return: 发送时刻（相对于第一个请求的发送时刻，单位：秒）
+    """
+    threads = conf.preference.exchange_thread_count
+    node_index, node_count = coordinator.slot(plan) if coordinator else (0, 1)
+    return BurstPlanner.plan(threads,
+                             conf.preference.exchange_duration,
+                             conf.preference.exchange_latency,
+                             shares=threads * node_count)[node_index * threads + worker_id - 1]
+
+
+def finished_elsewhere(plan: ExchangePlan) -> Optional[Tuple[ExchangeStatus, ExchangeResult]]:
+    """
+    检查兑换计划是否已由其他节点兑换成功
+
+    :param plan: 兑换计划
+    :return: 已兑换成功时返回视为兑换成功的结果，否则为 None
+    """
+    if coordinator is not None and coordinator.is_finished(plan):
+        return ExchangeStatus(success=True), ExchangeResult(result=True, return_data={"coordinated": True}, plan=plan)
+    return None
+
+
+def report_success(plan: ExchangePlan):
+    """
+    通知其他节点兑换计划已兑换成功（未启用多节点协调时不做任何事）
+
+    :param plan: 兑换计划
+    """
+    if coordinator is not None:
+        coordinator.report_success(plan)
+
+
+def serve(backend: Optional[str] = None):
+    """
+    运行TCP协调服务器，直到被中断
+
+    :param backend: 账本后端地址（``tcp://<监听地址>:<端口>``），默认使用偏好设置中的 coordination_backend
+    """
+    logger.add(sys.stdout, diagnose=True, format=LOG_FORMAT, level="DEBUG")
+    backend = backend or conf.preference.coordination_backend
+    if not backend:
+        logger.error("未设置协调服务器地址，请在用户数据文件中设置 preference.coordination_backend 为 tcp://<监听地址>:<端口>")
+        exit(1)
+    try:
+        kind, address = parse_backend(backend)
+    except ValueError:
+        kind, address = None, None
+    if kind != "tcp":
+        logger.error(f"协调服务器只能使用 tcp://<监听地址>:<端口> 形式的地址，当前为 {backend}")
+        exit(1)
+    try:
+        server = LedgerServer(address)
+    except OSError:
+        logger.exception(f"协调服务器无法监听 {address[0]}:{address[1]}")
+        exit(1)
+    with server:
+        logger.info(f"协调服务器已启动 - 监听 {address[0]}:{address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("协调服务器已停止")
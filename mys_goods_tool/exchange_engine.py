@@ -0,0 +1,208 @@
+import asyncio
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Optional, Callable, Iterable, Any, List
+
+import httpx
+from apscheduler.events import JobExecutionEvent, EVENT_JOB_EXECUTED
+
+from mys_goods_tool import coordination
+from mys_goods_tool.api import URL_EXCHANGE, good_exchange, prepare_exchange
+from mys_goods_tool.cancellation import exchange_tokens
+from mys_goods_tool.connection import KEEPALIVE_EXPIRY, RequestTrace
+from mys_goods_tool.data_model import ExchangeStatus
+from mys_goods_tool.timing import ExchangeTrigger, BurstPlanner, TRIGGER_ADVANCE, async_wait_until
+from mys_goods_tool.user_data import config as conf, ExchangePlan, ExchangeJobId
+from mys_goods_tool.utils import logger, NtpTime, exchange_logger
+
+
+def new_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    创建新的事件循环，非 Windows 环境下如果安装了 uvloop 则优先使用
+    """
+    if sys.platform not in ('win32', 'cygwin', 'cli'):
+        try:
+            import uvloop
+        except ModuleNotFoundError:
+            pass
+        else:
+            return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+class AsyncExchangeEngine:
+    """
+    asyncio 兑换引擎
+
+    由单个事件循环驱动所有兑换计划，所有并发的兑换请求共用一个 httpx.AsyncClient 连接池。
+    每次兑换任务结束后，以与调度器相同的 JobExecutionEvent 通知监听器，因此可以复用兑换结果处理函数。
+    """
+
+    def __init__(self, listener: Callable[[JobExecutionEvent], Any]):
+        """
+        :param listener: 兑换结果监听器，与 APScheduler 的 EVENT_JOB_EXECUTED 监听器相同
+        """
+        self.listener = listener
+        """兑换结果监听器"""
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _new_client() -> httpx.AsyncClient:
+        """
+        创建兑换引擎所用的 httpx.AsyncClient
+        """
+        return httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=None,
+                                max_keepalive_connections=None,
+                                keepalive_expiry=KEEPALIVE_EXPIRY),
+            timeout=conf.preference.timeout
+        )
+
+    @staticmethod
+    async def _warm_up(client: httpx.AsyncClient, exchange_time: float, count: int):
+        """
+        在兑换开始前并发发送请求，预先建立连接
+
+        :param client: 兑换引擎的连接池
+        :param exchange_time: 商品兑换时间
+        :param count: 需要建立的连接数
+        """
+        await async_wait_until(exchange_time - conf.preference.exchange_warm_up_time)
+
+        async def open_connection():
+            trace = RequestTrace()
+            await client.options(URL_EXCHANGE, extensions={"trace": trace.async_callback})
+            return trace
+
+        results = await asyncio.gather(*[open_connection() for _ in range(count)], return_exceptions=True)
+        traces: List[RequestTrace] = list(filter(lambda x: isinstance(x, RequestTrace), results))
+        for trace in traces:
+            if trace.response_time is not None:
+                ExchangeTrigger.estimator.add(trace.response_time)
+        logger.info(f"预热兑换连接 - 已准备 {len(traces)} 个连接，"
+                    f"其中新建 {len(list(filter(lambda x: x.new_connection, traces)))} 个")
+
+    async def _worker(self,
+                      plan: ExchangePlan,
+                      worker_id: int,
+                      client: httpx.AsyncClient):
+        """
+        单个兑换协程，在兑换持续时间内不断尝试兑换，直到成功
+
+        :param plan: 兑换计划
+        :param worker_id: 协程编号（从 1 开始，对应兑换线程编号）
+        :param client: 兑换引擎的连接池
+        """
+        exchange_status, exchange_result = ExchangeStatus(), None
+        # 与调度器一样提前 TRIGGER_ADVANCE 启动，使发送提前量能用上预热时测得的往返延迟
+        await async_wait_until(ExchangeTrigger.fire_time(plan.good.time) - TRIGGER_ADVANCE)
+        # 在预检之后才构建兑换请求，使用预检时刷新的 Cookies 和 device_fp
+        prepared = prepare_exchange(plan)
+        fire_time = ExchangeTrigger.fire_time(plan.good.time)
+        offsets = coordination.plan_offsets(plan, worker_id)
+        logger.info(f"用户 {plan.account.bbs_uid}"
+                    f" - {plan.good.general_name}"
+                    f" - 协程 {worker_id}"
+                    f" - {ExchangeTrigger.lead_time_text()}")
+        token = exchange_tokens.plan(plan)
+        instants = BurstPlanner.instants(offsets, fire_time, fire_time + conf.preference.exchange_duration)
+        with exchange_logger.burst():
+            for attempt, instant in enumerate(instants, start=1):
+                fire_error = await async_wait_until(instant)
+                finished = coordination.finished_elsewhere(plan)
+                if finished:
+                    exchange_logger.info("用户 {} - {.general_name} - 协程 {} - 其他节点已兑换成功，停止兑换",
+                                         plan.account.bbs_uid, plan.good, worker_id)
+                    exchange_status, exchange_result = finished
+                    break
+                if token.cancelled:
+                    exchange_logger.info("用户 {} - {.general_name} - 协程 {} - {}，停止兑换",
+                                         plan.account.bbs_uid, plan.good, worker_id, token.reason)
+                    break
+                exchange_logger.info("用户 {} - {.general_name} - 协程 {} - 第 {} 次尝试"
+                                     " - 触发误差 {:.3f} ms - 相对兑换时间 {:.3f} ms",
+                                     plan.account.bbs_uid, plan.good, worker_id, attempt,
+                                     fire_error * 1000, (NtpTime.time() - plan.good.time) * 1000)
+                exchange_status, exchange_result = await good_exchange(plan, client, prepared)
+                outcome = exchange_tokens.settle(plan, exchange_status, exchange_result)
+                if outcome == "success":
+                    await asyncio.get_running_loop().run_in_executor(None, coordination.report_success, plan)
+                    break
+                elif outcome == "too_early":
+                    # 服务器认为兑换尚未开始，从现在起重新以最小间隔发送
+                    instants.restart(NtpTime.time())
+
+        self.listener(JobExecutionEvent(EVENT_JOB_EXECUTED,
+                                        str(ExchangeJobId(plan.plan_id, worker_id)),
+                                        None,
+                                        datetime.fromtimestamp(plan.good.time),
+                                        retval=(exchange_status, exchange_result)))
+
+    async def run(self, plans: Iterable[ExchangePlan]):
+        """
+        执行所有兑换计划，直到全部结束
+
+        :param plans: 兑换计划
+        """
+        plans = list(filter(lambda x: x.good.time and x.good.time > NtpTime.time(), plans))
+        concurrency = conf.preference.exchange_thread_count
+        async with self._new_client() as client:
+            coroutines = []
+            names = []
+            if conf.preference.exchange_warm_up_time:
+                time_counter = Counter(map(lambda x: x.good.time, plans))
+                for exchange_time, plan_count in time_counter.items():
+                    coroutines.append(self._warm_up(client, exchange_time, plan_count * concurrency))
+                    names.append(f"预热兑换连接 - {datetime.fromtimestamp(exchange_time)}")
+            for plan in plans:
+                logger.info(f"已添加定时兑换任务 {plan.account.bbs_uid}"
+                            f" - {plan.good.general_name}"
+                            f" - {plan.good.time_text}")
+                for worker_id in range(1, concurrency + 1):
+                    coroutines.append(self._worker(plan, worker_id, client))
+                    names.append(f"用户 {plan.account.bbs_uid} - {plan.good.general_name} - 协程 {worker_id}")
+            # 某个协程出错时不能取消其他兑换计划的协程
+            results = await asyncio.gather(*coroutines, return_exceptions=True)
+            for name, result in zip(names, results):
+                if isinstance(result, Exception):
+                    logger.opt(exception=result).error(f"{name} - 兑换协程出错")
+
+    def start(self, plans: Iterable[ExchangePlan]):
+        """
+        在后台线程中启动兑换引擎（使用独立的事件循环，不与 Textual 的事件循环竞争）
+
+        :param plans: 兑换计划
+        """
+
+        def target():
+            self._loop = new_event_loop()
+            self._task = self._loop.create_task(self.run(plans))
+            try:
+                self._loop.run_until_complete(self._task)
+            except asyncio.CancelledError:
+                logger.info("兑换引擎已停止")
+            except Exception:
+                logger.exception("兑换引擎运行出错")
+            finally:
+                self._loop.close()
+
+        self._thread = threading.Thread(target=target, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        停止在后台线程中运行的兑换引擎
+        """
+        if self._loop is not None and self._task is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            except RuntimeError:
+                # 事件循环已经结束
+                pass
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,7 +1,6 @@
-import random
 import sys
 import threading
-import time
+from collections import Counter
 from datetime import datetime
 from typing import Optional, Union, Tuple, Dict, List
 from urllib.parse import urlparse
@@ -11,22 +10,23 @@ from apscheduler.events import JobExecutionEvent, EVENT_JOB_EXECUTED
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.schedulers.base import BaseScheduler
 from apscheduler.schedulers.blocking import BlockingScheduler
-from rich.console import RenderableType
-from textual import events
-from textual.app import ComposeResult
-from textual.containers import Container, Horizontal
-from textual.events import Event
-from textual.reactive import reactive
-from textual.widgets import Static, ListView, ListItem
-
-from mys_goods_tool.api import URL_EXCHANGE, good_exchange_sync
-from mys_goods_tool.custom_widget import ControllableButton, UnClickableItem
+
+from mys_goods_tool import coordination
+from mys_goods_tool.api import URL_EXCHANGE, good_exchange_sync, prepare_exchange
+from mys_goods_tool.cancellation import exchange_tokens
+from mys_goods_tool.connection import ExchangeConnectionManager
 from mys_goods_tool.data_model import ExchangeStatus
-from mys_goods_tool.user_data import config as conf, ExchangePlan, Preference, ExchangeResult, different_device_and_salt
-from mys_goods_tool.utils import logger, LOG_FORMAT
+from mys_goods_tool.exchange_engine import AsyncExchangeEngine, new_event_loop
+from mys_goods_tool.exchange_shard import ShardedExchangeEngine
+from mys_goods_tool.preflight import preflight_job
+from mys_goods_tool.timing import ExchangeTrigger, BurstPlanner, TRIGGER_ADVANCE, wait_until
+from mys_goods_tool.user_data import config as conf, context, ExchangePlan, Preference, ExchangeResult, \
+    ExchangeJobId
+from mys_goods_tool.utils import logger, LOG_FORMAT, NtpTime, exchange_logger
 
+exchange_connections = ExchangeConnectionManager(URL_EXCHANGE)
+"""兑换请求共用的连接管理器"""
 
-# TODO: ntp 时间同步
 
 def _get_api_host() -> Optional[str]:
     """
@@ -39,6 +39,10 @@ def _get_api_host() -> Optional[str]:
 def _connection_test():
     """
     连接测试
+
+    除了 Ping 以外，还会通过兑换请求所用的连接测量应用层往返延迟，用于计算兑换请求的发送提前量
+
+    :return: Ping 延迟（单位：毫秒）
     """
     hostname = _get_api_host()
     if not hostname:
@@ -49,9 +53,21 @@ def _connection_test():
         logger.info(f"Ping 商品兑换API服务器 {hostname} 超时")
     elif result is False:
         logger.info(f"Ping 商品兑换API服务器 {hostname} 失败")
+    exchange_connections.measure_rtt()
     return result
 
 
+def _local_run_date(timestamp: float):
+    """
+    将NTP校准后的时间戳转换为调度器所用的本地时间
+
+    返回带时区信息的时间，避免本机时区与调度器时区（Preference.timezone）不一致时被错误解释
+
+    :param timestamp: NTP校准后的时间戳
+    """
+    return datetime.fromtimestamp(timestamp - NtpTime.time_offset).astimezone()
+
+
 def set_scheduler(scheduler: BaseScheduler):
     """
     向兑换计划调度器添加兑换任务以及ping循环
@@ -65,17 +81,53 @@ def set_scheduler(scheduler: BaseScheduler):
         interval = conf.preference.connection_test_interval or Preference.connection_test_interval
         scheduler.add_job(_connection_test, "interval", seconds=interval, id=f"exchange-connection_test")
 
+    # process 兑换引擎由各个兑换进程自行预检
+    preflight_time = conf.preference.preflight_time
+    if preflight_time and conf.preference.exchange_engine != "process":
+        for exchange_time in set(map(lambda x: x.good.time, conf.exchange_plans)):
+            job_id = f"exchange-preflight-{exchange_time}"
+            if not exchange_time or exchange_time <= NtpTime.time() or scheduler.get_job(job_id) is not None:
+                continue
+            scheduler.add_job(preflight_job,
+                              "date",
+                              args=[exchange_time],
+                              run_date=_local_run_date(max(exchange_time - preflight_time, NtpTime.time())),
+                              id=job_id
+                              )
+
+    # 使用 asyncio 或 process 兑换引擎时，调度器只负责连接测试和预检
+    if conf.preference.exchange_engine != "thread":
+        return scheduler
+
     existed_job = scheduler.get_jobs()
+
+    # 同一时刻开始兑换的线程总数，用于确定需要预热的连接数
+    warm_up_time = conf.preference.exchange_warm_up_time
+    if warm_up_time:
+        thread_counter = Counter(map(lambda x: x.good.time, conf.exchange_plans))
+        for exchange_time, plan_count in thread_counter.items():
+            job_id = f"exchange-warm_up-{exchange_time}"
+            if not exchange_time or exchange_time <= NtpTime.time() or scheduler.get_job(job_id) is not None:
+                continue
+            scheduler.add_job(exchange_connections.warm_up,
+                              "date",
+                              args=[plan_count * conf.preference.exchange_thread_count],
+                              run_date=_local_run_date(max(exchange_time - warm_up_time, NtpTime.time())),
+                              id=job_id
+                              )
+
     for plan in conf.exchange_plans:
-        job_id_start = f"exchange-plan-{plan.__hash__()}"
+        job_id_start = ExchangeJobId.prefix(plan)
         # 如果已经存在相同兑换计划，就不再添加
         if not any(job.id.startswith(job_id_start) for job in existed_job):
             for i in range(1, conf.preference.exchange_thread_count + 1):
+                # 调度器提前启动任务，之后由 ExchangeTrigger 精确等待到发出请求的时刻
                 scheduler.add_job(exchange_begin,
                                   "date",
-                                  args=[plan],
-                                  run_date=datetime.fromtimestamp(plan.good.time),
-                                  id=f"{job_id_start}-{i}"
+                                  args=[plan, i],
+                                  run_date=_local_run_date(
+                                      ExchangeTrigger.fire_time(plan.good.time) - TRIGGER_ADVANCE),
+                                  id=str(ExchangeJobId(plan.plan_id, i))
                                   )
             if any(job.id.startswith(job_id_start) for job in scheduler.get_jobs()):
                 logger.info(f"已添加定时兑换任务 {plan.account.bbs_uid}"
@@ -89,24 +141,51 @@ def set_scheduler(scheduler: BaseScheduler):
     return scheduler
 
 
-def exchange_begin(plan: ExchangePlan):
+def exchange_begin(plan: ExchangePlan, worker_id: int = 1):
     """
     到点后执行兑换
 
     :param plan: 兑换计划
+    :param worker_id: 线程编号（从 1 开始），用于确定该线程在发送时刻规划中的位置
     """
-    duration = 0
-    random_x, random_y = conf.preference.exchange_latency
     exchange_status, exchange_result = ExchangeStatus(), None
-
-    # 在兑换开始后的一段时间内，不断尝试兑换，直到成功（因为太早兑换可能被认定不在兑换时间）
-    while duration < conf.preference.exchange_duration:
-        latency = random.uniform(random_x, random_y)
-        time.sleep(latency)
-        exchange_status, exchange_result = good_exchange_sync(plan)
-        if exchange_status and exchange_result.result:
-            break
-        duration += latency
+    client = exchange_connections.client
+    prepared = prepare_exchange(plan)
+    fire_time = ExchangeTrigger.fire_time(plan.good.time)
+    offsets = coordination.plan_offsets(plan, worker_id)
+    logger.info(f"用户 {plan.account.bbs_uid}"
+                f" - {plan.good.general_name}"
+                f" - 线程 {worker_id}"
+                f" - {ExchangeTrigger.lead_time_text()}")
+
+    # 在兑换开始后的一段时间内，按规划的时刻不断尝试兑换，直到成功（因为太早兑换可能被认定不在兑换时间）
+    token = exchange_tokens.plan(plan)
+    instants = BurstPlanner.instants(offsets, fire_time, fire_time + conf.preference.exchange_duration)
+    with exchange_logger.burst():
+        for attempt, instant in enumerate(instants, start=1):
+            fire_error = wait_until(instant)
+            finished = coordination.finished_elsewhere(plan)
+            if finished:
+                exchange_logger.info("用户 {} - {.general_name} - 线程 {} - 其他节点已兑换成功，停止兑换",
+                                     plan.account.bbs_uid, plan.good, worker_id)
+                exchange_status, exchange_result = finished
+                break
+            if token.cancelled:
+                exchange_logger.info("用户 {} - {.general_name} - 线程 {} - {}，停止兑换",
+                                     plan.account.bbs_uid, plan.good, worker_id, token.reason)
+                break
+            exchange_logger.info("用户 {} - {.general_name} - 线程 {} - 第 {} 次尝试"
+                                 " - 触发误差 {:.3f} ms - 相对兑换时间 {:.3f} ms",
+                                 plan.account.bbs_uid, plan.good, worker_id, attempt,
+                                 fire_error * 1000, (NtpTime.time() - plan.good.time) * 1000)
+            exchange_status, exchange_result = good_exchange_sync(plan, client, prepared)
+            outcome = exchange_tokens.settle(plan, exchange_status, exchange_result)
+            if outcome == "success":
+                coordination.report_success(plan)
+                break
+            elif outcome == "too_early":
+                # 服务器认为兑换尚未开始，从现在起重新以最小间隔发送
+                instants.restart(NtpTime.time())
     return exchange_status, exchange_result
 
 
@@ -119,38 +198,49 @@ def exchange_mode_simple():
         logger.info("无兑换计划需要执行")
         return
 
-    if different_device_and_salt:
+    if context.different_device_and_salt:
         logger.warning("检测到设备信息配置 device_config 或 salt_config 使用了非默认值，"
                        "如果你修改过这些配置，需要设置 preference.override_device_and_salt 为 True 以覆盖默认值并生效。"
                        "如果继续，将可能保存默认值到配置文件。")
 
-    scheduler = set_scheduler(BlockingScheduler())
-    finished: Dict[ExchangePlan, List[bool]] = dict(map(lambda x: (x, []), conf.exchange_plans))
+    NtpTime.sync()
+    exchange_tokens.reset()
+    use_engine = conf.preference.exchange_engine in ["asyncio", "process"]
+    # process 兑换引擎由各个兑换进程分别作为节点参与多节点协调
+    if conf.preference.exchange_engine != "process":
+        coordination.start_coordinator(conf.exchange_plans)
+    scheduler = set_scheduler(BackgroundScheduler() if use_engine else BlockingScheduler())
+    plans: Dict[str, ExchangePlan] = dict(map(lambda x: (x.plan_id, x), conf.exchange_plans))
+    """兑换计划ID -> 兑换计划"""
+    finished: Dict[str, List[bool]] = dict(map(lambda x: (x, []), plans))
     """每个兑换计划的结果"""
     lock = threading.Lock()
 
-    @lambda func: scheduler.add_listener(func, EVENT_JOB_EXECUTED)
     def on_executed(event: JobExecutionEvent):
         """
         接收兑换结果
         """
-        if event.job_id.startswith("exchange-plan"):
-            thread_id = int(event.job_id.split('-')[-1])
+        job_id = ExchangeJobId.parse(event.job_id)
+        if job_id is not None:
+            thread_id = job_id.worker
+            plan = plans.get(job_id.plan_id)
+            if plan is None:
+                logger.error(f"收到未知兑换计划的兑换结果 - {event.job_id}")
+                return
             result: Tuple[ExchangeStatus, Optional[ExchangeResult]] = event.retval
             exchange_status, exchange_result = result
 
             if not exchange_status:
-                hash_value = int(event.job_id.split('-')[-2])
-                plan = filter(lambda x: x.__hash__() == hash_value, conf.exchange_plans)
-                plan = next(plan)
                 with lock:
-                    finished[plan].append(False)
-                    logger.error(
-                        f"用户 {plan.account.bbs_uid}"
-                        f" - {plan.good.general_name}"
-                        f" - 线程 {thread_id}"
-                        f" - 兑换请求发送失败")
-                    if len(finished[plan]) == conf.preference.exchange_thread_count:
+                    # 兑换成功后被取消的线程不再输出失败信息
+                    if True not in finished[plan.plan_id]:
+                        logger.error(
+                            f"用户 {plan.account.bbs_uid}"
+                            f" - {plan.good.general_name}"
+                            f" - 线程 {thread_id}"
+                            f" - 兑换请求发送失败")
+                    finished[plan.plan_id].append(False)
+                    if len(finished[plan.plan_id]) == conf.preference.exchange_thread_count:
                         try:
                             conf.exchange_plans.remove(plan)
                         except KeyError:
@@ -159,26 +249,25 @@ def exchange_mode_simple():
                             conf.save()
 
             else:
-                plan = exchange_result.plan
                 with lock:
                     # 如果已经有一个线程兑换成功，就不再接收结果
-                    if True not in finished[plan]:
+                    if True not in finished[plan.plan_id]:
                         if exchange_result.result:
-                            finished[plan].append(True)
+                            finished[plan.plan_id].append(True)
                             logger.info(
                                 f"用户 {plan.account.bbs_uid}"
                                 f" - {plan.good.general_name}"
                                 f" - 线程 {thread_id}"
                                 f" - 兑换成功")
                         else:
-                            finished[plan].append(False)
+                            finished[plan.plan_id].append(False)
                             logger.error(
                                 f"用户 {plan.account.bbs_uid}"
                                 f" - {plan.good.general_name}"
                                 f" - 线程 {thread_id}"
                                 f" - 兑换失败")
 
-                    if len(finished[plan]) == conf.preference.exchange_thread_count:
+                    if len(finished[plan.plan_id]) == conf.preference.exchange_thread_count:
                         try:
                             conf.exchange_plans.remove(plan)
                         except KeyError:
@@ -191,6 +280,30 @@ def exchange_mode_simple():
             if result:
                 print(
                     f"Ping 商品兑换API服务器 {_get_api_host() or 'N/A'} - 延迟 {round(result, 2) if result else 'N/A'} ms")
+            stats = ExchangeTrigger.estimator.stats()
+            if stats:
+                print(f"HTTPS 商品兑换API服务器 - {stats.text}")
+
+    scheduler.add_listener(on_executed, EVENT_JOB_EXECUTED)
+
+    if use_engine:
+        if conf.preference.exchange_engine == "process":
+            engine = ShardedExchangeEngine(on_executed)
+        else:
+            engine = AsyncExchangeEngine(on_executed)
+        loop = new_event_loop()
+        try:
+            logger.info(f"启动 {conf.preference.exchange_engine} 兑换引擎")
+            scheduler.start()
+            loop.run_until_complete(engine.run(conf.exchange_plans))
+            logger.info("所有兑换计划已执行完毕")
+        except KeyboardInterrupt:
+            logger.info(f"停止 {conf.preference.exchange_engine} 兑换引擎")
+        finally:
+            scheduler.shutdown()
+            loop.close()
+            coordination.stop_coordinator()
+        return
 
     try:
         logger.info("启动兑换计划定时器")
@@ -199,282 +312,5 @@ def exchange_mode_simple():
     except KeyboardInterrupt:
         logger.info("停止兑换计划定时器")
         scheduler.shutdown()
-
-
-class EnterExchangeMode(Event):
-    """
-    进入兑换模式的事件
-    """
-    pass
-
-
-class ExitExchangeMode(Event):
-    """
-    退出兑换模式的事件
-    """
-    pass
-
-
-class ExchangeModeWarning(Static):
-    """
-    进入/退出 兑换模式的提示文本
-    """
-    DEFAULT_CSS = """
-    ExchangeModeWarning {
-        width: 3fr;
-    }
-    """
-    ENTER_TEXT = "确定要[bold]进入[/]兑换模式？进入兑换模式后[bold]无法使用其他功能[/]，定时兑换任务将会启动。你随时都可以退出，但定时任务将会暂停。"
-    EXIT_TEXT = "已进入兑换模式，你可以随时[bold]退出[/]。退出后[bold]定时兑换任务将会暂停[/]。"
-    display_text = reactive(ENTER_TEXT)
-
-    def render(self) -> RenderableType:
-        return self.display_text
-
-
-class ExchangeModeView(Container):
-    """
-    兑换模式视图
-    """
-    DEFAULT_CSS = """
-    ExchangeModeView {
-        height: auto;
-        width: 1fr;
-        border: round #666;
-        padding: 1;
-        margin: 1 0;
-    }
-    
-    ExchangeModeView ControllableButton {
-        margin: 0 1;
-        width: 1fr;
-    }
-    
-    ExchangeModeView Horizontal {
-        padding: 1;
-        border: round #666;
-    }
-    
-    ExchangeModeView ListView {
-        overflow: hidden;
-        height: auto;
-    }
-    """
-
-    button_enter = ControllableButton("确定", variant="warning", id="button-exchange_mode-enter")
-    button_exit = ControllableButton("退出", variant="error", id="button-exchange_mode-exit")
-    button_refresh = ControllableButton("刷新", id="button-exchange_mode-refresh")
-    button_exit.hide()
-    warning_text = ExchangeModeWarning()
-    """进入/退出 兑换模式的提示文本"""
-    empty_data_item = ListItem(Static("暂无兑换计划，你可以尝试刷新"))
-    list_view = ListView(empty_data_item)
-    """兑换计划列表"""
-
-    scheduler = BackgroundScheduler()
-    """兑换计划调度器"""
-    lock = threading.Lock()
-    finished: Dict[ExchangePlan, List[bool]] = {}
-    """所有的兑换结果"""
-
-    def compose(self) -> ComposeResult:
-        with Horizontal():
-            yield self.warning_text
-            yield self.button_enter
-            yield self.button_exit
-            yield self.button_refresh
-        yield Static()
-        yield ExchangeModePing()
-        yield self.list_view
-
-    async def update_data(self):
-        """
-        更新兑换计划列表
-        """
-        self.finished.clear()
-        ExchangeResultRow.rows.clear()
-        await self.list_view.clear()
-        for plan in conf.exchange_plans:
-            await self.list_view.append(ExchangeResultRow(plan))
-            self.finished.setdefault(plan, [])
-        if not conf.exchange_plans:
-            await self.list_view.append(self.empty_data_item)
-        set_scheduler(self.scheduler)
-
-    @classmethod
-    def on_executed(cls, event: JobExecutionEvent):
-        """
-        接收兑换结果
-        """
-        try:
-            if event.job_id.startswith("exchange-plan"):
-                result: Tuple[ExchangeStatus, Optional[ExchangeResult]] = event.retval
-                exchange_status, exchange_result = result
-                thread_id = int(event.job_id.split('-')[-1])
-                if not exchange_status:
-                    hash_value = int(event.job_id.split('-')[-2])
-                    plan = filter(lambda x: x.__hash__() == hash_value, conf.exchange_plans)
-                    plan = next(plan)
-                    row = ExchangeResultRow.rows[plan]
-                    with cls.lock:
-                        cls.finished[plan].append(False)
-                        logger.error(
-                            f"用户 {plan.account.bbs_uid}"
-                            f" - {plan.good.general_name}"
-                            f" - 线程 {thread_id}"
-                            f" - 兑换失败")
-                        text = f"[bold red]💦 线程 {thread_id} - 兑换请求失败[/] "
-                        row.result_preview._add_children(ExchangeResultRow.get_result_static(text))
-                        row.result_preview.refresh()
-                        if len(cls.finished[plan]) == conf.preference.exchange_thread_count:
-                            try:
-                                conf.exchange_plans.remove(plan)
-                            except KeyError:
-                                pass
-                            else:
-                                conf.save()
-                else:
-                    plan = exchange_result.plan
-                    with cls.lock:
-                        # 如果已经有一个线程兑换成功，就不再接收结果
-                        if True not in cls.finished[plan]:
-                            row = ExchangeResultRow.rows[plan]
-                            if exchange_result.result:
-                                cls.finished[plan].append(True)
-                                logger.info(
-                                    f"用户 {plan.account.bbs_uid}"
-                                    f" - {plan.good.general_name}"
-                                    f" - 线程 {thread_id}"
-                                    f" - 兑换成功")
-                                text = f"[bold green]🎉 线程 {thread_id} - 兑换成功[/] "
-                            else:
-                                cls.finished[plan].append(False)
-                                logger.error(
-                                    f"用户 {plan.account.bbs_uid}"
-                                    f" - {plan.good.general_name}"
-                                    f" - 线程 {thread_id}"
-                                    f" - 兑换失败")
-                                text = f"[bold red]💦 线程 {thread_id} - 兑换失败[/] "
-
-                            row.result_preview._add_children(ExchangeResultRow.get_result_static(text))
-                            row.result_preview.refresh()
-
-                        if len(cls.finished[plan]) == conf.preference.exchange_thread_count:
-                            try:
-                                conf.exchange_plans.remove(plan)
-                            except KeyError:
-                                pass
-                            else:
-                                conf.save()
-        except:
-            logger.exception("接收兑换结果失败")
-
-    async def _on_button_pressed(self, event: ControllableButton.Pressed):
-        if event.button.id == "button-exchange_mode-enter":
-            await self.update_data()
-            self.button_refresh.disable()
-            self.button_enter.hide()
-            self.button_exit.show()
-            self.warning_text.display_text = self.warning_text.EXIT_TEXT
-            self.post_message(EnterExchangeMode())
-            self.scheduler.start()
-
-        elif event.button.id == "button-exchange_mode-exit":
-            self.button_refresh.enable()
-            self.button_exit.hide()
-            self.button_enter.show()
-            self.warning_text.display_text = self.warning_text.ENTER_TEXT
-            self.post_message(ExitExchangeMode())
-            self.scheduler.shutdown()
-
-        elif event.button.id == "button-exchange_mode-refresh":
-            await self.update_data()
-
-    async def _on_mount(self, event: events.Mount) -> None:
-        self.scheduler.add_listener(self.on_executed, EVENT_JOB_EXECUTED)
-        await self.update_data()
-
-
-class ExchangeResultRow(UnClickableItem):
-    """
-    兑换结果行
-    """
-    DEFAULT_CSS = """
-    ExchangeResultRow {
-        border: round #666;
-        padding: 1;
-        height: auto;
-        width: 1fr;
-        layout: horizontal;
-    }
-    
-    ExchangeResultRow Container {
-        width: 1fr;
-        height: auto;
-        border: round #666;
-        padding: 1;
-        width: 1fr;
-    }
-    """
-    rows: Dict[ExchangePlan, "ExchangeResultRow"] = {}
-    """所有的兑换结果行"""
-
-    def __init__(self, plan: ExchangePlan):
-        """
-        :param plan: 兑换计划
-        """
-        super().__init__()
-        self.plan = plan
-        """兑换计划"""
-        self.result_preview = Container()
-        """兑换结果字样预览"""
-        self.rows.setdefault(plan, self)
-
-    @classmethod
-    def get_result_static(cls, text: str):
-        """
-        获取一个带有边框的Static 用于显示兑换结果
-        """
-        static = Static(text)
-        static.styles.border = "round", "#666"
-        static.styles.width = "1fr"
-        return static
-
-    def compose(self) -> ComposeResult:
-        static = Static(f"[list]"
-                        f"\n👓 米游社账号 - [bold green]{self.plan.account.bbs_uid}[/]"
-                        f"\n📦 商品名称 - [bold green]{self.plan.good.goods_name}[/]"
-                        f"\n📅 兑换时间 - [bold green]{self.plan.good.time_text}[/]"
-                        f"\n🎮 游戏UID - [bold green]{self.plan.game_record.game_role_id if self.plan.game_record is not None else '[yellow]无需设置[/]'}[/]"
-                        f"\n📮 收货地址 - [bold green]{self.plan.address.addr_ext if self.plan.address is not None else '[yellow]无需设置[/]'}[/]"
-                        f"\n[/list]")
-        static.styles.width = "2fr"
-        yield static
-        yield self.result_preview
-
-
-class ExchangeModePing(Static):
-    """
-    兑换模式 Ping 结果的文本
-    """
-    DEFAULT_CSS = """
-    ExchangeModePing {
-        margin: 1 0;
-    }
-    """
-    DEFAULT_VALUE = False
-    ping_value: reactive[Union[float, bool, None]] = reactive(DEFAULT_VALUE)
-
-    def render(self) -> RenderableType:
-        return f"⚡ Ping | 商品兑换API服务器 [yellow]{_get_api_host() or 'N/A'}[/]" \
-               f" - 延迟 [bold green]{round(self.ping_value, 2) or 'N/A'}[/] ms"
-
-    def update_ping(self, event: JobExecutionEvent):
-        """
-        更新 Ping 值
-        """
-        if event.job_id == "exchange-connection_test":
-            self.ping_value = event.retval
-
-    def _on_mount(self, event: events.Mount) -> None:
-        ExchangeModeView.scheduler.add_listener(self.update_ping, EVENT_JOB_EXECUTED)
+        exchange_connections.close()
+        coordination.stop_coordinator()
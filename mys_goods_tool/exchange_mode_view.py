@@ -0,0 +1,360 @@
+import asyncio
+import threading
+from typing import Optional, Union, Tuple, Dict, List
+
+from apscheduler.events import JobExecutionEvent, EVENT_JOB_EXECUTED
+from apscheduler.schedulers.background import BackgroundScheduler
+from rich.console import RenderableType
+from textual import events
+from textual.app import ComposeResult
+from textual.containers import Container, Horizontal
+from textual.events import Event
+from textual.reactive import reactive
+from textual.widgets import Static, ListView, ListItem
+
+from mys_goods_tool import coordination
+from mys_goods_tool.cancellation import exchange_tokens
+from mys_goods_tool.custom_widget import ControllableButton, UnClickableItem
+from mys_goods_tool.data_model import ExchangeStatus
+from mys_goods_tool.exchange_engine import AsyncExchangeEngine
+from mys_goods_tool.exchange_mode import set_scheduler, exchange_connections, _get_api_host
+from mys_goods_tool.exchange_shard import ShardedExchangeEngine
+from mys_goods_tool.preflight import PlanCheck
+from mys_goods_tool.timing import ExchangeTrigger
+from mys_goods_tool.ui_bus import ui_updates
+from mys_goods_tool.user_data import config as conf, ExchangePlan, ExchangeResult, ExchangeJobId
+from mys_goods_tool.utils import logger, NtpTime
+
+
+class EnterExchangeMode(Event):
+    """
+    进入兑换模式的事件
+    """
+    pass
+
+
+class ExitExchangeMode(Event):
+    """
+    退出兑换模式的事件
+    """
+    pass
+
+
+class ExchangeModeWarning(Static):
+    """
+    进入/退出 兑换模式的提示文本
+    """
+    DEFAULT_CSS = """
+    ExchangeModeWarning {
+        width: 3fr;
+    }
+    """
+    ENTER_TEXT = "确定要[bold]进入[/]兑换模式？进入兑换模式后[bold]无法使用其他功能[/]，定时兑换任务将会启动。你随时都可以退出，但定时任务将会暂停。"
+    EXIT_TEXT = "已进入兑换模式，你可以随时[bold]退出[/]。退出后[bold]定时兑换任务将会暂停[/]。"
+    display_text = reactive(ENTER_TEXT)
+
+    def render(self) -> RenderableType:
+        return self.display_text
+
+
+class ExchangeModeView(Container):
+    """
+    兑换模式视图
+    """
+    DEFAULT_CSS = """
+    ExchangeModeView {
+        height: auto;
+        width: 1fr;
+        border: round #666;
+        padding: 1;
+        margin: 1 0;
+    }
+    
+    ExchangeModeView ControllableButton {
+        margin: 0 1;
+        width: 1fr;
+    }
+    
+    ExchangeModeView Horizontal {
+        padding: 1;
+        border: round #666;
+    }
+    
+    ExchangeModeView ListView {
+        overflow: hidden;
+        height: auto;
+    }
+    """
+
+    button_enter = ControllableButton("确定", variant="warning", id="button-exchange_mode-enter")
+    button_exit = ControllableButton("退出", variant="error", id="button-exchange_mode-exit")
+    button_refresh = ControllableButton("刷新", id="button-exchange_mode-refresh")
+    button_exit.hide()
+    warning_text = ExchangeModeWarning()
+    """进入/退出 兑换模式的提示文本"""
+    empty_data_item = ListItem(Static("暂无兑换计划，你可以尝试刷新"))
+    list_view = ListView(empty_data_item)
+    """兑换计划列表"""
+
+    scheduler = BackgroundScheduler()
+    """兑换计划调度器"""
+    engine: Optional[Union[AsyncExchangeEngine, ShardedExchangeEngine]] = None
+    """asyncio 或 process 兑换引擎（仅在偏好设置中选用对应引擎时使用）"""
+    lock = threading.Lock()
+    plans: Dict[str, ExchangePlan] = {}
+    """兑换计划ID -> 兑换计划"""
+    finished: Dict[str, List[bool]] = {}
+    """所有的兑换结果（兑换计划ID -> 各线程的兑换结果）"""
+
+    def compose(self) -> ComposeResult:
+        with Horizontal():
+            yield self.warning_text
+            yield self.button_enter
+            yield self.button_exit
+            yield self.button_refresh
+        yield Static()
+        yield ExchangeModePing()
+        yield self.list_view
+
+    async def update_data(self):
+        """
+        更新兑换计划列表
+        """
+        self.plans.clear()
+        self.finished.clear()
+        ExchangeResultRow.rows.clear()
+        await self.list_view.clear()
+        for plan in conf.exchange_plans:
+            await self.list_view.append(ExchangeResultRow(plan))
+            self.plans.setdefault(plan.plan_id, plan)
+            self.finished.setdefault(plan.plan_id, [])
+        if not conf.exchange_plans:
+            await self.list_view.append(self.empty_data_item)
+        set_scheduler(self.scheduler)
+
+    @classmethod
+    def on_executed(cls, event: JobExecutionEvent):
+        """
+        接收兑换结果（在调度器线程或兑换引擎线程中调用，只通过界面更新总线投递结果，不直接操作界面组件）
+        """
+        try:
+            job_id = ExchangeJobId.parse(event.job_id)
+            if job_id is not None:
+                result: Tuple[ExchangeStatus, Optional[ExchangeResult]] = event.retval
+                exchange_status, exchange_result = result
+                thread_id = job_id.worker
+                plan = cls.plans.get(job_id.plan_id)
+                if plan is None:
+                    logger.error(f"收到未知兑换计划的兑换结果 - {event.job_id}")
+                    return
+                if not exchange_status:
+                    with cls.lock:
+                        # 兑换成功后被取消的线程不再输出失败信息
+                        if True not in cls.finished[plan.plan_id]:
+                            logger.error(
+                                f"用户 {plan.account.bbs_uid}"
+                                f" - {plan.good.general_name}"
+                                f" - 线程 {thread_id}"
+                                f" - 兑换失败")
+                            text = f"[bold red]💦 线程 {thread_id} - 兑换请求失败[/] "
+                            ui_updates.post("exchange-result", (plan.plan_id, text))
+                        cls.finished[plan.plan_id].append(False)
+                        if len(cls.finished[plan.plan_id]) == conf.preference.exchange_thread_count:
+                            try:
+                                conf.exchange_plans.remove(plan)
+                            except KeyError:
+                                pass
+                            else:
+                                conf.save()
+                else:
+                    with cls.lock:
+                        # 如果已经有一个线程兑换成功，就不再接收结果
+                        if True not in cls.finished[plan.plan_id]:
+                            if exchange_result.result:
+                                cls.finished[plan.plan_id].append(True)
+                                logger.info(
+                                    f"用户 {plan.account.bbs_uid}"
+                                    f" - {plan.good.general_name}"
+                                    f" - 线程 {thread_id}"
+                                    f" - 兑换成功")
+                                text = f"[bold green]🎉 线程 {thread_id} - 兑换成功[/] "
+                            else:
+                                cls.finished[plan.plan_id].append(False)
+                                logger.error(
+                                    f"用户 {plan.account.bbs_uid}"
+                                    f" - {plan.good.general_name}"
+                                    f" - 线程 {thread_id}"
+                                    f" - 兑换失败")
+                                text = f"[bold red]💦 线程 {thread_id} - 兑换失败[/] "
+
+                            ui_updates.post("exchange-result", (plan.plan_id, text))
+
+                        if len(cls.finished[plan.plan_id]) == conf.preference.exchange_thread_count:
+                            try:
+                                conf.exchange_plans.remove(plan)
+                            except KeyError:
+                                pass
+                            else:
+                                conf.save()
+            elif event.job_id.startswith("exchange-preflight-"):
+                checks: List[PlanCheck] = event.retval or []
+                for check in filter(lambda x: not x.ready, checks):
+                    text = f"[bold yellow]⚠️ 预检未通过 - {'；'.join(check.problems)}[/] "
+                    ui_updates.post("exchange-result", (check.plan.plan_id, text))
+                for check in filter(lambda x: x.ready and x.warnings, checks):
+                    text = f"[bold yellow]⚠️ {'；'.join(check.warnings)}[/] "
+                    ui_updates.post("exchange-result", (check.plan.plan_id, text))
+        except:
+            logger.exception("接收兑换结果失败")
+
+    async def _on_button_pressed(self, event: ControllableButton.Pressed):
+        if event.button.id == "button-exchange_mode-enter":
+            # 校准时间后重新添加任务，使任务的启动时间使用校准后的时间
+            await asyncio.get_running_loop().run_in_executor(None, NtpTime.sync)
+            if conf.preference.exchange_engine != "process":
+                await asyncio.get_running_loop().run_in_executor(None, coordination.start_coordinator,
+                                                                 conf.exchange_plans)
+            self.scheduler.remove_all_jobs()
+            exchange_tokens.reset()
+            await self.update_data()
+            self.button_refresh.disable()
+            self.button_enter.hide()
+            self.button_exit.show()
+            self.warning_text.display_text = self.warning_text.EXIT_TEXT
+            self.post_message(EnterExchangeMode())
+            self.scheduler.start()
+            if conf.preference.exchange_engine == "asyncio":
+                ExchangeModeView.engine = AsyncExchangeEngine(self.on_executed)
+                self.engine.start(conf.exchange_plans)
+            elif conf.preference.exchange_engine == "process":
+                ExchangeModeView.engine = ShardedExchangeEngine(self.on_executed)
+                self.engine.start(conf.exchange_plans)
+
+        elif event.button.id == "button-exchange_mode-exit":
+            self.button_refresh.enable()
+            self.button_exit.hide()
+            self.button_enter.show()
+            self.warning_text.display_text = self.warning_text.ENTER_TEXT
+            self.post_message(ExitExchangeMode())
+            self.scheduler.shutdown()
+            exchange_connections.close()
+            if self.engine is not None:
+                self.engine.stop()
+                ExchangeModeView.engine = None
+            coordination.stop_coordinator()
+
+        elif event.button.id == "button-exchange_mode-refresh":
+            await self.update_data()
+
+    @staticmethod
+    def show_results(items: List[Tuple[str, str]]):
+        """
+        显示一帧内收到的所有兑换结果（在界面所在的事件循环中调用）
+
+        :param items: (兑换计划ID, 兑换结果字样) 的列表
+        """
+        results: Dict[str, List[Static]] = {}
+        for plan_id, text in items:
+            results.setdefault(plan_id, []).append(ExchangeResultRow.get_result_static(text))
+        for plan_id, statics in results.items():
+            row = ExchangeResultRow.rows.get(plan_id)
+            if row is not None:
+                row.result_preview.mount(*statics)
+
+    async def _on_mount(self, event: events.Mount) -> None:
+        ui_updates.subscribe("exchange-result", self.show_results)
+        self.scheduler.add_listener(self.on_executed, EVENT_JOB_EXECUTED)
+        await self.update_data()
+
+
+class ExchangeResultRow(UnClickableItem):
+    """
+    兑换结果行
+    """
+    DEFAULT_CSS = """
+    ExchangeResultRow {
+        border: round #666;
+        padding: 1;
+        height: auto;
+        width: 1fr;
+        layout: horizontal;
+    }
+    
+    ExchangeResultRow Container {
+        width: 1fr;
+        height: auto;
+        border: round #666;
+        padding: 1;
+        width: 1fr;
+    }
+    """
+    rows: Dict[str, "ExchangeResultRow"] = {}
+    """所有的兑换结果行（兑换计划ID -> 兑换结果行）"""
+
+    def __init__(self, plan: ExchangePlan):
+        """
+        :param plan: 兑换计划
+        """
+        super().__init__()
+        self.plan = plan
+        """兑换计划"""
+        self.result_preview = Container()
+        """兑换结果字样预览"""
+        self.rows.setdefault(plan.plan_id, self)
+
+    @classmethod
+    def get_result_static(cls, text: str):
+        """
+        获取一个带有边框的Static 用于显示兑换结果
+        """
+        static = Static(text)
+        static.styles.border = "round", "#666"
+        static.styles.width = "1fr"
+        return static
+
+    def compose(self) -> ComposeResult:
+        static = Static(f"[list]"
+                        f"\n👓 米游社账号 - [bold green]{self.plan.account.bbs_uid}[/]"
+                        f"\n📦 商品名称 - [bold green]{self.plan.good.goods_name}[/]"
+                        f"\n📅 兑换时间 - [bold green]{self.plan.good.time_text}[/]"
+                        f"\n🎮 游戏UID - [bold green]{self.plan.game_record.game_role_id if self.plan.game_record is not None else '[yellow]无需设置[/]'}[/]"
+                        f"\n📮 收货地址 - [bold green]{self.plan.address.addr_ext if self.plan.address is not None else '[yellow]无需设置[/]'}[/]"
+                        f"\n[/list]")
+        static.styles.width = "2fr"
+        yield static
+        yield self.result_preview
+
+
+class ExchangeModePing(Static):
+    """
+    兑换模式 Ping 结果的文本
+    """
+    DEFAULT_CSS = """
+    ExchangeModePing {
+        margin: 1 0;
+    }
+    """
+    DEFAULT_VALUE = False
+    ping_value: reactive[Union[float, bool, None]] = reactive(DEFAULT_VALUE)
+
+    def render(self) -> RenderableType:
+        return f"⚡ Ping | 商品兑换API服务器 [yellow]{_get_api_host() or 'N/A'}[/]" \
+               f" - 延迟 [bold green]{round(self.ping_value, 2) or 'N/A'}[/] ms" \
+               f"\n⏱ 发送提前量 | {ExchangeTrigger.lead_time_text()}"
+
+    def update_ping(self, event: JobExecutionEvent):
+        """
+        更新 Ping 值
+        """
+        if event.job_id == "exchange-connection_test":
+            ui_updates.post("exchange-ping", event.retval)
+
+    def _show_ping(self, items: List[Union[float, bool, None]]):
+        """
+        显示一帧内最新的 Ping 值（在界面所在的事件循环中调用）
+        """
+        self.ping_value = items[-1]
+
+    def _on_mount(self, event: events.Mount) -> None:
+        ui_updates.subscribe("exchange-ping", self._show_ping)
+        ExchangeModeView.scheduler.add_listener(self.update_ping, EVENT_JOB_EXECUTED)
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
+import asyncio
 from abc import abstractmethod
-from typing import Tuple, Optional, List, Dict, Union, Type, TypeVar
+from typing import Tuple, Optional, List, Dict, Union, Type, TypeVar, Set
 
 from rich.console import RenderableType
 from rich.markdown import Markdown
@@ -14,8 +15,9 @@ from textual.widgets import (
 )
 from textual.widgets._option_list import Option, Separator
 
-from mys_goods_tool.api import get_good_list, get_address, get_game_record, good_exchange, \
-    get_good_detail, get_good_games, get_device_fp
+from mys_goods_tool.account_cache import get_address, get_game_record
+from mys_goods_tool.api import get_good_list, good_exchange, get_good_detail, get_good_games, get_device_fp
+from mys_goods_tool.catalogue_cache import catalogue_cache, diff_goods, resolve_good_times
 from mys_goods_tool.custom_css import *
 from mys_goods_tool.custom_widget import StaticStatus, ControllableButton, LoadingDisplay, \
     DynamicTabbedContent, GameButton, PlanButton, UnClickableItem
@@ -245,11 +247,19 @@ class GoodsContent(BaseExchangePlan):
 
     good_dict: Dict[str, GoodsDictValue] = {}
     """获取到的商品数据以及相关的控件 商品分区简称 -> 商品数据"""
-    selected_tuple: Optional[Tuple[Tuple[str, str], int]] = None
-    """已选择的商品位置 ((商品分区, 分区简称), 商品在OptionList中的位置)"""
+    selected_tuple: Optional[Tuple[str, str, str]] = None
+    """已选择的商品 (商品分区, 分区简称, 商品ID)，使用商品ID而不是选项位置，后台刷新改变选项顺序后仍指向同一商品"""
 
     empty_data_option = Option("暂无商品数据，可能是目前没有限时兑换的商品，可尝试刷新", disabled=True)
     """空的商品选项列表"""
+    loading_data_option = Option("⏳ 正在加载商品数据...", disabled=True)
+    """商品数据加载中的选项列表"""
+    max_concurrency = 4
+    """同时加载商品数据的最大分区数"""
+    revalidate_task: Optional[asyncio.Task] = None
+    """使用缓存数据显示后，在后台重新获取商品数据的任务"""
+    _background_tasks: Set[asyncio.Task] = set()
+    """正在后台获取商品详细信息的任务（保留引用以免被回收）"""
     tabbed_content = DynamicTabbedContent()
 
     class GoodsDictValue:
@@ -293,42 +303,148 @@ class GoodsContent(BaseExchangePlan):
             yield self.loading
         yield self.tabbed_content
 
-    async def update_data(self):
+    def _show_goods(self, goods_data: GoodsDictValue, good_list: Optional[List[Good]]):
+        """
+        显示分区的商品信息列表
+
+        选项列表已有商品时，只应用新旧商品信息列表的差异（新增、变化、移除的商品），选项顺序与 good_list 保持一致
+
+        :param goods_data: 商品分区对应的数据
+        :param good_list: 新的商品信息列表
+        """
+        good_list = filter(lambda x: x.time_limited and not x.time_end, good_list or [])
+        good_list = list({good.goods_id: good for good in good_list}.values())
+        option_list = goods_data.option_list
+        if not goods_data.good_list:
+            option_list.clear_options()
+            option_list.add_options(list(map(lambda x: x.general_name, good_list)))
+        elif good_list:
+            shown = {good.goods_id: good for good in goods_data.good_list}
+            diff = diff_goods(goods_data.good_list, good_list)
+            # 选项的文本无法直接修改，名称有变化的商品需要移除后重新添加
+            renamed = list(filter(lambda x: x.general_name != shown[x.goods_id].general_name, diff.changed))
+            # 按位置从后往前移除，避免移除后其他选项的位置变化
+            removed_ids = set(diff.removed + list(map(lambda x: x.goods_id, renamed)))
+            positions = {goods_id: index for index, goods_id in enumerate(shown)}
+            for index in sorted(map(lambda x: positions[x], removed_ids), reverse=True):
+                option_list.remove_option_at_index(index)
+            for goods_id in removed_ids:
+                shown.pop(goods_id)
+            for good in filter(lambda x: x.goods_id in shown, diff.changed):
+                shown[good.goods_id] = good
+            appended = diff.added + renamed
+            option_list.add_options(list(map(lambda x: x.general_name, appended)))
+            good_list = list(shown.values()) + appended
+
+        if good_list:
+            goods_data.good_list = good_list
+            # 已选择商品时，选项列表保持禁用
+            if self.selected is None and GoodsContent.selected_tuple is None:
+                goods_data.button_select.enable()
+                goods_data.option_list.disabled = False
+        else:
+            goods_data.good_list = None
+            option_list.clear_options()
+            option_list.add_option(self.empty_data_option)
+            goods_data.button_select.disable()
+            goods_data.option_list.disabled = True
+
+    async def _update_partition(self, goods_data: GoodsDictValue, semaphore: asyncio.Semaphore):
+        """
+        刷新单个商品分区的商品信息，获取完成后立即更新该分区的选项列表
+
+        :param goods_data: 商品分区对应的数据
+        :param semaphore: 限制同时加载的分区数
+        """
+        name, abbr = goods_data.partition
+        async with semaphore:
+            good_list_status, good_list = await get_good_list(abbr)
+
+        # 一种情况是获取成功但返回的商品数据为空，一种是API请求失败
+        if not good_list_status:
+            self.app.notice(f"[bold red]获取频道 [bold red]{name}[/] 的商品数据失败！[/]")
+            # TODO 待补充各种错误情况
+            # 获取失败时保留已显示的（缓存的）商品数据
+            if not goods_data.good_list:
+                self._show_goods(goods_data, None)
+        else:
+            catalogue_cache.put_good_list(abbr, good_list, save=False)
+            self._show_goods(goods_data, good_list)
+
+    async def _add_partitions(self, partition_all: List[Tuple[str, str]]):
+        """
+        为新的商品分区创建标签页
+
+        :param partition_all: (商品分区全名, 字母简称) 的列表
+        """
+        # 过滤掉 "全部" 分区
+        partitions = filter(lambda x: x[1] != "all", partition_all)
+        for name, abbr in partitions:
+            if abbr not in self.good_dict:
+                # 如果没有商品频道对应值，则进行创建
+                goods_data = self.GoodsDictValue((name, abbr))
+                self.good_dict.setdefault(abbr, goods_data)
+                await self.tabbed_content.append(goods_data.tap_pane)
+
+    async def update_data(self, stale_only: bool = False):
         """
         刷新商品信息
+
+        各个商品分区并发加载（最多同时加载 max_concurrency 个分区），每个分区加载完成后即可选择
+
+        :param stale_only: 是否只在后台重新获取缓存已过期的数据（不重置已选内容）
         """
         # 进度条、刷新按钮
         self.loading.show()
         self.button_refresh.disable()
 
-        for goods_data in self.good_dict.values():
-            name, abbr = goods_data.partition
-            good_list_status, good_list = await get_good_list(abbr)
-            good_list = list(filter(lambda x: x.time_limited and not x.time_end, good_list))
+        partitions_updated = False
+        if stale_only:
+            if not catalogue_cache.is_fresh(catalogue_cache.partitions):
+                partition_status, partition_all = await get_good_games()
+                if partition_status:
+                    catalogue_cache.put_partitions(partition_all, save=False)
+                    partitions_updated = True
+                    await self._add_partitions(partition_all)
+            targets = [goods_data for abbr, goods_data in self.good_dict.items()
+                       if not catalogue_cache.is_fresh(catalogue_cache.good_list(abbr))]
+        else:
+            targets = list(self.good_dict.values())
+            self.reset_selected()
 
-            # 一种情况是获取成功但返回的商品数据为空，一种是API请求失败
+        # 将还没有商品数据的分区标记为加载中
+        for goods_data in filter(lambda x: not x.good_list, targets):
             goods_data.option_list.clear_options()
-            if not good_list_status:
-                self.app.notice(f"[bold red]获取频道 [bold red]{name}[/] 的商品数据失败！[/]")
-                # TODO 待补充各种错误情况
-            if good_list:
-                goods_data.good_list = good_list
-                good_names = map(lambda x: x.general_name, good_list)
-                for name in good_names:
-                    goods_data.option_list.add_option(name)
-                goods_data.button_select.enable()
-                goods_data.option_list.disabled = False
-            else:
-                goods_data.option_list.add_option(self.empty_data_option)
+            goods_data.option_list.add_option(self.loading_data_option)
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        await asyncio.gather(
+            *map(lambda x: self._update_partition(x, semaphore), targets)
+        )
+        # 所有分区加载完成后统一写入一次缓存文件
+        if targets or partitions_updated:
+            await catalogue_cache.save_async()
+
+        # 商品列表加载完成后，在后台批量获取兑换时间未知的商品的详细信息
+        self._background_tasks.add(asyncio.get_running_loop().create_task(self._resolve_times()))
 
         # 进度条、刷新按钮
         self.loading.hide()
         self.button_refresh.enable()
 
-        # 重置已选内容（包含启用 选择按钮、选项列表）
-        self.reset_selected()
-
     async def _on_mount(self, _: events.Mount):
+        cached_partitions = catalogue_cache.partitions
+        if cached_partitions is not None:
+            # 先使用缓存数据显示，再在后台重新获取已过期的数据
+            await self._add_partitions(cached_partitions.partitions)
+            for abbr, goods_data in self.good_dict.items():
+                cached_good_list = catalogue_cache.good_list(abbr)
+                if cached_good_list is not None:
+                    self._show_goods(goods_data, cached_good_list.goods)
+            self.reset_selected()
+            GoodsContent.revalidate_task = asyncio.get_running_loop().create_task(self.update_data(stale_only=True))
+            return True
+
         # 进度条、刷新按钮
         self.button_refresh.disable()
         self.loading.show()
@@ -341,14 +457,8 @@ class GoodsContent(BaseExchangePlan):
         self.loading.hide()
 
         if partition_status:
-            # 过滤掉 "全部" 分区
-            partitions = filter(lambda x: x[1] != "all", partition_all)
-            for name, abbr in partitions:
-                if abbr not in self.good_dict:
-                    # 如果没有商品频道对应值，则进行创建
-                    goods_data = self.GoodsDictValue((name, abbr))
-                    self.good_dict.setdefault(abbr, goods_data)
-                    await self.tabbed_content.append(goods_data.tap_pane)
+            catalogue_cache.put_partitions(partition_all, save=False)
+            await self._add_partitions(partition_all)
 
             # 更新每个频道的商品数据
             await self.update_data()
@@ -359,6 +469,69 @@ class GoodsContent(BaseExchangePlan):
             # TODO 待补充各种错误情况
             return False
 
+    @staticmethod
+    async def _cancel_revalidate():
+        """
+        取消尚未完成的后台刷新任务，并等待其结束
+        """
+        task = GoodsContent.revalidate_task
+        GoodsContent.revalidate_task = None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def _show_selected(self, name: str, good: Good):
+        """
+        显示已选择的商品
+
+        :param name: 商品分区全名
+        :param good: 商品数据
+        """
+        self.text_view.update(f"已选择商品："
+                              f"\n[list]"
+                              f"\n🗂️ 商品频道：[bold green]{name}[/]"
+                              f"\n📌 名称：[bold green]{good.general_name}[/]"
+                              f"\n💰 价格：[bold green]{good.price}[/] 米游币"
+                              f"\n📦 库存：[bold green]{good.stoke_text}[/] 件"
+                              f"\n📅 兑换时间：[bold green]{good.time_text}[/]"
+                              f"\n📌 商品ID：[bold green]{good.goods_id}[/]"
+                              f"\n[/list]")
+
+    async def _revalidate_detail(self, name: str, good: Good):
+        """
+        在后台获取已选择商品的详细信息，获取成功且商品仍被选择时更新显示
+
+        :param name: 商品分区全名
+        :param good: 商品数据
+        """
+        try:
+            good_detail_status, _ = await get_good_detail(good)
+            if good_detail_status:
+                catalogue_cache.put_detail(good, save=False)
+                await catalogue_cache.save_async()
+                if self.selected is good:
+                    self._show_selected(name, good)
+            elif self.selected is good and catalogue_cache.detail(good.goods_id) is None:
+                # TODO 待补充各种错误情况
+                self.app.notice("[bold red]获取商品详情(game_biz)失败，但你仍然可以尝试进行兑换[/]")
+        finally:
+            self._background_tasks.discard(asyncio.current_task())
+
+    async def _resolve_times(self):
+        """
+        在后台批量获取所有分区中兑换时间未知的商品的详细信息，使选择商品时无需等待网络请求
+        """
+        try:
+            goods = [good for goods_data in self.good_dict.values() for good in goods_data.good_list or []]
+            resolved = await resolve_good_times(goods)
+            if resolved:
+                logger.info(f"已获取 {resolved} 个商品的兑换时间")
+        finally:
+            self._background_tasks.discard(asyncio.current_task())
+
     def reset_selected(self):
         """
         重置商品选择
@@ -374,7 +547,7 @@ class GoodsContent(BaseExchangePlan):
 
         self.selected = None
         self.button_reset.disable()
-        self.selected_tuple = None
+        GoodsContent.selected_tuple = None
         self.text_view.update(self.DEFAULT_TEXT)
 
         AddressContent.check_good_type()
@@ -397,15 +570,17 @@ class GoodsContent(BaseExchangePlan):
                 return
 
             good = good_dict_value.good_list[selected_index]
-            GoodsContent.selected_tuple = name, abbr, selected_index
-
-            # 获取商品详情
-            self.loading.show()
-            good_detail_status, _ = await get_good_detail(good)
-            self.loading.hide()
-            if not good_detail_status:
-                # TODO 待补充各种错误情况
-                self.app.notice("[bold red]获取商品详情(game_biz)失败，但你仍然可以尝试进行兑换[/]")
+            GoodsContent.selected_tuple = name, abbr, good.goods_id
+
+            # 获取商品详情：先使用缓存的详细信息（没有则使用商品列表中的数据）显示，缓存不存在或已过期时在后台重新获取，
+            # 选择商品时不等待网络请求
+            cached_detail = catalogue_cache.detail(good.goods_id)
+            if cached_detail is not None:
+                good.update(cached_detail.good)
+            if not catalogue_cache.is_fresh(cached_detail):
+                self._background_tasks.add(asyncio.get_running_loop().create_task(
+                    self._revalidate_detail(name, good)
+                ))
             self.selected = good
 
             # 启用重置按钮
@@ -422,15 +597,7 @@ class GoodsContent(BaseExchangePlan):
             if AccountContent._selected is not None:
                 GameRecordContent.check_good_type()
 
-            self.text_view.update(f"已选择商品："
-                                  f"\n[list]"
-                                  f"\n🗂️ 商品频道：[bold green]{name}[/]"
-                                  f"\n📌 名称：[bold green]{good.general_name}[/]"
-                                  f"\n💰 价格：[bold green]{good.price}[/] 米游币"
-                                  f"\n📦 库存：[bold green]{good.stoke_text}[/] 件"
-                                  f"\n📅 兑换时间：[bold green]{good.time_text}[/]"
-                                  f"\n📌 商品ID：[bold green]{good.goods_id}[/]"
-                                  f"\n[/list]")
+            self._show_selected(name, good)
 
             if good.is_virtual and AccountContent._selected is not None:
                 await ExchangePlanView.game_record_content.update_data()
@@ -444,6 +611,8 @@ class GoodsContent(BaseExchangePlan):
             else:
                 good_games_result = True
             if good_games_result:
+                # 先停止使用缓存数据显示后启动的后台刷新，避免与手动刷新同时修改选项列表
+                await self._cancel_revalidate()
                 await self.update_data()
 
         elif event.button.id == "button-goods-reset":
@@ -477,9 +646,11 @@ class GameRecordContent(BaseExchangePlan):
     record_list: List[GameRecord] = []
     """游戏账号列表"""
 
-    async def update_data(self):
+    async def update_data(self, force: bool = False):
         """
         更新游戏账号列表
+
+        :param force: 是否忽略缓存的数据重新获取
         """
         if GoodsContent._selected is None:
             return
@@ -489,7 +660,7 @@ class GameRecordContent(BaseExchangePlan):
         self.button_refresh.disable()
         self.option_list.disabled = False
 
-        record_status, GameRecordContent.record_list = await get_game_record(AccountContent._selected)
+        record_status, GameRecordContent.record_list = await get_game_record(AccountContent._selected, force)
         self.option_list.clear_options()
         if not record_status:
             self.app.notice(f"[bold red]获取游戏账号列表失败！[/]")
@@ -604,7 +775,7 @@ class GameRecordContent(BaseExchangePlan):
         elif event.button.id == "button-game_uid-refresh":
             # 按下“刷新”按钮时触发的事件
 
-            await self.update_data()
+            await self.update_data(force=True)
 
         elif event.button.id == "button-game_uid-reset":
             # 按下“重置”按钮时触发的事件
@@ -647,9 +818,11 @@ class AddressContent(BaseExchangePlan):
     address_list: List[Address] = []
     """收货地址列表"""
 
-    async def update_data(self):
+    async def update_data(self, force: bool = False):
         """
         更新收货地址列表
+
+        :param force: 是否忽略缓存的数据重新获取
         """
         if AccountContent._selected is None:
             return
@@ -659,7 +832,7 @@ class AddressContent(BaseExchangePlan):
         self.button_refresh.disable()
         self.option_list.disabled = False
 
-        address_status, AddressContent.address_list = await get_address(AccountContent._selected)
+        address_status, AddressContent.address_list = await get_address(AccountContent._selected, force)
         self.option_list.clear_options()
         if not address_status:
             self.app.notice(f"[bold red]获取收货地址列表失败！[/]")
@@ -778,7 +951,7 @@ class AddressContent(BaseExchangePlan):
         elif event.button.id == "button-address-refresh":
             # 按下“刷新”按钮时触发的事件
 
-            await self.update_data()
+            await self.update_data(force=True)
 
         elif event.button.id == "button-address-reset":
             # 按下“重置”按钮时触发的事件
@@ -920,7 +1093,7 @@ class FinishContent(ExchangePlanContent):
                         fp_status, plan.account.device_fp = await get_device_fp(plan.account.device_id_ios)
                         if fp_status:
                             logger.info(f"成功获取 device_fp: {plan.account.device_fp}")
-                    if conf.save():
+                    if conf.save(sync=True):
                         self.app.notice(f"[bold green]已保存兑换计划[/]")
                     else:
                         self.app.notice(f"[bold red]保存兑换计划失败[/]")
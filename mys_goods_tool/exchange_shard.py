@@ -0,0 +1,253 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from datetime import datetime
+from multiprocessing.connection import Connection, wait
+from typing import Optional, Callable, Iterable, Any, List, Dict
+
+from apscheduler.events import JobExecutionEvent, EVENT_JOB_EXECUTED
+
+from mys_goods_tool import coordination
+from mys_goods_tool.exchange_engine import AsyncExchangeEngine, new_event_loop
+from mys_goods_tool.preflight import preflight, PlanCheck
+from mys_goods_tool.timing import async_wait_until
+from mys_goods_tool import user_data
+from mys_goods_tool.user_data import config as conf, ExchangePlan, Preference
+from mys_goods_tool.utils import logger, NtpTime
+
+
+def partition_plans(plans: Iterable[ExchangePlan], shard_count: int) -> List[List[ExchangePlan]]:
+    """
+    将兑换计划划分到多个进程，同一账号的兑换计划总在同一进程中（使账号级的取消令牌仍然有效），
+    每次将账号分配给当前兑换计划最少的进程
+
+    :param plans: 兑换计划
+    :param shard_count: 进程数
+    :return: 每个进程的兑换计划（不包含空的分片）
+
+    >>> from mys_goods_tool.data_model import Good
+    >>> from mys_goods_tool.user_data import UserAccount, BBSCookies
+    >>> def plan(uid, goods_id):
+    ...     good = Good(type=1, account_exchange_num=0, account_cycle_limit=1, account_cycle_type="forever",
+    ...                 goods_id=goods_id, price=1, icon="")
+    ...     return ExchangePlan(good=good, account=UserAccount(cookies=BBSCookies(stuid=uid)))
+    >>> shards = partition_plans([plan("1", "a"), plan("1", "b"), plan("2", "a"), plan("3", "a")], 2)
+    >>> [sorted((x.account.bbs_uid, x.good.goods_id) for x in shard) for shard in shards]
+    [[('1', 'a'), ('1', 'b')], [('2', 'a'), ('3', 'a')]]
+    >>> len(partition_plans([plan("1", "a")], 4))
+    1
+    """
+    accounts: Dict[str, List[ExchangePlan]] = {}
+    for plan in plans:
+        accounts.setdefault(plan.account.bbs_uid, []).append(plan)
+    shards: List[List[ExchangePlan]] = [[] for _ in range(max(shard_count, 1))]
+    for account_plans in sorted(accounts.values(), key=len, reverse=True):
+        min(shards, key=len).extend(account_plans)
+    return list(filter(None, shards))
+
+
+def _available_cpus() -> List[int]:
+    """
+    获取当前进程可以使用的 CPU 核心
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _shard_main(plans: List[ExchangePlan],
+                config_path: Optional[str],
+                preference: Preference,
+                time_offset: float,
+                cpu: Optional[int],
+                connection: Connection):
+    """
+    兑换进程入口：在独立的事件循环中预检并执行分配到的兑换计划，兑换结果通过管道发送给主进程
+
+    :param plans: 分配到该进程的兑换计划
+    :param config_path: 主进程的用户数据文件路径（spawn 方式创建的进程不会继承主进程的 -c/--conf 参数）
+    :param preference: 主进程的偏好设置
+    :param time_offset: 主进程校准得到的 NTP 时间偏移
+    :param cpu: 绑定的 CPU 核心，为空则不绑定
+    :param connection: 与主进程通信的管道
+    """
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+    # 必须在使用 conf 之前设置，否则 conf 会读取默认路径的用户数据文件
+    user_data.context.config_path = config_path
+    conf.preference = preference
+    NtpTime.time_offset = time_offset
+    # fork 得到的协调器属于主进程，由每个兑换进程作为独立节点重新加入各自的兑换计划
+    coordination.coordinator = None
+    coordination.start_coordinator(plans)
+
+    async def run_preflight(exchange_time: int):
+        await async_wait_until(exchange_time - preference.preflight_time)
+        checks = await preflight(filter(lambda x: x.good.time == exchange_time, plans), save=False)
+        connection.send(JobExecutionEvent(EVENT_JOB_EXECUTED,
+                                          f"exchange-preflight-{exchange_time}",
+                                          None,
+                                          datetime.fromtimestamp(exchange_time),
+                                          retval=checks))
+
+    async def run():
+        coroutines = [AsyncExchangeEngine(connection.send).run(plans)]
+        if preference.preflight_time:
+            for exchange_time in set(map(lambda x: x.good.time, plans)):
+                if exchange_time and exchange_time > NtpTime.time():
+                    coroutines.append(run_preflight(exchange_time))
+        await asyncio.gather(*coroutines)
+
+    loop = new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.close()
+        coordination.stop_coordinator()
+        connection.close()
+
+
+class ShardedExchangeEngine:
+    """
+    多进程兑换引擎
+
+    将兑换计划按账号划分到多个绑定 CPU 核心的进程中，每个进程运行独立的 asyncio 兑换引擎（独立的连接池、预热和触发循环），
+    不再受单个解释器 GIL 的限制。兑换结果和预检结果通过管道汇总到主进程，由主进程中的监听器输出日志并保存用户数据。
+    """
+
+    def __init__(self, listener: Callable[[JobExecutionEvent], Any]):
+        """
+        :param listener: 兑换结果监听器，与 APScheduler 的 EVENT_JOB_EXECUTED 监听器相同
+        """
+        self.listener = listener
+        """兑换结果监听器"""
+        self._processes: List[multiprocessing.Process] = []
+        self._connections: List[Connection] = []
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _context():
+        """
+        获取创建进程所用的上下文，支持 fork 时使用 fork，使兑换进程继承主进程已加载的用户数据和日志配置
+        """
+        if "fork" in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context("fork")
+        return multiprocessing.get_context("spawn")
+
+    def _spawn(self, plans: Iterable[ExchangePlan]):
+        """
+        创建兑换进程
+        """
+        plans = list(filter(lambda x: x.good.time and x.good.time > NtpTime.time(), plans))
+        cpus = _available_cpus()
+        shards = partition_plans(plans, conf.preference.exchange_process_count or len(cpus))
+        context = self._context()
+        for i, shard in enumerate(shards):
+            receiver, sender = context.Pipe(duplex=False)
+            cpu = cpus[i % len(cpus)] if cpus else None
+            process = context.Process(target=_shard_main,
+                                      args=(shard, user_data.context.config_path, conf.preference,
+                                            NtpTime.time_offset, cpu, sender),
+                                      name=f"exchange-shard-{i + 1}",
+                                      daemon=True)
+            process.start()
+            sender.close()
+            self._processes.append(process)
+            self._connections.append(receiver)
+            logger.info(f"兑换进程 {i + 1}（CPU {cpu}）- 已分配 {len(shard)} 个兑换计划")
+
+    @staticmethod
+    def _sync_accounts(checks: List[PlanCheck]):
+        """
+        将兑换进程预检时刷新的 Cookies 和 device_fp 同步到主进程的用户数据中
+        """
+        repaired = {check.plan.account.bbs_uid: check.plan.account for check in checks}
+        for plan in conf.exchange_plans:
+            account = repaired.get(plan.account.bbs_uid)
+            if account is not None:
+                plan.account.cookies = account.cookies.copy()
+                plan.account.device_fp = account.device_fp
+        for uid, account in repaired.items():
+            target = conf.accounts.get(uid)
+            if target is not None:
+                target.cookies = account.cookies.copy()
+                target.device_fp = account.device_fp
+        conf.save()
+
+    def _collect(self):
+        """
+        接收所有兑换进程的结果，直到所有进程结束
+        """
+        connections = list(self._connections)
+        while connections:
+            for connection in wait(connections):
+                try:
+                    event: JobExecutionEvent = connection.recv()
+                except (EOFError, OSError):
+                    connections.remove(connection)
+                    continue
+                if event.job_id.startswith("exchange-preflight-"):
+                    self._sync_accounts(event.retval)
+                try:
+                    self.listener(event)
+                except Exception:
+                    logger.exception("处理兑换进程的结果失败")
+        for process in self._processes:
+            process.join()
+
+    async def run(self, plans: Iterable[ExchangePlan]):
+        """
+        执行所有兑换计划，直到全部结束
+
+        :param plans: 兑换计划
+        """
+        self._spawn(plans)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._collect)
+        finally:
+            self._terminate()
+            self._close()
+
+    def start(self, plans: Iterable[ExchangePlan]):
+        """
+        在后台启动兑换进程
+
+        :param plans: 兑换计划
+        """
+        self._spawn(plans)
+        self._thread = threading.Thread(target=self._collect, daemon=True)
+        self._thread.start()
+
+    def _terminate(self):
+        """
+        结束仍在运行的兑换进程（进程结束后管道会被关闭，接收结果的循环随之结束）
+        """
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    def _close(self):
+        """
+        关闭与兑换进程通信的管道
+        """
+        for connection in self._connections:
+            connection.close()
+        self._processes.clear()
+        self._connections.clear()
+
+    def stop(self):
+        """
+        停止所有兑换进程
+        """
+        running = any(process.is_alive() for process in self._processes)
+        self._terminate()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._close()
+        if running:
+            logger.info("多进程兑换引擎已停止")
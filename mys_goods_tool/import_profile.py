@@ -0,0 +1,138 @@
+import sys
+import time
+from importlib.abc import MetaPathFinder, Loader
+from typing import List, NamedTuple, Optional
+
+# 该模块用于测量启动时各模块的导入耗时，只能依赖标准库，避免在安装测量器之前就导入了被测量的模块
+
+
+class ImportRecord(NamedTuple):
+    """
+    一个模块的导入耗时
+    """
+    name: str
+    """模块名"""
+    self_time: float
+    """模块自身代码的执行耗时（不包括其导入的其他模块，单位：秒）"""
+    cumulative: float
+    """累计耗时（包括其导入的其他模块，单位：秒）"""
+    depth: int
+    """导入深度（由哪一层导入触发）"""
+
+
+class _TimedLoader(Loader):
+    """
+    包装原有的 Loader，在执行模块代码时计时
+    """
+
+    def __init__(self, loader: Loader, timer: "ImportTimer"):
+        self._loader = loader
+        self._timer = timer
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # 恢复模块属性中的原 Loader，避免影响依赖 Loader 类型的代码
+        module.__loader__ = self._loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self._loader
+        self._timer.exec_module(self._loader, module)
+
+    def __getattr__(self, item):
+        return getattr(self._loader, item)
+
+
+class ImportTimer(MetaPathFinder):
+    """
+    模块导入耗时测量器，效果类似于 python -X importtime，但可以在程序内（包括打包后的可执行文件）使用
+
+    >>> with ImportTimer() as timer:
+    ...     import tabnanny
+    >>> "tabnanny" in map(lambda x: x.name, timer.records)
+    True
+    """
+
+    def __init__(self):
+        self.records: List[ImportRecord] = []
+        """按导入完成的先后顺序排列的导入耗时"""
+        self._children: List[float] = []
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    def exec_module(self, loader: Loader, module):
+        """
+        执行模块代码并记录耗时
+
+        :param loader: 原 Loader
+        :param module: 模块对象
+        """
+        depth = len(self._children)
+        self._children.append(0)
+        start = time.perf_counter()
+        try:
+            loader.exec_module(module)
+        finally:
+            cumulative = time.perf_counter() - start
+            children = self._children.pop()
+            if self._children:
+                self._children[-1] += cumulative
+            self.records.append(ImportRecord(module.__name__, cumulative - children, cumulative, depth))
+
+    def install(self):
+        """
+        开始测量
+        """
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        """
+        停止测量
+        """
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.uninstall()
+
+
+def format_report(records: List[ImportRecord], top: Optional[int] = 30) -> str:
+    """
+    生成导入耗时报告
+
+    :param records: 导入耗时
+    :param top: 只列出自身耗时最多的若干个模块，为 None 时按导入顺序列出所有模块（与 python -X importtime 的格式相同）
+
+    >>> records = [ImportRecord("b", 0.002, 0.002, 1), ImportRecord("a", 0.001, 0.003, 0), ImportRecord("c", 0.0005, 0.0005, 0)]
+    >>> print(format_report(records, top=2))
+    import time: self [us] | cumulative | imported package
+    import time:      2000 |       2000 | b
+    import time:      1000 |       3000 | a
+    共导入 3 个模块，总耗时 3.500 ms
+    """
+    header = "import time: self [us] | cumulative | imported package"
+    if top is None:
+        listed = records
+    else:
+        listed = sorted(records, key=lambda x: x.self_time, reverse=True)[:top]
+    lines = [header]
+    for record in listed:
+        name = "  " * record.depth + record.name if top is None else record.name
+        lines.append(f"import time: {round(record.self_time * 1e6):>9} | {round(record.cumulative * 1e6):>10} | {name}")
+    total = sum(map(lambda x: x.cumulative, filter(lambda x: x.depth == 0, records)))
+    lines.append(f"共导入 {len(records)} 个模块，总耗时 {total * 1000:.3f} ms")
+    return "\n".join(lines)
@@ -0,0 +1,66 @@
+import json
+from typing import Any, Callable, Optional, Union
+
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+
+BACKEND = "json" if orjson is None else "orjson"
+"""当前使用的 JSON 后端（安装了 orjson 时使用 orjson，否则使用标准库 json）"""
+
+JSONDecodeError = json.JSONDecodeError
+"""JSON 解析失败时引发的异常（orjson.JSONDecodeError 是其子类）"""
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """
+    解析 JSON
+
+    可以直接传入响应体的 bytes，无需先解码为字符串
+
+    :param data: JSON 文本
+
+    >>> loads(b'{"retcode": 0, "message": "OK", "data": {"list": [1, 2]}}')
+    {'retcode': 0, 'message': 'OK', 'data': {'list': [1, 2]}}
+    >>> try:
+    ...     loads(b"<html>")
+    ... except JSONDecodeError:
+    ...     print("failed")
+    failed
+    """
+    if orjson is None:
+        return json.loads(data)
+    return orjson.loads(data)
+
+
+def dumps(obj: Any, *, default: Optional[Callable[[Any], Any]] = None, indent: Optional[int] = None) -> str:
+    """
+    序列化为 JSON 文本
+
+    orjson 只支持 2 个空格的缩进，其他缩进（如用户数据文件的 4 个空格）使用标准库 json。
+    标准库 json 保持默认的 ensure_ascii（非 ASCII 字符转义为 \\uXXXX），因此用户数据文件的格式与原先相同；
+    orjson 输出的非 ASCII 字符不转义，只用于兑换请求体和商品目录缓存文件，两者解析结果相同
+
+    :param obj: 要序列化的对象
+    :param default: 无法直接序列化的对象的转换函数
+    :param indent: 缩进的空格数，为空则输出紧凑格式
+
+    >>> dumps({"goods_id": "1", "exchange_num": [1, 2]})
+    '{"goods_id":"1","exchange_num":[1,2]}'
+    >>> loads(dumps({"名称": "原神"})) == {"名称": "原神"}
+    True
+    >>> print(dumps({"名称": "原神"}, indent=4))
+    {
+        "\\u540d\\u79f0": "\\u539f\\u795e"
+    }
+    >>> print(dumps({"a": 1}, indent=4))
+    {
+        "a": 1
+    }
+    """
+    if orjson is not None and indent in (None, 2):
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=default, option=option).decode()
+    return json.dumps(obj, default=default, indent=indent,
+                      separators=(",", ":") if indent is None else None)
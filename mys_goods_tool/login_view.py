@@ -11,6 +11,7 @@ from textual.widgets import (
     Input
 )
 
+from mys_goods_tool.account_cache import account_cache
 from mys_goods_tool.api import create_mobile_captcha, create_mmt, get_login_ticket_by_captcha, \
     get_multi_token_by_login_ticket, get_cookie_token_by_stoken, get_stoken_v2_by_v1, get_ltoken_by_stoken, \
     get_device_fp
@@ -402,6 +403,7 @@ class CaptchaForm(LoginForm):
                     account = conf.accounts[cookies.bbs_uid]
                 else:
                     account.cookies.update(cookies)
+                account_cache.invalidate(account.bbs_uid)
                 fp_status, account.device_fp = await get_device_fp(account.device_id_ios)
                 if fp_status:
                     logger.info(f"成功获取 device_fp: {account.device_fp}")
@@ -448,6 +450,7 @@ class CaptchaForm(LoginForm):
                             logger.info(f"用户 {phone_number} 成功获取 cookie_token: {cookies.cookie_token}")
                             account.cookies.update(cookies)
                             conf.save()
+                            account_cache.invalidate(account.bbs_uid)
                             CaptchaLoginInformation.radio_tuple.cookie_token_by_stoken.turn_on()
 
                             # TODO 2023/04/12 此处如果可以模拟App的登录操作，再标记为登录完成，更安全
@@ -0,0 +1,234 @@
+import asyncio
+from typing import List, Optional, Dict, Set, Iterable, NamedTuple, Tuple
+
+from mys_goods_tool.account_cache import account_cache, get_user_myb, get_address
+from mys_goods_tool.api import get_good_detail, get_cookie_token_by_stoken, get_ltoken_by_stoken, get_device_fp
+from mys_goods_tool.cancellation import exchange_tokens
+from mys_goods_tool.connection import http_clients
+from mys_goods_tool.data_model import Good
+from mys_goods_tool.user_data import config as conf, ExchangePlan, UserAccount
+from mys_goods_tool.utils import logger
+
+
+class AccountCheck(NamedTuple):
+    """
+    账号的预检结果
+    """
+    problems: List[str]
+    """无法自动修复的问题"""
+    repaired: List[str]
+    """已自动修复的内容"""
+    points: Optional[int]
+    """米游币数量，获取失败时为 None"""
+    address_ids: Optional[Set[str]]
+    """收货地址ID，无需检查或获取失败时为 None"""
+
+
+class PlanCheck(NamedTuple):
+    """
+    兑换计划的预检结果
+    """
+    plan: ExchangePlan
+    """兑换计划"""
+    problems: List[str]
+    """导致兑换计划无法兑换成功的问题"""
+    warnings: List[str] = []
+    """可能导致兑换计划无法兑换成功、但不取消兑换计划的问题"""
+
+    @property
+    def ready(self) -> bool:
+        """
+        是否可以进行兑换
+        """
+        return not self.problems
+
+
+async def _check_account(account: UserAccount, check_address: bool) -> AccountCheck:
+    """
+    检查账号：刷新 cookie_token、ltoken 和 device_fp，并获取米游币数量、收货地址
+
+    :param account: 用户账号
+    :param check_address: 是否需要检查收货地址
+    """
+    problems, repaired = [], []
+
+    async def refresh_cookie_token():
+        if not account.cookies.stoken_v2:
+            return
+        status, _ = await get_cookie_token_by_stoken(account.cookies, account.device_id_ios)
+        if status:
+            repaired.append("已刷新 cookie_token")
+        elif status.login_expired:
+            problems.append("登录失效")
+
+    async def refresh_ltoken():
+        if not account.cookies.stoken_v2 or not account.cookies.mid:
+            return
+        status, _ = await get_ltoken_by_stoken(account.cookies, account.device_id_ios)
+        if status:
+            repaired.append("已刷新 ltoken")
+
+    async def refresh_device_fp():
+        status, device_fp = await get_device_fp(account.device_id_ios)
+        if status:
+            account.device_fp = device_fp
+            repaired.append("已刷新 device_fp")
+        elif not account.device_fp:
+            problems.append("无法获取 device_fp")
+
+    async def fetch_points() -> Optional[int]:
+        status, points = await get_user_myb(account, force=True)
+        if status.login_expired:
+            problems.append("登录失效")
+        return points
+
+    async def fetch_address_ids() -> Optional[Set[str]]:
+        if not check_address:
+            return None
+        status, address_list = await get_address(account, force=True)
+        if status.login_expired:
+            problems.append("登录失效")
+        return set(map(lambda x: x.id, address_list)) if address_list is not None else None
+
+    # 先刷新 Cookies，再用刷新后的 Cookies 查询
+    await asyncio.gather(refresh_cookie_token(), refresh_ltoken(), refresh_device_fp())
+    if repaired:
+        account_cache.invalidate(account.bbs_uid)
+    points, address_ids = await asyncio.gather(fetch_points(), fetch_address_ids())
+    return AccountCheck(problems=list(dict.fromkeys(problems)),
+                        repaired=repaired,
+                        points=points,
+                        address_ids=address_ids)
+
+
+async def _check_good(goods_id: str) -> Tuple[bool, Optional[Good]]:
+    """
+    获取商品的最新信息
+
+    :param goods_id: 商品ID
+    :return: (商品是否存在, 商品数据)，获取失败时商品数据为 None
+    """
+    status, good = await get_good_detail(goods_id)
+    return not status.good_not_existed, good
+
+
+def check_plan(plan: ExchangePlan,
+               account: AccountCheck,
+               good: Tuple[bool, Optional[Good]],
+               required_points: Optional[int] = None) -> PlanCheck:
+    """
+    根据账号和商品的预检结果检查兑换计划
+
+    :param plan: 兑换计划
+    :param account: 兑换计划所属账号的预检结果
+    :param good: 兑换计划商品的最新信息，见 _check_good
+    :param required_points: 该账号同时进行的所有兑换计划共需的米游币，为空则只按该兑换计划检查
+
+    >>> from mys_goods_tool.user_data import BBSCookies
+    >>> good = Good(type=1, next_time=100, status="online", account_exchange_num=0, account_cycle_limit=1,
+    ...             account_cycle_type="forever", goods_id="1", price=500, icon="")
+    >>> plan = ExchangePlan(good=good, account=UserAccount(cookies=BBSCookies(stuid="1")))
+    >>> check_plan(plan, AccountCheck([], [], 1000, None), (True, good)).ready
+    True
+    >>> rescheduled = good.copy(update={"next_time": 200})
+    >>> problems = check_plan(plan, AccountCheck([], [], 100, None), (True, rescheduled)).problems
+    >>> problems[0], problems[1].startswith("商品兑换时间已变更")
+    ('米游币不足（100 < 500）', True)
+    >>> check_plan(plan, AccountCheck(["登录失效"], [], None, None), (False, None)).problems
+    ['登录失效', '商品不存在或已下架']
+    >>> check = check_plan(plan, AccountCheck([], [], 800, None), (True, good), required_points=1000)
+    >>> check.ready, check.warnings
+    (True, ['米游币不足以兑换该账号的所有兑换计划（800 < 1000），只有先兑换成功的兑换计划能够兑换'])
+    """
+    problems, warnings = list(account.problems), []
+    if account.points is not None and account.points < plan.good.price:
+        problems.append(f"米游币不足（{account.points} < {plan.good.price}）")
+    elif account.points is not None and required_points is not None and account.points < required_points:
+        # 余额足够兑换其中一部分兑换计划，无法确定哪些兑换计划会先兑换成功，因此不取消兑换计划
+        warnings.append(f"米游币不足以兑换该账号的所有兑换计划（{account.points} < {required_points}），"
+                        f"只有先兑换成功的兑换计划能够兑换")
+    if plan.address is not None and account.address_ids is not None and plan.address.id not in account.address_ids:
+        problems.append("收货地址已被删除")
+
+    existed, detail = good
+    if not existed:
+        problems.append("商品不存在或已下架")
+    elif detail is not None and detail.time and detail.time != plan.good.time:
+        problems.append(f"商品兑换时间已变更为 {detail.time_text}，请刷新兑换计划")
+    return PlanCheck(plan=plan, problems=problems, warnings=warnings)
+
+
+async def preflight(plans: Iterable[ExchangePlan], save: bool = True) -> List[PlanCheck]:
+    """
+    并发检查所有兑换计划的账号和商品，自动修复能修复的问题（刷新 Cookies 和 device_fp），
+    并取消无法兑换成功的兑换计划，避免在兑换时浪费请求
+
+    :param plans: 兑换计划
+    :param save: 修复后是否保存用户数据（兑换进程中为 False，由主进程同步后保存）
+    :return: 每个兑换计划的预检结果
+    """
+    plans = list(plans)
+    accounts: Dict[str, UserAccount] = {}
+    check_address: Dict[str, bool] = {}
+    for plan in plans:
+        accounts.setdefault(plan.account.bbs_uid, plan.account)
+        check_address[plan.account.bbs_uid] = check_address.get(plan.account.bbs_uid) or plan.address is not None
+    goods_ids = list(dict.fromkeys(map(lambda x: x.good.goods_id, plans)))
+
+    results = await asyncio.gather(*[_check_account(account, check_address[uid]) for uid, account in accounts.items()],
+                                   *[_check_good(goods_id) for goods_id in goods_ids])
+    account_checks: Dict[str, AccountCheck] = dict(zip(accounts, results[:len(accounts)]))
+    good_checks: Dict[str, Tuple[bool, Optional[Good]]] = dict(zip(goods_ids, results[len(accounts):]))
+
+    # 将修复后的 Cookies 和 device_fp 同步到同一账号的所有兑换计划以及用户数据中
+    for uid, account in accounts.items():
+        if account_checks[uid].repaired:
+            logger.info(f"兑换预检 - 用户 {uid} - {'，'.join(account_checks[uid].repaired)}")
+            for target in [conf.accounts.get(uid)] + [plan.account for plan in plans if plan.account.bbs_uid == uid]:
+                if target is not None and target is not account:
+                    target.cookies = account.cookies.copy()
+                    target.device_fp = account.device_fp
+    if save and any(check.repaired for check in account_checks.values()):
+        conf.save()
+
+    # 同一账号的兑换计划共用米游币余额，需要按该账号所有兑换计划的总价检查
+    required_points: Dict[str, int] = {}
+    for plan in plans:
+        required_points[plan.account.bbs_uid] = required_points.get(plan.account.bbs_uid, 0) + plan.good.price
+
+    plan_checks = []
+    for plan in plans:
+        check = check_plan(plan,
+                           account_checks[plan.account.bbs_uid],
+                           good_checks[plan.good.goods_id],
+                           required_points[plan.account.bbs_uid])
+        plan_checks.append(check)
+        for warning in check.warnings:
+            logger.warning(f"兑换预检 - 用户 {plan.account.bbs_uid} - {plan.good.general_name} - {warning}")
+        if check.ready:
+            logger.info(f"兑换预检 - 用户 {plan.account.bbs_uid} - {plan.good.general_name} - 通过")
+        else:
+            reason = "；".join(check.problems)
+            logger.error(f"兑换预检 - 用户 {plan.account.bbs_uid} - {plan.good.general_name} - 未通过：{reason}")
+            exchange_tokens.plan(plan).cancel(f"预检未通过（{reason}）")
+    return plan_checks
+
+
+def preflight_job(exchange_time: int) -> List[PlanCheck]:
+    """
+    调度器任务：对在指定时间开始兑换的兑换计划进行预检
+
+    :param exchange_time: 商品兑换时间
+    """
+
+    async def run():
+        try:
+            return await preflight(filter(lambda x: x.good.time == exchange_time, conf.exchange_plans))
+        finally:
+            await http_clients.aclose()
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(run())
+    finally:
+        loop.close()
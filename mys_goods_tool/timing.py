@@ -0,0 +1,326 @@
+import asyncio
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Optional, NamedTuple, List, Tuple, Iterator
+
+from mys_goods_tool.user_data import config as conf
+from mys_goods_tool.utils import NtpTime
+
+SPIN_THRESHOLD = 0.02
+"""距离触发时刻小于该值（单位：秒）时改为忙等待，以避开 time.sleep 的调度误差（仅用于线程兑换引擎）"""
+
+TRIGGER_ADVANCE = 1
+"""调度器提前启动兑换任务的时间（单位：秒），剩余的时间由触发器精确等待"""
+
+RTT_WINDOW = 20
+"""往返延迟估计器保留的最近样本数"""
+
+BURST_MIN_INTERVAL = 0.05
+"""同一线程下兑换请求之间的最小间隔（单位：秒），避免 exchange_latency 最小值为 0 时无限密集地发送"""
+
+
+def wait_until(target: float) -> float:
+    """
+    精确等待到指定的（NTP校准后的）时间戳
+
+    先粗略睡眠，在接近目标时刻时改为基于 time.perf_counter 的忙等待。
+    等待开始时将目标时刻换算为 perf_counter 时刻，之后不再受系统时间跳变影响。
+
+    :param target: 目标时间戳（NTP校准后的时间，单位：秒）
+    :return: 实际触发时刻与目标时刻的误差（单位：秒），正数表示晚于目标
+
+    >>> assert wait_until(NtpTime.time() - 1) >= 1
+    """
+    deadline = time.perf_counter() + (target - NtpTime.time())
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        elif remaining > SPIN_THRESHOLD:
+            time.sleep(remaining - SPIN_THRESHOLD)
+    return time.perf_counter() - deadline
+
+
+async def async_wait_until(target: float) -> float:
+    """
+    等待到指定的（NTP校准后的）时间戳（异步版本）
+
+    通过 loop.call_at 在事件循环的单调时钟上定时唤醒，不进行忙等待（忙等待会阻塞同一事件循环中的其他协程和网络 I/O），
+    因此误差取决于事件循环的定时精度（通常在 1 ms 左右）
+
+    :param target: 目标时间戳（NTP校准后的时间，单位：秒）
+    :return: 实际唤醒时刻与目标时刻的误差（单位：秒），正数表示晚于目标
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (target - NtpTime.time())
+    if deadline > loop.time():
+        waiter = loop.create_future()
+        handle = loop.call_at(deadline, lambda: waiter.done() or waiter.set_result(None))
+        try:
+            await waiter
+        finally:
+            handle.cancel()
+    return loop.time() - deadline
+
+
+class RttStats(NamedTuple):
+    """
+    往返延迟样本的分布（单位：秒）
+    """
+    count: int
+    """样本数"""
+    minimum: float
+    """最小值"""
+    median: float
+    """中位数"""
+    p90: float
+    """90 百分位数"""
+    maximum: float
+    """最大值"""
+
+    @property
+    def text(self):
+        """
+        分布文本
+        """
+        return f"往返延迟中位数 {round(self.median * 1000, 2)} ms" \
+               f"（最小 {round(self.minimum * 1000, 2)} ms，P90 {round(self.p90 * 1000, 2)} ms，" \
+               f"最大 {round(self.maximum * 1000, 2)} ms，共 {self.count} 个样本）"
+
+
+class RttEstimator:
+    """
+    往返延迟估计器
+
+    保存最近 RTT_WINDOW 个通过兑换请求所用连接测得的应用层往返延迟（HTTPS 请求发出到收到响应头），
+    以中位数的一半作为单向延迟，避免个别抖动的样本影响发送提前量
+
+    >>> estimator = RttEstimator(window=3)
+    >>> assert estimator.stats() is None and estimator.one_way() == 0
+    >>> for rtt in (0.5, 0.02, 0.04, 0.03):
+    ...     estimator.add(rtt)
+    >>> estimator.samples
+    [0.02, 0.04, 0.03]
+    >>> estimator.stats().median
+    0.03
+    >>> estimator.one_way()
+    0.015
+    """
+
+    def __init__(self, window: int = RTT_WINDOW):
+        """
+        :param window: 保留的最近样本数
+        """
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, rtt: float):
+        """
+        记录一个往返延迟样本
+
+        :param rtt: 往返延迟（单位：秒）
+        """
+        with self._lock:
+            self._samples.append(rtt)
+
+    @property
+    def samples(self) -> List[float]:
+        """
+        当前保留的样本（按记录顺序）
+        """
+        with self._lock:
+            return list(self._samples)
+
+    def stats(self) -> Optional[RttStats]:
+        """
+        获取样本分布，没有样本时为 None
+        """
+        samples = sorted(self.samples)
+        if not samples:
+            return None
+        return RttStats(count=len(samples),
+                        minimum=samples[0],
+                        median=statistics.median(samples),
+                        p90=samples[min(len(samples) - 1, int(len(samples) * 0.9))],
+                        maximum=samples[-1])
+
+    def one_way(self) -> float:
+        """
+        估计的单向延迟（单位：秒），没有样本时为 0
+        """
+        stats = self.stats()
+        return stats.median / 2 if stats else 0
+
+
+class ExchangeTrigger:
+    """
+    高精度兑换触发器
+    """
+    estimator = RttEstimator()
+    """到商品兑换API服务器的往返延迟估计器"""
+
+    @classmethod
+    def lead_time(cls) -> float:
+        """
+        兑换请求需要提前发出的时间（单位：秒），使请求在兑换时间到达服务器，而不是在兑换时间离开本机
+
+        >>> ExchangeTrigger.estimator.add(0.04)
+        >>> assert ExchangeTrigger.lead_time() == conf.preference.exchange_lead_offset + (
+        ...     0.02 if conf.preference.enable_rtt_compensation else 0)
+        >>> ExchangeTrigger.estimator = RttEstimator()
+        """
+        lead = conf.preference.exchange_lead_offset
+        if conf.preference.enable_rtt_compensation:
+            lead += cls.estimator.one_way()
+        return lead
+
+    @classmethod
+    def lead_time_text(cls) -> str:
+        """
+        当前发送提前量及其依据的文本
+        """
+        stats = cls.estimator.stats()
+        return f"提前 {round(cls.lead_time() * 1000, 2)} ms 发出 - " \
+               f"{stats.text if stats else '暂无往返延迟样本'}"
+
+    @classmethod
+    def fire_time(cls, exchange_time: float) -> float:
+        """
+        计算实际发出兑换请求的时间戳
+
+        :param exchange_time: 商品兑换时间
+        """
+        return exchange_time - cls.lead_time()
+
+    @classmethod
+    def wait(cls, exchange_time: float) -> float:
+        """
+        等待到发出兑换请求的时刻
+
+        :param exchange_time: 商品兑换时间
+        :return: 实际触发时刻与计划触发时刻的误差（单位：秒）
+        """
+        return wait_until(cls.fire_time(exchange_time))
+
+    @classmethod
+    async def async_wait(cls, exchange_time: float) -> float:
+        """
+        等待到发出兑换请求的时刻（异步版本）
+
+        :param exchange_time: 商品兑换时间
+        :return: 实际触发时刻与计划触发时刻的误差（单位：秒）
+        """
+        return await async_wait_until(cls.fire_time(exchange_time))
+
+
+class BurstPlanner:
+    """
+    兑换请求发送时刻规划器
+
+    为同一兑换计划的所有线程/协程规划确定的发送时刻：所有线程共用一条发送时刻序列，按顺序轮流分配，
+    使各线程的请求在时间上均匀错开；同一线程的请求间隔在兑换开始时最小，随后线性增加到最大值，
+    以较少的请求覆盖整个兑换时段，并且不会超过截止时间
+    """
+
+    @staticmethod
+    def plan(workers: int,
+             duration: float,
+             interval: Tuple[float, float],
+             shares: Optional[int] = None) -> List[List[float]]:
+        """
+        规划每个线程的发送时刻
+
+        :param workers: 线程/协程数，决定发送时刻序列的密度
+        :param duration: 兑换持续时间（单位：秒），所有发送时刻都早于该时间
+        :param interval: 同一线程下请求间隔的 (最小值, 最大值)（单位：秒）
+        :param shares: 将发送时刻序列轮流分配给多少份（默认为 workers），用于多节点分摊同一条序列
+        :return: 每份的发送时刻（相对于第一个请求的发送时刻，单位：秒）
+
+        >>> schedule = BurstPlanner.plan(2, 1, (0.1, 0.5))
+        >>> schedule[0][:2], schedule[1][:1]
+        ([0.0, 0.11], [0.05])
+        >>> assert all(0 <= x < 1 for offsets in schedule for x in offsets)
+        >>> assert all(offsets == sorted(offsets) for offsets in schedule)
+        >>> assert BurstPlanner.plan(3, 0, (0, 0.5)) == [[0.0], [], []]
+        >>> shared = BurstPlanner.plan(2, 1, (0.1, 0.5), shares=4)
+        >>> sorted(sum(shared, [])) == sorted(sum(schedule, []))
+        True
+        """
+        workers = max(workers, 1)
+        shares = max(shares or workers, 1)
+        minimum, maximum = interval
+        minimum = max(minimum, BURST_MIN_INTERVAL)
+        maximum = max(maximum, minimum)
+        schedule: List[List[float]] = [[] for _ in range(shares)]
+        offset, index = 0.0, 0
+        while offset < duration or index == 0:
+            schedule[index % shares].append(round(offset, 6))
+            progress = offset / duration if duration > 0 else 1
+            offset += (minimum + (maximum - minimum) * progress) / workers
+            index += 1
+        return schedule
+
+    @staticmethod
+    def instants(offsets: List[float], start: float, deadline: float) -> "BurstInstants":
+        """
+        按顺序给出线程的发送时刻（NTP校准后的时间戳）
+
+        :param offsets: 线程的发送时刻（相对于 start）
+        :param start: 第一个请求的发送时刻
+        :param deadline: 截止时间，晚于该时间的发送时刻将被忽略
+        """
+        return BurstInstants(offsets, start, deadline)
+
+
+class BurstInstants(Iterator[float]):
+    """
+    线程的发送时刻迭代器
+
+    如果上一个请求耗时过长，已经错过的发送时刻中只保留最后一个（即立即发送），不会补发积压的请求；
+    服务器返回兑换尚未开始时，可以从当前时间重新开始发送时刻序列，使请求间隔回到最小值
+
+    >>> instants = BurstPlanner.instants([0, 1, 2], 1e10, 1e10 + 1.5)
+    >>> next(instants), next(instants)
+    (10000000000.0, 10000000001.0)
+    >>> instants.restart(1e10 + 1.2)
+    >>> list(instants)
+    [10000000001.2]
+    """
+
+    def __init__(self, offsets: List[float], start: float, deadline: float):
+        """
+        :param offsets: 线程的发送时刻（相对于 start）
+        :param start: 第一个请求的发送时刻
+        :param deadline: 截止时间，晚于该时间的发送时刻将被忽略
+        """
+        self.offsets = offsets
+        """线程的发送时刻（相对于 start）"""
+        self.start = start
+        """第一个请求的发送时刻"""
+        self.deadline = deadline
+        """截止时间"""
+        self._index = 0
+
+    def restart(self, start: float):
+        """
+        从新的时刻重新开始发送时刻序列（截止时间不变）
+
+        :param start: 新的第一个请求的发送时刻
+        """
+        self.start = start
+        self._index = 0
+
+    def __next__(self) -> float:
+        while self._index < len(self.offsets):
+            i = self._index
+            self._index += 1
+            instant = self.start + self.offsets[i]
+            if instant > self.deadline:
+                break
+            if i + 1 < len(self.offsets) and self.start + self.offsets[i + 1] <= NtpTime.time():
+                continue
+            return instant
+        self._index = len(self.offsets)
+        raise StopIteration
@@ -2,8 +2,10 @@ from __future__ import annotations
 
 import sys
 from io import StringIO
+from typing import List
 
 from rich.console import RenderableType
+from rich.errors import MarkupError
 from rich.markdown import Markdown
 from rich.text import Text
 from textual import events
@@ -19,12 +21,14 @@ from textual.widgets import (
     Switch
 )
 
+from mys_goods_tool.connection import http_clients
 from mys_goods_tool.custom_css import *
 from mys_goods_tool.custom_widget import RadioStatus, StaticStatus
-from mys_goods_tool.exchange_mode import ExchangeModeView, EnterExchangeMode, ExitExchangeMode
+from mys_goods_tool.exchange_mode_view import ExchangeModeView, EnterExchangeMode, ExitExchangeMode
 from mys_goods_tool.exchange_plan_view import ExchangePlanView
 from mys_goods_tool.login_view import LoginView
-from mys_goods_tool.user_data import ROOT_PATH, VERSION, different_device_and_salt
+from mys_goods_tool.ui_bus import ui_updates, LOG_CHANNEL
+from mys_goods_tool.user_data import ROOT_PATH, VERSION, context
 from mys_goods_tool.utils import LOG_FORMAT, logger
 
 WELCOME_MD = """
@@ -406,11 +410,27 @@ class TuiApp(App):
     class TextLogWriter(StringIO):
         def write(self, text: str) -> None:
             super().write(text)
-            TuiApp.text_log.write(text)
+            # 日志可能来自任意线程，只投递到界面更新总线，由界面所在的事件循环写入日志界面
+            ui_updates.post(LOG_CHANNEL, text)
+
+    @staticmethod
+    def write_logs(texts: List[str]):
+        """
+        将一帧内收到的所有日志写入日志界面（在界面所在的事件循环中调用）
+
+        :param texts: 日志文本列表
+        """
+        for text in texts:
+            try:
+                TuiApp.text_log.write(text)
+            except MarkupError:
+                TuiApp.text_log.write(Text(text))
 
     def _on_mount(self, _: events.Mount) -> None:
         TuiApp.app = self
         TuiApp.text_log_writer = TuiApp.TextLogWriter()
+        ui_updates.subscribe(LOG_CHANNEL, self.write_logs)
+        self.set_interval(ui_updates.interval, ui_updates.dispatch, name="ui-updates")
         logger.add(self.text_log_writer, diagnose=False, level="DEBUG", format=LOG_FORMAT)
         if sys.platform not in ('win32', 'cygwin', 'cli'):
             try:
@@ -421,11 +441,14 @@ class TuiApp(App):
                 import asyncio
                 asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
         self.query_one("Welcome Button", Button).focus()
-        if different_device_and_salt:
+        if context.different_device_and_salt:
             logger.warning("检测到设备信息配置 device_config 或 salt_config 使用了非默认值，"
                            "如果你修改过这些配置，需要设置 preference.override_device_and_salt 为 True 以覆盖默认值并生效。"
                            "如果继续，将可能保存默认值到配置文件。")
 
+    async def _on_unmount(self, _: events.Unmount) -> None:
+        await http_clients.aclose()
+
     def action_screenshot(self, filename: str | None = None, path: str = str(ROOT_PATH)) -> None:
         """Save an SVG "screenshot". This action will save an SVG file containing the current contents of the screen.
 
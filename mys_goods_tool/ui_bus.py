@@ -0,0 +1,120 @@
+import sys
+import threading
+import traceback
+from typing import Any, Callable, Dict, List
+
+from mys_goods_tool.utils import logger
+
+# 该模块不依赖 textual，调度器线程、兑换引擎等只需投递事件，由界面所在的事件循环统一处理
+
+LOG_CHANNEL = "log"
+"""日志输出频道，该频道的处理函数出错时不能再通过 logger 输出，否则错误日志会再次投递到该频道"""
+
+
+class UpdateBus:
+    """
+    界面更新总线
+
+    其他线程（如调度器线程、日志输出）只投递轻量的事件，不直接操作界面组件；
+    界面所在的事件循环以限定的帧率调用 `dispatch` 批量取出事件，同一帧内同一频道的事件合并为一次处理。
+
+    >>> bus = UpdateBus()
+    >>> bus.subscribe("result", lambda items: print("result", items))
+    >>> bus.subscribe("ping", lambda items: print("ping", items[-1]))
+    >>> for i in range(3):
+    ...     bus.post("result", i)
+    ...     bus.post("ping", i * 10)
+    >>> bus.pending
+    6
+    >>> bus.dispatch()
+    result [0, 1, 2]
+    ping 20
+    >>> bus.dispatch()
+    >>> bus.pending
+    0
+    """
+
+    def __init__(self, frame_rate: float = 20):
+        """
+        :param frame_rate: 每秒最多处理事件的次数
+        """
+        self.frame_rate = frame_rate
+        """每秒最多处理事件的次数"""
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[Any]] = {}
+        self._handlers: Dict[str, Callable[[List[Any]], None]] = {}
+
+    @property
+    def interval(self) -> float:
+        """
+        两次处理事件之间的间隔（单位：秒）
+        """
+        return 1 / self.frame_rate
+
+    @property
+    def pending(self) -> int:
+        """
+        等待处理的事件数
+        """
+        with self._lock:
+            return sum(map(len, self._pending.values()))
+
+    def subscribe(self, channel: str, handler: Callable[[List[Any]], None]):
+        """
+        设置频道的事件处理函数（在界面所在的事件循环中调用），重复设置时覆盖原处理函数
+
+        :param channel: 频道名
+        :param handler: 处理函数，参数为该帧内按投递顺序排列的所有事件
+        """
+        self._handlers[channel] = handler
+
+    def post(self, channel: str, item: Any):
+        """
+        投递事件（线程安全，可以在任意线程中调用）
+
+        :param channel: 频道名
+        :param item: 事件内容
+        """
+        with self._lock:
+            self._pending.setdefault(channel, []).append(item)
+
+    def dispatch(self):
+        """
+        取出所有等待处理的事件并交给对应的处理函数，没有处理函数的频道的事件将被丢弃
+
+        >>> import io, contextlib
+        >>> bus = UpdateBus()
+        >>> bus.subscribe(LOG_CHANNEL, lambda items: 1 / 0)
+        >>> bus.post(LOG_CHANNEL, "text")
+        >>> with contextlib.redirect_stderr(io.StringIO()) as stderr:
+        ...     bus.dispatch()
+        >>> "ZeroDivisionError" in stderr.getvalue(), bus.pending
+        (True, 0)
+        """
+        if not self._pending:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for channel, items in pending.items():
+            handler = self._handlers.get(channel)
+            if handler is None:
+                continue
+            try:
+                handler(items)
+            except Exception:
+                if channel == LOG_CHANNEL:
+                    print(f"处理界面更新失败 - 频道 {channel}", file=sys.stderr)
+                    traceback.print_exc(file=sys.stderr)
+                else:
+                    logger.exception(f"处理界面更新失败 - 频道 {channel}")
+
+    def clear(self):
+        """
+        丢弃所有等待处理的事件
+        """
+        with self._lock:
+            self._pending.clear()
+
+
+ui_updates = UpdateBus()
+"""界面更新总线"""
@@ -1,13 +1,19 @@
+import atexit
+import hashlib
 import os
+import tempfile
+import threading
+import time
 from json import JSONDecodeError
 from pathlib import Path
 from typing import List, Union, Optional, Tuple, Any, Dict, Set, Callable, TYPE_CHECKING, AbstractSet, \
-    Mapping
+    Mapping, Literal, NamedTuple
 
 from httpx import Cookies
 from loguru import logger
 from pydantic import BaseModel, ValidationError, BaseSettings, validator, Extra
 
+from mys_goods_tool import json_backend
 from mys_goods_tool.data_model import BaseModelWithSetter, Good, Address, GameRecord, BaseModelWithUpdate
 
 ROOT_PATH = Path("./")
@@ -19,6 +25,12 @@ CONFIG_PATH = ROOT_PATH / "user_data.json"
 VERSION = "2.1.0"
 """程序当前版本"""
 
+SAVE_DELAY = 0.5
+"""保存用户数据文件前等待的时间（单位：秒），期间的多次保存会被合并为一次写入"""
+
+SERIALIZE_RETRIES = 3
+"""序列化期间用户数据被其他线程修改时，序列化的最大尝试次数"""
+
 if TYPE_CHECKING:
     IntStr = Union[int, str]
     DictStrAny = Dict[str, Any]
@@ -260,17 +272,71 @@ class ExchangePlan(BaseModel):
     game_record: Optional[GameRecord]
     """商品对应的游戏的玩家账号"""
 
-    def __hash__(self):
-        return hash(
-            (
-                self.good.goods_id,
-                self.good.time,
-                self.address.id if self.address else None,
-                self.account.bbs_uid,
-                self.game_record.game_role_id if self.game_record else None
-            )
+    def _identity(self):
+        """
+        决定兑换计划是否相同的内容
+        """
+        return (
+            self.good.goods_id,
+            self.good.time,
+            self.address.id if self.address else None,
+            self.account.bbs_uid,
+            self.game_record.game_role_id if self.game_record else None
         )
 
+    def __hash__(self):
+        return hash(self._identity())
+
+    @property
+    def plan_id(self) -> str:
+        """
+        兑换计划ID
+
+        与 __hash__ 不同，不受 Python 哈希随机化影响，在不同进程中保持一致，且不包含负号
+        """
+        return hashlib.md5(repr(self._identity()).encode()).hexdigest()[:16]
+
+
+class ExchangeJobId(NamedTuple):
+    """
+    兑换任务ID，对应调度器任务ID ``exchange-plan-<兑换计划ID>-<线程编号>``
+
+    >>> job_id = ExchangeJobId("0123456789abcdef", 2)
+    >>> str(job_id)
+    'exchange-plan-0123456789abcdef-2'
+    >>> assert ExchangeJobId.parse(str(job_id)) == job_id
+    >>> assert ExchangeJobId.parse("exchange-connection_test") is None
+    """
+    plan_id: str
+    """兑换计划ID"""
+    worker: int
+    """线程编号（从 1 开始）"""
+
+    def __str__(self):
+        return f"exchange-plan-{self.plan_id}-{self.worker}"
+
+    @classmethod
+    def prefix(cls, plan: ExchangePlan):
+        """
+        兑换计划对应的所有兑换任务ID的共同前缀
+
+        :param plan: 兑换计划
+        """
+        return f"exchange-plan-{plan.plan_id}-"
+
+    @classmethod
+    def parse(cls, job_id: str) -> Optional["ExchangeJobId"]:
+        """
+        解析调度器任务ID
+
+        :param job_id: 调度器任务ID
+        :return: 不是兑换任务时返回 None
+        """
+        if not job_id.startswith("exchange-plan-"):
+            return None
+        plan_id, _, worker = job_id[len("exchange-plan-"):].rpartition("-")
+        return cls(plan_id, int(worker))
+
 
 class ExchangeResult(BaseModel):
     """
@@ -300,8 +366,9 @@ class Preference(BaseSettings):
     """最大网络请求重试次数"""
     retry_interval: float = 2
     """网络请求重试间隔（单位：秒）（除兑换请求外）"""
+    enable_http2: bool = False
+    """是否对除兑换请求外的网络请求启用 HTTP/2（需要安装 h2）"""
 
-    # TODO: 目前并没有实现使用同步后的时间进行兑换
     enable_ntp_sync: Optional[bool] = True
     """是否开启NTP时间同步（将调整实际发出兑换请求的时间，而不是修改系统时间）"""
     ntp_server: Optional[str] = "ntp.aliyun.com"
@@ -313,12 +380,40 @@ class Preference(BaseSettings):
     """GEETEST行为验证 网站静态文件目录（默认读取本地包自带的静态文件）"""
     geetest_listen_address: Optional[Tuple[str, int]] = ("localhost", 0)
     """登录时使用的 GEETEST行为验证 WEB服务 本地监听地址"""
+    exchange_engine: Literal["thread", "asyncio", "process"] = "thread"
+    """
+    兑换引擎：thread - 每个兑换线程为一个调度器任务；asyncio - 由单个事件循环驱动所有兑换计划；
+    process - 将兑换计划按账号划分到多个绑定 CPU 核心的进程中，每个进程运行一个 asyncio 兑换引擎（适用于大量账号同时兑换）
+    """
+    exchange_process_count: Optional[int] = None
+    """process 兑换引擎的进程数，为空则使用可用的 CPU 核心数"""
     exchange_thread_count: int = 2
-    """兑换线程数"""
+    """兑换线程数（asyncio 引擎下为每个兑换计划的并发数）"""
     exchange_latency: Tuple[float, float] = (0, 0.5)
-    """同一线程下，每个兑换请求之间的间隔时间"""
+    """同一线程下，每个兑换请求之间的间隔时间 (最小值, 最大值)（单位：秒），兑换开始时为最小值，随后逐渐增加到最大值"""
     exchange_duration: float = 5
-    """兑换持续时间随机范围（单位：秒）"""
+    """兑换持续时间（单位：秒），从发出第一个兑换请求开始计算，超过后不再发出新的兑换请求"""
+    exchange_lead_offset: float = 0
+    """兑换请求提前发出的固定时间（单位：秒），可为负数以推迟发出"""
+    enable_rtt_compensation: bool = True
+    """是否根据测得的网络延迟（单向延迟，即往返延迟的一半）自动提前发出兑换请求"""
+    exchange_warm_up_time: Optional[float] = 5
+    """兑换开始前提前预热连接（建立连接并完成TLS握手）的时间（单位：秒），为空则不预热"""
+    preflight_time: Optional[float] = 300
+    """兑换开始前进行预检（刷新 Cookies 和 device_fp，检查登录状态、米游币、收货地址和商品信息）的时间（单位：秒），为空则不预检"""
+    coordination_backend: Optional[str] = None
+    """
+    多节点协调所用的账本后端，为空则不与其他节点协调。
+    同一主机使用 ``sqlite:///<数据库文件路径>``，多台主机使用 ``tcp://<协调服务器地址>:<端口>``（协调服务器通过 ``-m coordinator`` 运行）
+    """
+    coordination_node_id: Optional[str] = None
+    """多节点协调时本节点的ID，为空则使用 <主机名>-<进程ID>"""
+    catalogue_cache_path: Optional[Path] = ROOT_PATH / "catalogue_cache.json"
+    """商品目录缓存文件路径（缓存商品分区、商品信息列表和商品详细信息，用于快速显示商品列表），为空则不使用缓存"""
+    catalogue_cache_max_age: float = 300
+    """商品目录缓存的有效时间（单位：秒），超过后显示缓存数据的同时在后台重新获取"""
+    account_cache_ttl: float = 60
+    """账号数据（游戏账号、收货地址、米游币数量）缓存的有效时间（单位：秒），为 0 则不缓存（但仍会合并同时发出的相同请求）"""
     enable_log_output: bool = True
     """是否保存日志"""
     log_path: Optional[Path] = ROOT_PATH / "logs" / "mys_goods_tool.log"
@@ -417,7 +512,7 @@ class DeviceConfig(BaseSettings):
         pass
 
 
-class UserData(BaseModel, extra=Extra.ignore):
+class UserData(BaseModel, extra=Extra.ignore, json_loads=json_backend.loads, json_dumps=json_backend.dumps):
     """
     用户数据类
     """
@@ -442,11 +537,29 @@ class UserData(BaseModel, extra=Extra.ignore):
             plan = ExchangePlan.parse_obj(plan)
             self.exchange_plans.add(plan)
 
-    def save(self):
+    def save(self, sync: bool = False):
         """
         保存用户数据文件
+
+        默认只将用户数据标记为需要保存，由后台线程在 SAVE_DELAY 秒后序列化并写入文件，
+        短时间内的多次保存只会写入一次，调用方不需要承担序列化和写入文件的开销
+
+        :param sync: 是否在调用方线程中立即序列化并写入（同时取消尚未开始的后台保存）。需要向用户反馈保存结果时应使用立即写入
+        :return: 立即写入时为是否写入成功，否则为 True
         """
-        return write_config_file(self)
+        if not sync:
+            _config_writer.schedule(self)
+            return True
+        _, sequence = _config_writer.take()
+        str_data = _serialize(self)
+        if str_data is None:
+            return False
+        try:
+            _config_writer.write(str_data, sequence)
+        except OSError:
+            logger.exception(f"写入用户数据文件失败，请检查程序是否有权限读取和写入 {_config_file_path()}")
+            return False
+        return True
 
     def json(
             self,
@@ -464,10 +577,11 @@ class UserData(BaseModel, extra=Extra.ignore):
     ) -> str:
         """
         重写 BaseModel.json() 方法，使其支持对 Set 类型的数据进行序列化
+
+        在副本上将兑换计划转换为列表，而不修改对象本身
         """
-        set_plans = self.exchange_plans
-        self.exchange_plans = list(set_plans)
-        json_data = super().json(
+        data = self.copy(update={"exchange_plans": list(self.exchange_plans)})
+        return super(UserData, data).json(
             include=include,
             exclude=exclude,
             by_alias=by_alias,
@@ -479,40 +593,184 @@ class UserData(BaseModel, extra=Extra.ignore):
             models_as_dict=models_as_dict,
             **dumps_kwargs,
         )
-        self.exchange_plans = set_plans
-        return json_data
 
 
-def write_config_file(conf: UserData = UserData()):
+_write_lock = threading.RLock()
+"""用户数据文件写入锁"""
+
+
+def _config_file_path() -> Union[str, Path]:
+    """
+    获取默认运行时上下文中的用户数据文件路径（命令行参数 -c/--conf 指定的路径，未指定时为 CONFIG_PATH）
+    """
+    return context.config_path or CONFIG_PATH
+
+
+def write_config_file(conf: Optional[UserData] = None, path: Union[str, Path, None] = None):
     """
     写入用户数据文件
 
-    :param conf: 配置对象
+    先写入同目录下的临时文件，再替换原文件，避免写入中途退出导致用户数据文件损坏
+
+    :param conf: 配置对象，为空则写入默认配置
+    :param path: 用户数据文件路径，默认为默认运行时上下文中的用户数据文件路径
     """
-    try:
-        str_data = conf.json(indent=4)
-    except (AttributeError, TypeError, ValueError):
-        logger.exception("数据对象序列化失败，可能是数据类型错误")
+    str_data = _serialize(UserData() if conf is None else conf)
+    if str_data is None:
         return False
-    with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-        f.write(str_data)
+    _write_text(str_data, path)
     return True
 
 
-def load_config() -> Tuple[UserData, bool]:
+def _serialize(conf: UserData) -> Optional[str]:
+    """
+    序列化用户数据，序列化期间用户数据被其他线程修改时重试
+
+    :param conf: 配置对象
+    :return: 序列化失败时为 None
+    """
+    for attempt in range(1, SERIALIZE_RETRIES + 1):
+        try:
+            return conf.json(indent=4)
+        except RuntimeError:
+            if attempt == SERIALIZE_RETRIES:
+                logger.exception("数据对象序列化失败，序列化期间用户数据被其他线程修改")
+        except (AttributeError, TypeError, ValueError):
+            logger.exception("数据对象序列化失败，可能是数据类型错误")
+            break
+    return None
+
+
+def _write_text(str_data: str, path: Union[str, Path, None] = None):
+    """
+    写入已序列化的用户数据
+
+    :param str_data: 序列化后的用户数据
+    :param path: 用户数据文件路径，默认为默认运行时上下文中的用户数据文件路径
+    """
+    path = Path(_config_file_path() if path is None else path).absolute()
+    with _write_lock:
+        fd, temp_path = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(str_data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+class _ConfigWriter:
+    """
+    在后台线程中序列化并写入用户数据文件，SAVE_DELAY 秒内的多次保存会被合并为一次写入
+
+    每次取出需要保存的用户数据时分配递增的序号，写入时跳过序号不大于最后一次完成写入的序号的数据，
+    使较早取出的数据不会在较新的数据写入后覆盖它
+    """
+
+    def __init__(self):
+        self._pending: Optional[UserData] = None
+        self._sequence = 0
+        """最后分配的序号"""
+        self._written = 0
+        """最后一次完成写入的序号"""
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, conf: UserData):
+        """
+        将用户数据标记为需要保存
+
+        :param conf: 配置对象
+        """
+        with self._condition:
+            self._pending = conf
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="config-writer", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def take(self) -> Tuple[Optional[UserData], int]:
+        """
+        取出需要保存的用户数据（同时取消尚未开始的写入），并分配写入序号
+
+        :return: (需要保存的配置对象，没有则为 None, 写入序号)
+        """
+        with self._condition:
+            conf, self._pending = self._pending, None
+            self._sequence += 1
+            return conf, self._sequence
+
+    def write(self, str_data: str, sequence: int) -> bool:
+        """
+        写入已序列化的用户数据，已经写入了更新的数据时跳过
+
+        :param str_data: 序列化后的用户数据
+        :param sequence: 取出用户数据时分配的写入序号
+        :return: 是否写入
+        """
+        with _write_lock:
+            if sequence <= self._written:
+                return False
+            _write_text(str_data)
+            self._written = sequence
+            return True
+
+    def _save(self, conf: UserData, sequence: int):
+        """
+        序列化并写入取出的用户数据
+        """
+        str_data = _serialize(conf)
+        if str_data is not None:
+            self.write(str_data, sequence)
+
+    def flush(self):
+        """
+        立即写入尚未完成的保存，并等待正在进行的写入完成
+        """
+        conf, sequence = self.take()
+        if conf is not None:
+            self._save(conf, sequence)
+        else:
+            with _write_lock:
+                pass
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None:
+                    self._condition.wait()
+            time.sleep(SAVE_DELAY)
+            conf, sequence = self.take()
+            if conf is not None:
+                try:
+                    self._save(conf, sequence)
+                except OSError:
+                    logger.exception(f"写入用户数据文件失败，请检查程序是否有权限读取和写入 {_config_file_path()}")
+
+
+_config_writer = _ConfigWriter()
+atexit.register(_config_writer.flush)
+
+
+def load_config(path: Union[str, Path, None] = None) -> Tuple[UserData, bool]:
     """
     加载用户数据文件
 
+    :param path: 用户数据文件路径，默认为 CONFIG_PATH
     :return: (<用户数据对象>, <device_config 或 salt_config 是否非默认值且未开启覆写>)
     """
-    if os.path.exists(CONFIG_PATH) and os.path.isfile(CONFIG_PATH):
+    path = CONFIG_PATH if path is None else path
+    if os.path.exists(path) and os.path.isfile(path):
         try:
-            user_data = UserData.parse_file(CONFIG_PATH)
+            user_data = UserData.parse_file(path)
         except (ValidationError, JSONDecodeError):
-            logger.exception(f"读取用户数据文件失败，请检查用户数据文件 {CONFIG_PATH} 格式是否正确")
+            logger.exception(f"读取用户数据文件失败，请检查用户数据文件 {path} 格式是否正确")
             exit(1)
         except:
-            logger.exception(f"读取用户数据文件失败，请检查用户数据文件 {CONFIG_PATH} 是否存在且程序有权限读取和写入")
+            logger.exception(f"读取用户数据文件失败，请检查用户数据文件 {path} 是否存在且程序有权限读取和写入")
             exit(1)
         else:
             if not user_data.preference.override_device_and_salt:
@@ -528,18 +786,103 @@ def load_config() -> Tuple[UserData, bool]:
     else:
         user_data = UserData()
         try:
-            write_config_file(user_data)
+            write_config_file(user_data, path)
         except PermissionError:
-            logger.exception(f"创建用户数据文件失败，请检查程序是否有权限读取和写入 {CONFIG_PATH}")
+            logger.exception(f"创建用户数据文件失败，请检查程序是否有权限读取和写入 {path}")
             exit(1)
-        # logger.info(f"用户数据文件 {CONFIG_PATH} 不存在，已创建默认用户数据文件。")
+        # logger.info(f"用户数据文件 {path} 不存在，已创建默认用户数据文件。")
         # 由于会输出到标准输出流，影响TUI观感，因此暂时取消
 
         return user_data, False
 
 
-_load_config_return = load_config()
-config = _load_config_return[0]
-"""程序配置对象"""
-different_device_and_salt = _load_config_return[1]
-"""device_config 或 salt_config 是否非默认值且未开启覆写"""
+class RuntimeContext:
+    """
+    运行时上下文
+
+    首次访问 config 时才读取用户数据文件，之后不再重复读取，因此导入模块时不会解析用户数据文件，
+    命令行参数也可以在读取前修改用户数据文件路径。测试时可以创建独立的上下文
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     context = RuntimeContext(Path(directory) / "user_data.json")
+    ...     context.loaded, context.config.version == VERSION, context.loaded
+    (False, True, True)
+    """
+
+    def __init__(self, config_path: Union[str, Path, None] = None):
+        """
+        :param config_path: 用户数据文件路径，为空则在读取时使用 CONFIG_PATH
+        """
+        self.config_path = config_path
+        """用户数据文件路径，为空则在读取时使用 CONFIG_PATH"""
+        self._config: Optional[UserData] = None
+        self._different_device_and_salt = False
+        self._load_hooks: List[Callable[[UserData], Any]] = []
+        self._lock = threading.RLock()
+
+    @property
+    def loaded(self) -> bool:
+        """
+        是否已经读取用户数据文件
+        """
+        return self._config is not None
+
+    @property
+    def config(self) -> UserData:
+        """
+        用户数据对象，首次访问时读取用户数据文件
+        """
+        if self._config is None:
+            with self._lock:
+                if self._config is None:
+                    self._config, self._different_device_and_salt = load_config(self.config_path)
+                    for hook in self._load_hooks:
+                        hook(self._config)
+        return self._config
+
+    @config.setter
+    def config(self, value: UserData):
+        self._config = value
+
+    @property
+    def different_device_and_salt(self) -> bool:
+        """
+        device_config 或 salt_config 是否非默认值且未开启覆写
+        """
+        self.config  # 确保已读取用户数据文件
+        return self._different_device_and_salt
+
+    def add_load_hook(self, hook: Callable[[UserData], Any]):
+        """
+        添加读取用户数据文件后执行的函数，如果已经读取，则立即执行
+
+        :param hook: 参数为用户数据对象的函数
+        """
+        with self._lock:
+            if self._config is None:
+                self._load_hooks.append(hook)
+                return
+        hook(self._config)
+
+
+class _ConfigProxy:
+    """
+    默认运行时上下文中用户数据对象的代理，使各模块可以在导入时引用 config，而在首次访问其属性时才读取用户数据文件
+    """
+    __slots__ = ()
+
+    def __getattr__(self, item):
+        return getattr(context.config, item)
+
+    def __setattr__(self, key, value):
+        setattr(context.config, key, value)
+
+    def __repr__(self):
+        return repr(context.config) if context.loaded else f"<{self.__class__.__name__} (未读取)>"
+
+
+context = RuntimeContext()
+"""默认运行时上下文"""
+config: UserData = _ConfigProxy()  # type: ignore
+"""程序配置对象（指向默认运行时上下文中的用户数据对象）"""
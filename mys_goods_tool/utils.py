@@ -1,13 +1,18 @@
+import atexit
 import hashlib
 import json
 import os
+import queue
 import random
 import string
+import sys
+import threading
 import time
 import uuid
+from contextlib import contextmanager
 from multiprocessing import Pool, pool
 from socket import socket, AF_INET, SOCK_STREAM
-from typing import Literal, Union, Dict, List, Any, Callable, Iterable, Optional
+from typing import Literal, Union, Dict, List, Any, Callable, Iterable, Optional, NamedTuple, Tuple
 from urllib.parse import urlencode
 
 import httpx
@@ -16,7 +21,8 @@ import tenacity
 from loguru import logger
 from pydantic import ValidationError
 
-from mys_goods_tool.user_data import config as conf
+from mys_goods_tool.json_backend import loads
+from mys_goods_tool.user_data import config as conf, context, UserData
 
 LOG_FORMAT: str = (
     "<g>{time:MM-DD HH:mm:ss}</g> "
@@ -27,8 +33,157 @@ LOG_FORMAT: str = (
 """默认日志格式"""
 
 logger.remove()
-if conf.preference.log_path:
-    logger.add(conf.preference.log_path, diagnose=True, format=LOG_FORMAT, level="DEBUG")
+
+
+def _add_log_file(user_data: UserData):
+    """
+    读取用户数据文件后，按偏好设置添加日志文件
+    """
+    if user_data.preference.log_path:
+        logger.add(user_data.preference.log_path, diagnose=True, format=LOG_FORMAT, level="DEBUG")
+
+
+context.add_load_hook(_add_log_file)
+
+
+class RawText:
+    """
+    延迟解码的文本（如响应体），在转换为字符串时才解码，用于 DeferredLogger 的日志参数
+    """
+    __slots__ = ("content",)
+
+    def __init__(self, content: bytes):
+        """
+        :param content: 原始数据
+        """
+        self.content = content
+
+    def __str__(self):
+        return self.content.decode("utf-8", errors="replace")
+
+
+class _DeferredRecord(NamedTuple):
+    """
+    等待后台线程输出的日志
+    """
+    level: str
+    template: str
+    args: Tuple[Any, ...]
+    timestamp: float
+    name: Optional[str]
+    function: str
+    line: int
+
+
+class DeferredLogger:
+    """
+    兑换请求发送期间使用的日志记录器
+
+    在兑换窗口（burst）内，调用方只把日志模板、参数和时间放入队列，由后台线程格式化后交给 logger 输出，
+    发送兑换请求的线程/协程不会把时间花在格式化和写入日志上；兑换窗口外与直接使用 logger 相同。
+    日志模板使用 str.format 格式（与 loguru 相同），参数在输出时才被转换为文本，因此可以传入
+    RawText 或对象本身（如 "{.text}"）以推迟解码和计算。
+    由后台线程输出的日志仍使用调用时的时间和调用位置，但与其他线程的日志之间的先后顺序可能不同
+
+    >>> import sys
+    >>> deferred = DeferredLogger()
+    >>> sink = logger.add(sys.stdout, format="{level} | {message}")
+    >>> with deferred.burst():
+    ...     deferred.info("第 {} 次尝试 - 返回 {}", 1, RawText("成功".encode()))
+    ...     deferred.flush()
+    INFO | 第 1 次尝试 - 返回 成功
+    >>> deferred.info("{不是模板}")
+    INFO | {不是模板}
+    >>> logger.remove(sink)
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue[_DeferredRecord]" = queue.Queue()
+        self._windows = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        atexit.register(self.flush)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        """
+        在 fork 得到的子进程中重置（子进程中没有父进程的后台线程）
+        """
+        self._queue = queue.Queue()
+        self._windows = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @contextmanager
+    def burst(self):
+        """
+        进入兑换窗口，可以被多个线程/协程同时进入
+        """
+        with self._lock:
+            self._windows += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="deferred-logger", daemon=True)
+                self._thread.start()
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._windows -= 1
+
+    def _log(self, level: str, template: str, args: Tuple[Any, ...]):
+        if self._windows:
+            frame = sys._getframe(2)
+            self._queue.put(_DeferredRecord(level, template, args, time.time(),
+                                            frame.f_globals.get("__name__"), frame.f_code.co_name, frame.f_lineno))
+        else:
+            logger.opt(depth=2).log(level, template, *args)
+
+    def debug(self, template: str, *args: Any):
+        self._log("DEBUG", template, args)
+
+    def info(self, template: str, *args: Any):
+        self._log("INFO", template, args)
+
+    def error(self, template: str, *args: Any):
+        self._log("ERROR", template, args)
+
+    @staticmethod
+    def _emit(record: _DeferredRecord):
+        """
+        输出一条日志（在后台线程中执行）
+        """
+
+        def patcher(loguru_record: Dict[str, Any]):
+            loguru_record["time"] = loguru_record["time"].fromtimestamp(record.timestamp,
+                                                                        loguru_record["time"].tzinfo)
+            loguru_record["name"] = record.name
+            loguru_record["function"] = record.function
+            loguru_record["line"] = record.line
+
+        message = record.template.format(*record.args) if record.args else record.template
+        logger.patch(patcher).log(record.level, message)
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                self._emit(record)
+            except Exception:
+                logger.exception("输出日志失败")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """
+        等待队列中的日志全部输出
+        """
+        if self._thread is not None:
+            self._queue.join()
+
+
+exchange_logger = DeferredLogger()
+"""兑换请求发送期间使用的日志记录器"""
 
 
 def custom_attempt_times(retry: bool):
@@ -58,6 +213,19 @@ def get_async_retry(retry: bool):
     )
 
 
+def get_retry(retry: bool):
+    """
+    获取同步重试装饰器
+
+    :param retry: True - 重试次数达到偏好设置中 max_retry_times 时停止; False - 执行次数达到1时停止，即不进行重试
+    """
+    return tenacity.Retrying(
+        stop=custom_attempt_times(retry),
+        retry=tenacity.retry_if_exception_type(BaseException),
+        wait=tenacity.wait_fixed(conf.preference.retry_interval),
+    )
+
+
 class NtpTime:
     """
     NTP时间校准相关
@@ -75,14 +243,14 @@ class NtpTime:
                 logger.error("开启了互联网时间校对，但未配置NTP服务器 preference.ntp_server，放弃时间同步")
                 return False
             try:
-                for attempt in get_async_retry(True):
+                for attempt in get_retry(True):
                     with attempt:
                         cls.time_offset = ntplib.NTPClient().request(
                             conf.preference.ntp_server).tx_time - time.time()
             except tenacity.RetryError:
                 logger.exception("校对互联网时间失败，改为使用本地时间")
                 return False
-            logger.info("互联网时间校对完成")
+            logger.info(f"互联网时间校对完成，本地时间偏差 {round(cls.time_offset * 1000, 2)} ms")
             return True
         else:
             logger.info("未开启互联网时间校对，跳过时间同步")
@@ -249,13 +417,19 @@ class Subscribe:
     在线配置相关(需实例化)
     """
     FILE_URL = "https://github.com/Ljzd-PRO/Mys_Goods_Tool/raw/dev/subscribe/configs.json"
-    CONFIG_URL = os.path.join(conf.preference.github_proxy, FILE_URL) if conf.preference.github_proxy else FILE_URL
     conf_list: List[Dict[str, Any]] = []
     '''当前插件版本可用的配置资源'''
 
     def __init__(self):
         self.index = 0
 
+    @classmethod
+    def config_url(cls) -> str:
+        """
+        获取在线配置资源的地址（使用偏好设置中的 GitHub 代理）
+        """
+        return os.path.join(conf.preference.github_proxy, cls.FILE_URL) if conf.preference.github_proxy else cls.FILE_URL
+
     @classmethod
     async def download(cls) -> bool:
         """
@@ -265,8 +439,8 @@ class Subscribe:
         try:
             for attempt in get_async_retry(True):
                 with attempt:
-                    file = await get_file(cls.CONFIG_URL)
-                    file = json.loads(file.decode())
+                    file = await get_file(cls.config_url())
+                    file = loads(file)
                     if not file:
                         return False
                     cls.conf_list = list(
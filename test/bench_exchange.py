@@ -0,0 +1,316 @@
+"""
+兑换请求触发时间基准测试
+
+在本地启动一个模拟商品兑换API的 HTTP(S) 服务器（独立进程），记录服务器端收到每个兑换请求的时间，
+然后使用指定的兑换引擎对 N 个兑换计划 × exchange_thread_count 执行兑换，
+最后输出请求到达时间相对于 plan.good.time 的延迟分布、每秒请求数以及 CPU 占用。
+
+用法：
+    python -m test.bench_exchange [--plans 10] [--threads 2] [--engine thread asyncio process] [--cert CERT --key KEY]
+
+使用 HTTPS 时需要提供签发给 127.0.0.1 的证书，证书会通过 SSL_CERT_FILE 环境变量被信任。
+测试使用临时目录中的用户数据文件和日志文件，不会读取或修改程序目录下的用户数据文件。
+"""
+import json
+import multiprocessing
+import os
+import queue
+import ssl
+import tempfile
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import List, Optional, Dict, Callable, NamedTuple
+
+try:
+    import resource
+except ModuleNotFoundError:
+    # Windows 下没有 resource 模块，无法统计子进程的 CPU 时间
+    resource = None
+
+MOCK_RESPONSE = json.dumps({"retcode": -1, "message": "系统繁忙，请稍后再试", "data": None}).encode()
+"""模拟服务器返回的数据（可重试的兑换失败，使引擎在兑换持续时间内持续重试）"""
+
+
+class BenchmarkResult(NamedTuple):
+    """
+    基准测试结果
+    """
+    engine: str
+    """兑换引擎"""
+    requests: int
+    """服务器收到的兑换请求数"""
+    first_lateness: List[float]
+    """每个兑换计划第一个到达的请求相对兑换时间的延迟（单位：毫秒）"""
+    all_lateness: List[float]
+    """所有请求相对兑换时间的延迟（单位：毫秒）"""
+    requests_per_second: float
+    """兑换期间每秒请求数"""
+    cpu_percent: float
+    """兑换期间客户端进程（及兑换进程，Windows 下不包含）的 CPU 占用（100% 为一个核心）"""
+
+    def report(self) -> str:
+        """
+        生成文本报告
+        """
+
+        def percentile(data: List[float], p: float) -> str:
+            if not data:
+                return "N/A"
+            data = sorted(data)
+            return f"{data[min(len(data) - 1, int(len(data) * p))]:.3f} ms"
+
+        return (f"[{self.engine}] 请求数 {self.requests}"
+                f" | 首个请求延迟 p50 {percentile(self.first_lateness, 0.5)}"
+                f" p99 {percentile(self.first_lateness, 0.99)}"
+                f" | 全部请求延迟 p50 {percentile(self.all_lateness, 0.5)}"
+                f" p99 {percentile(self.all_lateness, 0.99)}"
+                f" | {self.requests_per_second:.1f} req/s"
+                f" | CPU {self.cpu_percent:.1f}%")
+
+
+def _serve(port_queue: multiprocessing.Queue, arrival_queue: multiprocessing.Queue,
+           cert: Optional[str], key: Optional[str]):
+    """
+    模拟商品兑换API服务器进程
+
+    :param port_queue: 用于返回监听端口
+    :param arrival_queue: 用于返回每个兑换请求的 (到达时间, 商品ID)
+    :param cert: HTTPS 证书路径
+    :param key: HTTPS 私钥路径
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_OPTIONS(self):
+            self.send_response(204)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        do_HEAD = do_OPTIONS
+
+        def do_POST(self):
+            arrival = time.time()
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            arrival_queue.put((arrival, json.loads(body).get("goods_id")))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(MOCK_RESPONSE)))
+            self.end_headers()
+            self.wfile.write(MOCK_RESPONSE)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    if cert:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def _make_plans(count: int, exchange_time: int):
+    """
+    生成用于测试的兑换计划
+
+    :param count: 兑换计划数
+    :param exchange_time: 兑换时间
+    """
+    from mys_goods_tool.data_model import Good
+    from mys_goods_tool.user_data import ExchangePlan, UserAccount, BBSCookies
+
+    plans = []
+    for i in range(1, count + 1):
+        good = Good(type=1, next_time=exchange_time, status="online", account_exchange_num=0,
+                    account_cycle_limit=1, account_cycle_type="forever", goods_id=str(i), price=1, icon="",
+                    goods_name=f"基准测试商品 {i}")
+        account = UserAccount(cookies=BBSCookies(stuid=str(10000 + i), stoken="stoken", cookie_token="cookie_token"),
+                              device_fp="0123456789abc")
+        plans.append(ExchangePlan(good=good, account=account))
+    return plans
+
+
+def _run_thread_engine(plans, expected_results: int):
+    """
+    使用调度器 + 兑换线程执行兑换
+    """
+    from apscheduler.events import EVENT_JOB_EXECUTED
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from mys_goods_tool.exchange_mode import set_scheduler, exchange_connections
+
+    done = threading.Semaphore(0)
+    scheduler = set_scheduler(BackgroundScheduler())
+    scheduler.add_listener(lambda event: event.job_id.startswith("exchange-plan") and done.release(),
+                           EVENT_JOB_EXECUTED)
+    scheduler.start()
+    for _ in range(expected_results):
+        done.acquire()
+    scheduler.shutdown()
+    exchange_connections.close()
+
+
+def _run_asyncio_engine(plans, expected_results: int):
+    """
+    使用 asyncio 兑换引擎执行兑换
+    """
+    from mys_goods_tool.exchange_engine import AsyncExchangeEngine, new_event_loop
+
+    loop = new_event_loop()
+    loop.run_until_complete(AsyncExchangeEngine(lambda _: None).run(plans))
+    loop.close()
+
+
+def _run_process_engine(plans, expected_results: int):
+    """
+    使用多进程兑换引擎执行兑换
+    """
+    from mys_goods_tool.exchange_engine import new_event_loop
+    from mys_goods_tool.exchange_shard import ShardedExchangeEngine
+
+    loop = new_event_loop()
+    loop.run_until_complete(ShardedExchangeEngine(lambda _: None).run(plans))
+    loop.close()
+
+
+ENGINES: Dict[str, Callable] = {
+    "thread": _run_thread_engine,
+    "asyncio": _run_asyncio_engine,
+    "process": _run_process_engine,
+}
+"""可供测试的兑换引擎"""
+
+
+def _cpu_time() -> float:
+    """
+    当前进程及已结束的子进程使用的 CPU 时间（单位：秒）
+
+    多进程兑换引擎的 CPU 时间主要在兑换进程中，因此需要加上子进程的 CPU 时间（Windows 下无法获取，只统计当前进程）
+    """
+    cpu_time = time.process_time()
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu_time += usage.ru_utime + usage.ru_stime
+    return cpu_time
+
+
+def benchmark(engine: str, url: str, arrival_queue: multiprocessing.Queue,
+              plan_count: int, thread_count: int, duration: float, lead: float) -> BenchmarkResult:
+    """
+    对一个兑换引擎进行基准测试
+
+    :param engine: 兑换引擎名称
+    :param url: 模拟服务器的兑换API地址
+    :param arrival_queue: 模拟服务器返回请求到达时间的队列
+    :param plan_count: 兑换计划数
+    :param thread_count: 每个兑换计划的线程/协程数
+    :param duration: 兑换持续时间
+    :param lead: 距离兑换开始的准备时间
+    """
+    import mys_goods_tool.api
+    import mys_goods_tool.exchange_engine
+    from mys_goods_tool.exchange_mode import exchange_connections
+    from mys_goods_tool.user_data import config as conf
+
+    mys_goods_tool.api.URL_EXCHANGE = url
+    mys_goods_tool.exchange_engine.URL_EXCHANGE = url
+    exchange_connections.url = url
+
+    exchange_time = int(time.time() + lead) + 1
+    plans = _make_plans(plan_count, exchange_time)
+    conf.exchange_plans = set(plans)
+    conf.preference.exchange_engine = engine
+    conf.preference.exchange_thread_count = thread_count
+    conf.preference.exchange_duration = duration
+    conf.preference.enable_connection_test = False
+    conf.preference.preflight_time = None
+    conf.preference.exchange_warm_up_time = min(conf.preference.exchange_warm_up_time or 0, lead / 2) or None
+
+    cpu_before = _cpu_time()
+    wall_before = time.perf_counter()
+    ENGINES[engine](plans, plan_count * thread_count)
+    wall_after = time.perf_counter()
+    cpu_after = _cpu_time()
+
+    arrivals = []
+    while True:
+        try:
+            arrivals.append(arrival_queue.get(timeout=0.5))
+        except queue.Empty:
+            break
+
+    first_arrival: Dict[str, float] = {}
+    for arrival, goods_id in arrivals:
+        first_arrival[goods_id] = min(first_arrival.get(goods_id, arrival), arrival)
+    all_lateness = [(arrival - exchange_time) * 1000 for arrival, _ in arrivals]
+    first_lateness = [(arrival - exchange_time) * 1000 for arrival in first_arrival.values()]
+
+    burst_window = (max(arrivals)[0] - min(arrivals)[0]) if len(arrivals) > 1 else 0
+    return BenchmarkResult(
+        engine=engine,
+        requests=len(arrivals),
+        first_lateness=first_lateness,
+        all_lateness=all_lateness,
+        requests_per_second=len(arrivals) / burst_window if burst_window else 0,
+        cpu_percent=(cpu_after - cpu_before) / (wall_after - wall_before) * 100
+    )
+
+
+def main():
+    parser = ArgumentParser(description="兑换请求触发时间基准测试")
+    parser.add_argument("--plans", type=int, default=10, help="兑换计划数")
+    parser.add_argument("--threads", type=int, default=2, help="每个兑换计划的线程/协程数")
+    parser.add_argument("--duration", type=float, default=1, help="兑换持续时间（单位：秒）")
+    parser.add_argument("--lead", type=float, default=3, help="距离兑换开始的准备时间（单位：秒）")
+    parser.add_argument("--engine", nargs="+", choices=list(ENGINES), default=list(ENGINES), help="要测试的兑换引擎")
+    parser.add_argument("--cert", type=str, default=None, help="HTTPS 证书路径（签发给 127.0.0.1）")
+    parser.add_argument("--key", type=str, default=None, help="HTTPS 私钥路径")
+    args = parser.parse_args()
+
+    if args.cert:
+        os.environ["SSL_CERT_FILE"] = args.cert
+
+    port_queue = multiprocessing.Queue()
+    arrival_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve, args=(port_queue, arrival_queue, args.cert, args.key),
+                                     daemon=True)
+    server.start()
+    scheme = "https" if args.cert else "http"
+    url = f"{scheme}://127.0.0.1:{port_queue.get()}/mall/v1/web/goods/exchange"
+
+    # 使用临时目录中的用户数据文件和日志文件（必须在首次使用 conf 之前设置）
+    directory = tempfile.TemporaryDirectory(prefix="bench_exchange.")
+    from mys_goods_tool import user_data
+    config_path = Path(directory.name) / "user_data.json"
+    user_data.write_config_file(
+        user_data.UserData(preference=user_data.Preference(log_path=Path(directory.name) / "bench_exchange.log")),
+        config_path
+    )
+    user_data.context.config_path = config_path
+
+    from mys_goods_tool.utils import NtpTime
+    # 模拟服务器与客户端使用同一时钟，不进行NTP校准
+    NtpTime.time_offset = 0
+
+    try:
+        for engine in args.engine:
+            result = benchmark(engine, url, arrival_queue, args.plans, args.threads, args.duration, args.lead)
+            print(result.report())
+    finally:
+        server.terminate()
+        # 在删除临时目录前写入尚未完成的后台保存，避免退出时写入已删除的目录
+        if user_data.context.loaded:
+            user_data.config.save(sync=True)
+        try:
+            directory.cleanup()
+        except OSError:
+            # Windows 下日志文件仍被占用时无法删除
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+API响应 JSON 解析基准测试
+
+对商品信息列表（默认 20 页，每页 20 个商品）的响应体，比较以下解析方式的耗时：
+    - 标准库：httpx.Response.json()（先按编码解码为字符串再用标准库 json 解析）
+    - json_backend：mys_goods_tool.json_backend.loads(res.content)，直接解析响应体的 bytes
+仅解析 JSON 时，标准库方式每个响应解析两次（原先兑换结果等处理方式），json_backend 只解析一次并复用；
+完整处理（包含 ApiResultHandler 和 Good.parse_obj）时两者都只解析一次（与获取商品信息列表的处理方式相同）。
+
+用法：
+    python -m test.bench_json [--pages 20] [--repeat 50] [--file PAGES_FILE]
+
+PAGES_FILE 为抓包得到的商品信息列表响应体，每行一页；不提供时使用按真实字段构造的模拟数据。
+"""
+import json
+import time
+from argparse import ArgumentParser
+from typing import List, Callable
+
+import httpx
+
+GOOD_LIST_PAGE_SIZE = 20
+"""每页商品数"""
+
+
+def _mock_good(index: int) -> dict:
+    """
+    构造一个商品数据（字段与米游社商品信息列表API一致）
+    """
+    return {
+        "app_id": 1, "point_sn": "myb", "goods_id": str(2023060000000 + index),
+        "goods_name": f"【原神】测试商品 {index}", "goods_desc": "<p>商品介绍</p>" * 8, "price": 500 + index,
+        "icon": f"https://upload-bbs.mihoyo.com/upload/2023/06/{index}.png",
+        "type": 2, "status": "online", "sale_start_time": "0", "next_time": 1686981600 + index,
+        "next_num": 100, "account_exchange_num": 0, "account_cycle_type": "month", "account_cycle_limit": 1,
+        "total": 0, "game_biz": "hk4e_cn", "game": "hk4e", "unlimit": False, "rules": "<p>兑换规则</p>" * 8,
+        "tag_list": [{"name": "限量", "color": "#FF6E00"}], "role": {"game_biz": "hk4e_cn", "role_name": ""},
+        "special_stock_status": 0, "min_app_version": "", "max_app_version": ""
+    }
+
+
+def mock_pages(pages: int) -> List[bytes]:
+    """
+    构造商品信息列表的响应体
+
+    :param pages: 页数
+    """
+    total = pages * GOOD_LIST_PAGE_SIZE
+    return [json.dumps({"retcode": 0, "message": "OK",
+                        "data": {"list": [_mock_good(page * GOOD_LIST_PAGE_SIZE + i)
+                                          for i in range(GOOD_LIST_PAGE_SIZE)],
+                                 "total": total}}).encode()
+            for page in range(pages)]
+
+
+def measure(func: Callable[[], object], repeat: int) -> float:
+    """
+    测量平均耗时（单位：毫秒）
+    """
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = ArgumentParser(description="API响应 JSON 解析基准测试")
+    parser.add_argument("--pages", type=int, default=20, help="商品信息列表页数")
+    parser.add_argument("--repeat", type=int, default=50, help="重复次数")
+    parser.add_argument("--file", type=str, default=None, help="抓包得到的响应体文件（每行一页）")
+    args = parser.parse_args()
+
+    from mys_goods_tool import json_backend
+    from mys_goods_tool.api import ApiResultHandler
+    from mys_goods_tool.data_model import Good
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            bodies = [line.strip() for line in f if line.strip()]
+    else:
+        bodies = mock_pages(args.pages)
+    responses = [httpx.Response(200, content=body, headers={"Content-Type": "application/json"})
+                 for body in bodies]
+
+    def decode_stdlib():
+        for res in responses:
+            res.json()
+            res.json()
+
+    def decode_backend():
+        for res in responses:
+            json_backend.loads(res.content)
+
+    def parse_stdlib():
+        for res in responses:
+            api_result = ApiResultHandler(res.json())
+            list(map(Good.parse_obj, api_result.data["list"]))
+            api_result.data.get("total")
+
+    def parse_backend():
+        for res in responses:
+            api_result = ApiResultHandler(json_backend.loads(res.content))
+            list(map(Good.parse_obj, api_result.data["list"]))
+            api_result.data.get("total")
+
+    size = sum(map(len, bodies)) / 1024
+    print(f"{len(bodies)} 页响应体，共 {size:.1f} KiB，json_backend 后端：{json_backend.BACKEND}")
+    for name, stdlib, backend in [("仅解析 JSON，标准库解析两次", decode_stdlib, decode_backend),
+                                  ("完整处理", parse_stdlib, parse_backend)]:
+        stdlib_time, backend_time = measure(stdlib, args.repeat), measure(backend, args.repeat)
+        print(f"[{name}] 标准库 {stdlib_time:.3f} ms"
+              f" | json_backend {backend_time:.3f} ms"
+              f" | 节省 {(1 - backend_time / stdlib_time) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+import pytest
+
+from mys_goods_tool import user_data
+
+
+@pytest.fixture(autouse=True)
+def isolated_config(tmp_path, monkeypatch):
+    """
+    每个测试使用临时目录中的默认用户数据，不读取或修改程序目录下的用户数据文件和日志文件
+    """
+    config_path = tmp_path / "user_data.json"
+    monkeypatch.setattr(user_data.context, "config_path", config_path)
+    monkeypatch.setattr(user_data.context, "_config", user_data.UserData(
+        preference=user_data.Preference(log_path=tmp_path / "logs" / "mys_goods_tool.log")
+    ))
+    return user_data.context.config
@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+from mys_goods_tool import account_cache as account_cache_module
+from mys_goods_tool.account_cache import AccountDataCache
+from mys_goods_tool.data_model import BaseApiStatus
+from mys_goods_tool.user_data import config as conf, UserAccount, BBSCookies
+
+
+class FakeClock:
+    """
+    可以手动推进的时钟，代替 time 模块
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class FakeFetch:
+    """
+    记录调用次数的数据获取函数
+    """
+
+    def __init__(self, success: bool = True, delay: float = 0):
+        self.success = success
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self, _: UserAccount):
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(self.delay)
+        return BaseApiStatus(success=self.success, network_error=not self.success), call
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(account_cache_module, "time", clock)
+    return clock
+
+
+def _account(uid: str = "1") -> UserAccount:
+    return UserAccount(cookies=BBSCookies(stuid=uid))
+
+
+@pytest.mark.asyncio
+async def test_ttl(clock):
+    cache, fetch, account = AccountDataCache(ttl=60), FakeFetch(), _account()
+    assert (await cache.get("myb", account, fetch))[1] == 1
+    clock.now += 59
+    assert (await cache.get("myb", account, fetch))[1] == 1
+    clock.now += 2
+    assert (await cache.get("myb", account, fetch))[1] == 2
+
+
+@pytest.mark.asyncio
+async def test_ttl_from_preference(clock):
+    cache, fetch, account = AccountDataCache(), FakeFetch(), _account()
+    conf.preference.account_cache_ttl = 10
+    await cache.get("myb", account, fetch)
+    clock.now += 11
+    await cache.get("myb", account, fetch)
+    assert fetch.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_zero_ttl_still_coalesces(clock):
+    cache, fetch, account = AccountDataCache(ttl=0), FakeFetch(delay=0.01), _account()
+    results = await asyncio.gather(*[cache.get("myb", account, fetch) for _ in range(3)])
+    assert [x[1] for x in results] == [1, 1, 1]
+    clock.now += 1
+    await cache.get("myb", account, fetch)
+    assert fetch.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_coalescing_per_key(clock):
+    cache, fetch = AccountDataCache(ttl=60), FakeFetch(delay=0.01)
+    account_a, account_b = _account("1"), _account("2")
+    await asyncio.gather(
+        *[cache.get(kind, account, fetch) for kind in ("myb", "address") for account in (account_a, account_b)],
+        cache.get("myb", account_a, fetch)
+    )
+    assert fetch.calls == 4
+
+
+@pytest.mark.asyncio
+async def test_force_bypasses_cache(clock):
+    cache, fetch, account = AccountDataCache(ttl=60), FakeFetch(), _account()
+    await cache.get("myb", account, fetch)
+    assert (await cache.get("myb", account, fetch, force=True))[1] == 2
+    assert (await cache.get("myb", account, fetch))[1] == 2
+
+
+@pytest.mark.asyncio
+async def test_failure_not_cached(clock):
+    cache, fetch, account = AccountDataCache(ttl=60), FakeFetch(success=False), _account()
+    status, _ = await cache.get("myb", account, fetch)
+    assert not status
+    await cache.get("myb", account, fetch)
+    assert fetch.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_invalidate_account(clock):
+    cache, fetch = AccountDataCache(ttl=60), FakeFetch()
+    account_a, account_b = _account("1"), _account("2")
+    await cache.get("myb", account_a, fetch)
+    await cache.get("myb", account_b, fetch)
+    cache.invalidate(account_a.bbs_uid)
+    await cache.get("myb", account_a, fetch)
+    await cache.get("myb", account_b, fetch)
+    assert fetch.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_invalidate_all(clock):
+    cache, fetch = AccountDataCache(ttl=60), FakeFetch()
+    accounts = _account("1"), _account("2")
+    for account in accounts:
+        await cache.get("myb", account, fetch)
+    cache.invalidate()
+    for account in accounts:
+        await cache.get("myb", account, fetch)
+    assert fetch.calls == 4
+
+
+@pytest.mark.asyncio
+async def test_invalidate_discards_in_flight_result(clock):
+    """
+    失效前发出的请求的结果不会写入缓存，失效后的请求也不会共用失效前发出的请求
+    """
+    cache, fetch, account = AccountDataCache(ttl=60), FakeFetch(delay=0.02), _account()
+    stale = asyncio.ensure_future(cache.get("myb", account, fetch))
+    await asyncio.sleep(0)
+    cache.invalidate(account.bbs_uid)
+    fresh = await cache.get("myb", account, fetch)
+    assert (await stale)[1] != fresh[1]
+    assert (await cache.get("myb", account, fetch))[1] == fresh[1]
+    assert fetch.calls == 2
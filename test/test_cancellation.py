@@ -0,0 +1,100 @@
+import pytest
+
+from mys_goods_tool.cancellation import CancelToken, ExchangeCancellation
+from mys_goods_tool.data_model import Good, ExchangeStatus
+from mys_goods_tool.user_data import ExchangePlan, ExchangeResult, UserAccount, BBSCookies
+
+
+def _plan(goods_id: str, uid: str = "1") -> ExchangePlan:
+    good = Good(type=1, account_exchange_num=0, account_cycle_limit=1, account_cycle_type="forever",
+                goods_id=goods_id, price=1, icon="")
+    return ExchangePlan(good=good, account=UserAccount(cookies=BBSCookies(stuid=uid)))
+
+
+def _failed(plan: ExchangePlan, retcode: int, message: str) -> ExchangeResult:
+    return ExchangeResult(result=False, return_data={"retcode": retcode, "message": message, "data": None}, plan=plan)
+
+
+def test_cancel_token_parent_propagation():
+    account = CancelToken()
+    plan = CancelToken(account)
+    sibling = CancelToken(account)
+    assert not plan.cancelled and plan.reason is None
+
+    plan.cancel("兑换成功")
+    assert plan.cancelled and not account.cancelled and not sibling.cancelled
+
+    account.cancel("登录失效")
+    assert sibling.cancelled and sibling.reason == "登录失效"
+    # 自身已被取消时保留自身的原因
+    assert plan.reason == "兑换成功"
+
+
+def test_cancel_token_keeps_first_reason():
+    token = CancelToken()
+    token.cancel("第一次")
+    token.cancel("第二次")
+    assert token.reason == "第一次"
+
+
+def test_cancel_token_nested_parents():
+    root = CancelToken()
+    leaf = CancelToken(CancelToken(root))
+    root.cancel("停止")
+    assert leaf.cancelled and leaf.reason == "停止"
+
+
+@pytest.fixture
+def tokens():
+    return ExchangeCancellation()
+
+
+def test_settle_success_cancels_plan_only(tokens):
+    plans = _plan("a"), _plan("b")
+    outcome = tokens.settle(plans[0], ExchangeStatus(success=True),
+                            ExchangeResult(result=True, return_data={}, plan=plans[0]))
+    assert outcome == "success"
+    assert tokens.plan(plans[0]).cancelled
+    assert not tokens.plan(plans[1]).cancelled
+
+
+def test_settle_plan_terminal(tokens):
+    plans = _plan("a"), _plan("b")
+    assert tokens.settle(plans[0], ExchangeStatus(success=True), _failed(plans[0], -2103, "商品库存不足")) \
+           == "plan_terminal"
+    assert tokens.plan(plans[0]).reason == "服务器返回 商品库存不足"
+    assert not tokens.plan(plans[1]).cancelled
+
+
+def test_settle_account_terminal(tokens):
+    plans = _plan("a"), _plan("b"), _plan("c", uid="2")
+    assert tokens.settle(plans[0], ExchangeStatus(success=True), _failed(plans[0], -1, "米游币不足")) \
+           == "account_terminal"
+    assert tokens.plan(plans[1]).cancelled
+    assert not tokens.plan(plans[2]).cancelled
+
+
+def test_settle_login_expired(tokens):
+    plans = _plan("a"), _plan("b")
+    assert tokens.settle(plans[0], ExchangeStatus(login_expired=True), None) == "account_terminal"
+    assert tokens.plan(plans[1]).reason == "账号登录失效"
+
+
+def test_settle_retryable(tokens):
+    plan = _plan("a")
+    assert tokens.settle(plan, ExchangeStatus(network_error=True), None) == "retryable"
+    assert tokens.settle(plan, ExchangeStatus(success=True), _failed(plan, -1, "系统繁忙，请稍后再试")) == "retryable"
+    assert not tokens.plan(plan).cancelled
+
+
+def test_settle_too_early_does_not_cancel(tokens):
+    plan = _plan("a")
+    assert tokens.settle(plan, ExchangeStatus(success=True), _failed(plan, -2101, "兑换活动尚未开始")) == "too_early"
+    assert not tokens.plan(plan).cancelled
+
+
+def test_reset(tokens):
+    plan = _plan("a")
+    tokens.account(plan.account).cancel("登录失效")
+    tokens.reset()
+    assert not tokens.plan(plan).cancelled
@@ -0,0 +1,167 @@
+import threading
+
+import pytest
+
+from mys_goods_tool import coordination
+from mys_goods_tool.coordination import MemoryLedger, SqliteLedger, TcpLedger, LedgerServer, ExchangeCoordinator
+from mys_goods_tool.data_model import Good
+from mys_goods_tool.timing import BurstPlanner
+from mys_goods_tool.user_data import config as conf, ExchangePlan, UserAccount, BBSCookies
+
+
+def _plan(goods_id: str = "1", uid: str = "1") -> ExchangePlan:
+    good = Good(type=1, account_exchange_num=0, account_cycle_limit=1, account_cycle_type="forever",
+                goods_id=goods_id, price=1, icon="")
+    return ExchangePlan(good=good, account=UserAccount(cookies=BBSCookies(stuid=uid)))
+
+
+@pytest.fixture
+def tcp_server():
+    server = LedgerServer(("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["sqlite", "tcp"])
+def ledger_pair(request, tmp_path):
+    """
+    同一账本的两个节点（TCP协调服务器在内存中使用 MemoryLedger）
+    """
+    if request.param == "sqlite":
+        path = str(tmp_path / "ledger.db")
+        ledgers = SqliteLedger(path, "node-a"), SqliteLedger(path, "node-b")
+    else:
+        server = request.getfixturevalue("tcp_server")
+        ledgers = TcpLedger(server.server_address, "node-a"), TcpLedger(server.server_address, "node-b")
+    yield ledgers
+    for ledger in ledgers:
+        ledger.close()
+
+
+def test_memory_ledger():
+    ledger = MemoryLedger("node-a")
+    ledger.join(["plan"], node_id="node-b")
+    ledger.join(["plan", "other"])
+    assert ledger.members("plan") == ["node-a", "node-b"]
+    assert ledger.members("unknown") == []
+    ledger.mark_success("plan")
+    assert ledger.finished(["plan", "other"]) == {"plan"}
+
+
+def test_ledger_members(ledger_pair):
+    ledger_a, ledger_b = ledger_pair
+    ledger_b.join(["plan", "other"])
+    ledger_a.join(["plan"])
+    assert ledger_a.members("plan") == ["node-a", "node-b"]
+    assert ledger_a.members("other") == ["node-b"]
+    assert ledger_a.members("unknown") == []
+
+
+def test_ledger_finished(ledger_pair):
+    ledger_a, ledger_b = ledger_pair
+    ledger_a.join(["plan", "other"])
+    assert ledger_b.finished(["plan", "other"]) == set()
+    ledger_b.mark_success("plan")
+    ledger_b.mark_success("plan")
+    assert ledger_a.finished(["plan", "other"]) == {"plan"}
+    assert ledger_a.finished([]) == set()
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+def test_ledger_member_timeout(kind, tmp_path, monkeypatch):
+    """
+    超过 MEMBER_TIMEOUT 没有心跳的节点不再参与分配
+    """
+    now = [1000.0]
+
+    class FakeTime:
+        @staticmethod
+        def time():
+            return now[0]
+
+    monkeypatch.setattr(coordination, "time", FakeTime)
+    if kind == "memory":
+        ledger = MemoryLedger("node-a")
+        ledger.join(["plan"])
+        ledger.join(["plan"], node_id="node-b")
+    else:
+        path = str(tmp_path / "ledger.db")
+        ledger, other = SqliteLedger(path, "node-a"), SqliteLedger(path, "node-b")
+        ledger.join(["plan"])
+        other.join(["plan"])
+        other.close()
+    now[0] += coordination.MEMBER_TIMEOUT / 2
+    ledger.join(["plan"])
+    now[0] += coordination.MEMBER_TIMEOUT * 0.75
+    assert ledger.members("plan") == ["node-a"]
+    ledger.close()
+
+
+def _offsets(node_count: int):
+    """
+    各节点的所有线程的发送时刻规划
+    """
+    threads = conf.preference.exchange_thread_count
+    plan = _plan()
+    result = []
+    for node_index in range(node_count):
+        class FakeCoordinator:
+            @staticmethod
+            def slot(_):
+                return node_index, node_count
+
+        coordination.coordinator = FakeCoordinator()
+        try:
+            result.append([coordination.plan_offsets(plan, worker_id) for worker_id in range(1, threads + 1)])
+        finally:
+            coordination.coordinator = None
+    return result
+
+
+def test_plan_offsets_single_node():
+    conf.preference.exchange_thread_count = 3
+    assert _offsets(1)[0] == BurstPlanner.plan(3, conf.preference.exchange_duration,
+                                               conf.preference.exchange_latency)
+
+
+@pytest.mark.parametrize("node_count", [2, 3])
+def test_plan_offsets_share_sequence(node_count):
+    """
+    多个节点轮流分摊与单个节点相同的一条发送时刻序列，不重复、不遗漏
+    """
+    conf.preference.exchange_thread_count = 2
+    single = sorted(sum(_offsets(1)[0], []))
+    nodes = _offsets(node_count)
+    merged = [offset for node in nodes for worker in node for offset in worker]
+    assert sorted(merged) == single
+    assert all(node[0] for node in nodes)
+
+
+def test_coordinator_slot_fixed_during_burst(ledger_pair):
+    ledger_a, ledger_b = ledger_pair
+    plan = _plan()
+    ledger_b.join([plan.plan_id])
+    coordinator = ExchangeCoordinator(ledger_a)
+    coordinator._plan_ids = {plan.plan_id}
+    coordinator._heartbeat()
+    assert coordinator.slot(plan) == (0, 2)
+    # 开始兑换后节点列表变化，本节点的位置不变
+    coordinator._slots = {plan.plan_id: (1, 3)}
+    assert coordinator.slot(plan) == (0, 2)
+    assert coordinator.slot(_plan("2")) == (0, 1)
+
+
+def test_coordinator_unreachable_ledger(tcp_server):
+    address = tcp_server.server_address
+    tcp_server.shutdown()
+    tcp_server.server_close()
+    coordinator = ExchangeCoordinator(TcpLedger(address, "node-a"))
+    plan = _plan()
+    coordinator.start([plan])
+    try:
+        assert coordinator.slot(plan) == (0, 1)
+        assert not coordinator.is_finished(plan)
+    finally:
+        coordinator.stop()
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from mys_goods_tool.timing import BurstPlanner, BurstInstants, BURST_MIN_INTERVAL, wait_until, async_wait_until
+from mys_goods_tool.utils import NtpTime
+
+TIMING_TOLERANCE = 0.02
+"""等待误差的容许范围（单位：秒），CI 环境的调度误差较大，只检查数量级"""
+
+
+def test_burst_plan_within_duration():
+    schedule = BurstPlanner.plan(4, 2, (0.1, 0.5))
+    offsets = sum(schedule, [])
+    assert offsets
+    assert all(0 <= x < 2 for x in offsets)
+    assert all(worker == sorted(worker) for worker in schedule)
+    assert len(set(offsets)) == len(offsets)
+
+
+def test_burst_plan_taper():
+    """
+    同一线程的请求间隔从最小值开始逐渐增加，但不超过最大值
+    """
+    minimum, maximum = 0.1, 0.5
+    offsets = BurstPlanner.plan(1, 5, (minimum, maximum))[0]
+    intervals = [b - a for a, b in zip(offsets, offsets[1:])]
+    assert intervals[0] == pytest.approx(minimum)
+    assert all(a <= b + 1e-6 for a, b in zip(intervals, intervals[1:]))
+    assert intervals[-1] > minimum * 2
+    assert all(x <= maximum + 1e-6 for x in intervals)
+
+
+def test_burst_plan_interleaves_workers():
+    """
+    所有线程共用一条发送时刻序列，按顺序轮流分配
+    """
+    schedule = BurstPlanner.plan(3, 1, (0.3, 0.3))
+    merged = sorted((offset, worker) for worker, offsets in enumerate(schedule) for offset in offsets)
+    assert [worker for _, worker in merged[:6]] == [0, 1, 2, 0, 1, 2]
+    assert merged[1][0] == pytest.approx(0.1)
+
+
+@pytest.mark.parametrize("shares", [1, 2, 4, 6])
+def test_burst_plan_shares_keep_sequence(shares):
+    """
+    无论分成多少份，合并后都与不分份时的发送时刻序列相同，请求总数不变
+    """
+    single = sorted(sum(BurstPlanner.plan(2, 1, (0.1, 0.5)), []))
+    shared = BurstPlanner.plan(2, 1, (0.1, 0.5), shares=shares)
+    assert len(shared) == shares
+    assert sorted(sum(shared, [])) == single
+
+
+def test_burst_plan_minimum_interval():
+    """
+    最小间隔为 0 时使用 BURST_MIN_INTERVAL，不会无限密集地发送
+    """
+    offsets = BurstPlanner.plan(1, 1, (0, 0))[0]
+    assert len(offsets) == pytest.approx(1 / BURST_MIN_INTERVAL, abs=1)
+
+
+def test_burst_plan_zero_duration():
+    assert BurstPlanner.plan(3, 0, (0, 0.5)) == [[0.0], [], []]
+
+
+def test_burst_instants_skip_missed():
+    """
+    已经错过的发送时刻只保留最后一个
+    """
+    now = NtpTime.time()
+    instants = BurstInstants([0, 1, 2, 10], now - 2.5, now + 100)
+    assert next(instants) == pytest.approx(now - 0.5)
+    assert next(instants) == pytest.approx(now + 7.5)
+    with pytest.raises(StopIteration):
+        next(instants)
+
+
+def test_burst_instants_deadline_and_restart():
+    start = NtpTime.time() + 100
+    instants = BurstInstants([0, 1, 2], start, start + 1.5)
+    assert list(instants) == pytest.approx([start, start + 1])
+    instants.restart(start + 0.2)
+    assert list(instants) == pytest.approx([start + 0.2, start + 1.2])
+
+
+def test_wait_until():
+    error = wait_until(NtpTime.time() + 0.05)
+    assert 0 <= error < TIMING_TOLERANCE
+    assert wait_until(NtpTime.time() - 1) >= 1
+
+
+def test_async_wait_until_does_not_block_loop():
+    """
+    同一时刻的多个等待都能按时唤醒，等待期间事件循环仍能运行其他协程
+    """
+    ticks = []
+
+    async def ticker(deadline: float):
+        while NtpTime.time() < deadline:
+            ticks.append(NtpTime.time())
+            await asyncio.sleep(0)
+
+    async def main():
+        target = NtpTime.time() + 0.05
+        return await asyncio.gather(*[async_wait_until(target) for _ in range(10)], ticker(target + 0.01))
+
+    *errors, _ = asyncio.run(main())
+    assert all(-0.001 <= error < TIMING_TOLERANCE for error in errors)
+    # 忙等待会使 ticker 在触发时刻附近长时间无法运行
+    gaps = [b - a for a, b in zip(ticks, ticks[1:])]
+    assert max(gaps) < TIMING_TOLERANCE